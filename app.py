@@ -3,12 +3,15 @@ Flask 应用主文件
 负责应用初始化和配置
 """
 from flask import Flask
-from db import init_db, engine
+from db import init_db, upgrade_db, engine
 from sqlalchemy import inspect
 from services.model_loader import model_loader
 from services.invoice_service import InvoiceService
+from services.persist_spool import get_persist_spool, has_spooled_records
+from services.image_store import get_image_store
 from routes.api import init_api_routes
 from routes.invoice import invoice_bp
+from routes.report import report_bp
 from routes.web import web_bp
 from config import Config
 
@@ -31,11 +34,24 @@ def create_app():
     # 注册蓝图
     app.register_blueprint(web_bp)
     app.register_blueprint(invoice_bp)
+    app.register_blueprint(report_bp)
     
     # 初始化 API 路由（需要传入服务实例）
     api_bp = init_api_routes(invoice_service, app.config['ALLOWED_EXTENSIONS'])
     app.register_blueprint(api_bp)
     
+    # 写入队列中有上次未写入数据库的识别结果时，启动后台写入
+    if app.config['PERSIST_MODE'] == 'async' or has_spooled_records(app.config['PERSIST_SPOOL_DIR']):
+        get_persist_spool()
+    
+    # 后台压缩原图存储中的原图（多个进程只有一个在压缩）
+    if app.config['IMAGE_COMPACT_INTERVAL'] > 0:
+        get_image_store().start_compaction(
+            app.config['IMAGE_COMPACT_INTERVAL'],
+            min_age=app.config['IMAGE_COMPACT_MIN_AGE'],
+            jpeg_quality=app.config['IMAGE_COMPACT_JPEG_QUALITY']
+        )
+    
     return app
 
 
@@ -44,8 +60,11 @@ def check_and_init_db():
     inspector = inspect(engine)
     existing_tables = inspector.get_table_names()
     
-    # 检查必要的表是否存在（现在只有一个invoices表）
-    required_tables = ['invoices']
+    # 检查必要的表是否存在（发票表、工作队列表和汇总表）
+    required_tables = [
+        'invoices', 'invoice_tombstones', 'invoice_items', 'invoice_ocr', 'jobs', 'tasks',
+        'report_seller_monthly', 'report_buyer_monthly', 'report_tax_rate_monthly'
+    ]
     missing_tables = [table for table in required_tables if table not in existing_tables]
     
     if missing_tables:
@@ -57,6 +76,9 @@ def check_and_init_db():
         except Exception as e:
             print(f"❌ 数据库初始化失败: {e}")
             raise
+    
+    # 补充已有表中新增的列和索引
+    upgrade_db()
 
 
 # 创建应用实例
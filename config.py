@@ -9,7 +9,7 @@ class Config:
     """应用配置类"""
     # Flask 配置
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 限制上传文件大小为 16MB
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 限制上传文件大小，默认 16MB（上传压缩包时可调大）
     
     # Debug 配置
     # 可以通过环境变量 FLASK_DEBUG=1 或 DEBUG=1 来开启
@@ -18,10 +18,75 @@ class Config:
     # 文件上传配置
     UPLOAD_FOLDER = 'uploads'
     OUTPUT_FOLDER = 'output'
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'pdf', 'ofd'}
+    
+    # PDF 配置
+    PDF_TEXT_MIN_CHARS = int(os.getenv('PDF_TEXT_MIN_CHARS', 20))  # 文字层最少字符数，低于此值视为扫描件
+    PDF_DETECT_DPI = int(os.getenv('PDF_DETECT_DPI', 96))  # 有文字层时仅用于 YOLO 定位的渲染分辨率
+    PDF_OCR_DPI = int(os.getenv('PDF_OCR_DPI', 200))  # 扫描件 PDF 走 OCR 时的渲染分辨率
+    
+    # 批处理配置
+    BATCH_STATE_FOLDER = os.getenv('BATCH_STATE_FOLDER', 'output/batches')  # 批次状态记录目录（用于续传）
+    SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', 5))  # SSE 心跳间隔（秒），用于及时发现客户端断开
+    MANIFEST_PATH = os.getenv('MANIFEST_PATH', 'output/manifest.db')  # 增量处理的已处理文件清单
+    MANIFEST_USE_HASH = os.getenv('MANIFEST_USE_HASH', '0').lower() in ('1', 'true', 'yes', 'on')  # 清单是否比较文件内容哈希
+    ARCHIVE_MAX_MEMBER_SIZE = int(os.getenv('ARCHIVE_MAX_MEMBER_SIZE', 50 * 1024 * 1024))  # 压缩包中单个文件的最大字节数
+    
+    # 分布式工作队列配置
+    QUEUE_LEASE_SECONDS = int(os.getenv('QUEUE_LEASE_SECONDS', 300))  # 任务租约时长（秒），worker 崩溃后超过此时间任务被重新领取
+    QUEUE_MAX_ATTEMPTS = int(os.getenv('QUEUE_MAX_ATTEMPTS', 3))  # 任务最大尝试次数，超过后进入死信
+    QUEUE_RETRY_DELAY = int(os.getenv('QUEUE_RETRY_DELAY', 30))  # 首次重试延迟（秒），之后每次翻倍
+    QUEUE_POLL_INTERVAL = float(os.getenv('QUEUE_POLL_INTERVAL', 2))  # 队列为空时 worker 的轮询间隔（秒）
+    
+    # 发票列表配置
+    INVOICE_MAX_PER_PAGE = int(os.getenv('INVOICE_MAX_PER_PAGE', 100))  # 每页最大条数
+    INVOICE_COUNT_TTL = float(os.getenv('INVOICE_COUNT_TTL', 60))  # 发票总数缓存时间（秒），过期后在后台刷新
+    INVOICE_BATCH_MAX = int(os.getenv('INVOICE_BATCH_MAX', 500))  # 批量获取详情时一次最多查询的发票数
+    CHANGE_FEED_MAX_WAIT = float(os.getenv('CHANGE_FEED_MAX_WAIT', 30))  # 变更订阅长轮询的最长等待时间（秒）
+    CHANGE_FEED_SETTLE_SECONDS = float(os.getenv('CHANGE_FEED_SETTLE_SECONDS', 1))  # 只返回此时间之前的变更，避免漏读提交较晚的事务
+    
+    # 查询缓存配置
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')  # memory（进程内 LRU）、redis（多进程共享）或 none
+    CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')  # CACHE_BACKEND=redis 时的连接地址
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 60))  # 缓存条目有效时间（秒）
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))  # 进程内缓存的最大条目数
+    
+    # 写入队列配置
+    PERSIST_MODE = os.getenv('PERSIST_MODE', 'sync')  # sync：直接写入数据库（数据库不可用时改写入队列）；async：先写入本地队列，后台批量写入
+    PERSIST_SPOOL_DIR = os.getenv('PERSIST_SPOOL_DIR', 'output/spool')  # 本地写入队列目录
+    PERSIST_BATCH_SIZE = int(os.getenv('PERSIST_BATCH_SIZE', 50))  # 后台每批写入数据库的记录数
+    PERSIST_FSYNC = os.getenv('PERSIST_FSYNC', '1').lower() in ('1', 'true', 'yes', 'on')  # 追加到队列后是否 fsync
+    PERSIST_RETRY_DELAY = float(os.getenv('PERSIST_RETRY_DELAY', 1))  # 数据库不可用时的首次重试间隔（秒），之后每次翻倍
+    PERSIST_MAX_RETRY_DELAY = float(os.getenv('PERSIST_MAX_RETRY_DELAY', 60))  # 最大重试间隔（秒）
+    
+    # 识别结果文件配置
+    RESULT_SINK = os.getenv('RESULT_SINK', 'files')  # files：每张发票一个 JSON 文件；shards：追加到轮转的 JSONL 分片并建立索引
+    RESULT_SINK_DIR = os.getenv('RESULT_SINK_DIR', 'output')  # 识别结果目录（分片保存在其下的 shards 子目录）
+    RESULT_SHARD_MAX_MB = int(os.getenv('RESULT_SHARD_MAX_MB', 256))  # 单个分片的最大大小（MB），超过后轮转
+    RESULT_SHARD_MAX_SECONDS = int(os.getenv('RESULT_SHARD_MAX_SECONDS', 3600))  # 单个分片的最长写入时间（秒），超过后轮转
+    RESULT_FSYNC_INTERVAL = float(os.getenv('RESULT_FSYNC_INTERVAL', 1))  # 分片批量 fsync 的间隔（秒），0 表示每条记录 fsync
+    
+    # 原图存储配置
+    IMAGE_STORE_DIR = os.getenv('IMAGE_STORE_DIR', 'uploads/objects')  # 按内容哈希保存上传原图的目录
+    IMAGE_COMPACT_INTERVAL = int(os.getenv('IMAGE_COMPACT_INTERVAL', 3600))  # 后台压缩原图的间隔（秒），0 表示不在服务进程中压缩
+    IMAGE_COMPACT_MIN_AGE = int(os.getenv('IMAGE_COMPACT_MIN_AGE', 3600))  # 只压缩保存超过此时间（秒）的原图
+    IMAGE_COMPACT_JPEG_QUALITY = int(os.getenv('IMAGE_COMPACT_JPEG_QUALITY', 0))  # JPEG 原图转换为 WebP 的质量（建议 90 以上），0 表示不转换
+    
+    # 原始识别结果配置
+    STORE_RAW_OCR = os.getenv('STORE_RAW_OCR', '1').lower() in ('1', 'true', 'yes', 'on')  # 保存每个字段的 OCR 文本行和坐标，供重新提取使用
+    
+    # 二维码配置
+    QR_ENABLED = os.getenv('QR_ENABLED', '1').lower() in ('1', 'true', 'yes', 'on')  # 识别前先解码发票二维码
+    QR_CROSS_CHECK = os.getenv('QR_CROSS_CHECK', '0').lower() in ('1', 'true', 'yes', 'on')  # 仍然 OCR 二维码字段，用于核对
     
     # 模型配置
     MODEL_PATH = os.getenv('MODEL_PATH', './best.pt')
+    DETECT_IMGSZ = int(os.getenv('DETECT_IMGSZ', 640))  # 检测输入边长（自适应模式下为目标面积 DETECT_IMGSZ x DETECT_IMGSZ）
+    DETECT_ADAPTIVE = os.getenv('DETECT_ADAPTIVE', '0').lower() in ('1', 'true', 'yes', 'on')  # 按宽高比选择矩形输入尺寸（固定尺寸的导出模型减少填充；.pt 模型相当于提高分辨率，检测更慢）
+    DETECT_ASPECT_RATIOS = os.getenv('DETECT_ASPECT_RATIOS', '1,1.41,1.75,2')  # 自适应模式的宽高比桶（横向、纵向各一个）
+    DETECT_BUCKET_MODEL_DIR = os.getenv('DETECT_BUCKET_MODEL_DIR', '')  # 按桶导出的固定尺寸模型目录（见 utils/export_buckets.py）
+    BOX_CONSOLIDATION = os.getenv('BOX_CONSOLIDATION', '1').lower() in ('1', 'true', 'yes', 'on')  # OCR 前合并同类重叠框、表头字段只保留一个框
+    BOX_MERGE_OVERLAP = float(os.getenv('BOX_MERGE_OVERLAP', 0.3))  # 同类框交集占较小框面积的比例达到此值时合并
     
     @staticmethod
     def init_app(app):
@@ -29,4 +94,5 @@ class Config:
         # 创建必要的目录
         Path(Config.UPLOAD_FOLDER).mkdir(exist_ok=True)
         Path(Config.OUTPUT_FOLDER).mkdir(exist_ok=True)
+        Path(Config.BATCH_STATE_FOLDER).mkdir(parents=True, exist_ok=True)
 
@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 # 加载 .env 文件中的环境变量
@@ -19,16 +20,79 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
-# 构建数据库连接URL
-DATABASE_URL = f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset={DB_CONFIG['charset']}"
+# 存储后端：mysql（默认）或 sqlite（单机、边缘节点和测试环境，无需数据库服务）
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql').lower()
+
+# SQLite 配置
+SQLITE_CONFIG = {
+    'path': os.getenv('SQLITE_PATH', 'output/invoices.db'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),  # WAL 模式下 NORMAL 只在断电时可能丢失最近的事务
+    'cache_mb': int(os.getenv('SQLITE_CACHE_MB', 64)),         # 每个连接的页缓存
+    'mmap_mb': int(os.getenv('SQLITE_MMAP_MB', 256)),          # 内存映射读取的大小
+    'busy_timeout_ms': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 30000)),  # 等待其他连接释放写锁的时间
+}
+
+
+def build_database_url():
+    """
+    构建数据库连接URL
+    
+    可通过 DATABASE_URL 环境变量直接指定（优先级最高），否则按 DB_BACKEND 选择 MySQL 或 SQLite。
+    """
+    if os.getenv('DATABASE_URL'):
+        return os.getenv('DATABASE_URL')
+    if DB_BACKEND == 'sqlite':
+        path = Path(SQLITE_CONFIG['path'])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return f"sqlite:///{path}"
+    if DB_BACKEND != 'mysql':
+        raise ValueError(f"不支持的存储后端: {DB_BACKEND}（可选 mysql、sqlite）")
+    return f"mysql+pymysql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset={DB_CONFIG['charset']}"
+
+
+def create_db_engine(url):
+    """
+    创建数据库引擎
+    
+    SQLite 连接启用 WAL（读写互不阻塞）并调整同步级别、缓存和内存映射，见 configure_sqlite_connection。
+    """
+    if url.startswith('sqlite'):
+        sqlite_engine = create_engine(
+            url,
+            connect_args={'check_same_thread': False, 'timeout': SQLITE_CONFIG['busy_timeout_ms'] / 1000},
+            echo=False
+        )
+        event.listen(sqlite_engine, 'connect', configure_sqlite_connection)
+        return sqlite_engine
+    return create_engine(
+        url,
+        pool_pre_ping=True,  # 连接前检查连接是否有效
+        pool_recycle=3600,   # 连接回收时间（秒）
+        echo=False           # 设置为 True 可以打印 SQL 语句，用于调试
+    )
+
+
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """为每个新的 SQLite 连接设置 PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_CONFIG['synchronous']}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CONFIG['cache_mb'] * 1024}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_CONFIG['mmap_mb'] * 1024 * 1024}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_CONFIG['busy_timeout_ms']}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        # 与 MySQL InnoDB 一致，检查外键
+        cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+
+
+# 构建数据库连接URL（可通过 DATABASE_URL 环境变量直接指定，如测试时使用 sqlite:///test.db）
+DATABASE_URL = build_database_url()
 
 # 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,  # 连接前检查连接是否有效
-    pool_recycle=3600,   # 连接回收时间（秒）
-    echo=False           # 设置为 True 可以打印 SQL 语句，用于调试
-)
+engine = create_db_engine(DATABASE_URL)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
@@ -49,9 +113,90 @@ def init_db():
     # 导入所有模型以确保表被注册
     import model
     Base.metadata.create_all(bind=engine)
+    init_full_text_index()
     print("数据库表创建成功！")
 
 
+def init_full_text_index(bind=None):
+    """
+    SQLite 下创建发票全文索引（FTS5 trigram 分词的外部内容表），并用触发器与 invoices.search_text 保持同步
+    
+    MySQL 使用 model.Invoice 中定义的 ngram FULLTEXT 索引，不需要这一步。
+    
+    Args:
+        bind: 数据库引擎，默认为本地数据库
+    """
+    bind = bind or engine
+    if bind.dialect.name != 'sqlite' or inspect(bind).has_table('invoices_fts'):
+        return
+    
+    statements = [
+        """CREATE VIRTUAL TABLE invoices_fts USING fts5(
+            search_text, content='invoices', content_rowid='id', tokenize='trigram'
+        )""",
+        """CREATE TRIGGER invoices_fts_insert AFTER INSERT ON invoices BEGIN
+            INSERT INTO invoices_fts(rowid, search_text) VALUES (new.id, new.search_text);
+        END""",
+        """CREATE TRIGGER invoices_fts_delete AFTER DELETE ON invoices BEGIN
+            INSERT INTO invoices_fts(invoices_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        END""",
+        """CREATE TRIGGER invoices_fts_update AFTER UPDATE OF search_text ON invoices BEGIN
+            INSERT INTO invoices_fts(invoices_fts, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+            INSERT INTO invoices_fts(rowid, search_text) VALUES (new.id, new.search_text);
+        END""",
+        # 为已有记录建立索引
+        "INSERT INTO invoices_fts(invoices_fts) VALUES ('rebuild')",
+    ]
+    try:
+        with bind.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+        print("✅ 已创建全文索引: invoices_fts")
+    except Exception as e:
+        # SQLite 3.34 之前不支持 trigram 分词，全文检索退化为 LIKE 查询
+        print(f"⚠️ 创建全文索引失败，全文检索将使用 LIKE 查询: {e}")
+
+
+def upgrade_db(bind=None):
+    """
+    同步已有表的结构：补充模型中新增的列和索引
+    
+    create_all 只会创建缺失的表，已有表新增的列和索引需要在这里补充。
+    
+    Args:
+        bind: 数据库引擎，默认为本地数据库（同步到上游时传入上游数据库的引擎）
+    """
+    import model
+    bind = bind or engine
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=bind.dialect)
+                with bind.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"✅ 已添加列: {table.name}.{column.name}")
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                # 仅适用于其他数据库的索引（ddl_if）会被跳过
+                index.create(bind=bind)
+                if index.name in {i['name'] for i in inspect(bind).get_indexes(table.name)}:
+                    print(f"✅ 已创建索引: {index.name}")
+    
+    init_full_text_index(bind)
+    
+    if bind.dialect.name == 'sqlite':
+        # 更新查询规划器的统计信息（只分析需要的表，开销很小）
+        with bind.begin() as conn:
+            conn.execute(text("PRAGMA optimize"))
+
+
 def drop_db():
     """删除所有表（谨慎使用）"""
     # 导入所有模型以确保表被注册
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Date, Numeric, Text, Boolean, ForeignKey, Index
 from datetime import datetime
 from db import Base
 
@@ -6,6 +6,23 @@ from db import Base
 class Invoice(Base):
     """发票表 - 合并了原Invoice和Detection表的所有字段"""
     __tablename__ = 'invoices'
+    __table_args__ = (
+        # 列表按 (created_at, id) 倒序做游标分页
+        Index('ix_invoices_created_at_id', 'created_at', 'id'),
+        # 变更订阅按 (updated_at, id) 递增读取
+        Index('ix_invoices_updated_at_id', 'updated_at', 'id'),
+        Index('ix_invoices_invoice_number_key', 'invoice_number_key'),
+        Index('ix_invoices_invoice_code_key', 'invoice_code_key'),
+        Index('ix_invoices_invoice_date_value', 'invoice_date_value'),
+        Index('ix_invoices_seller_tax_id_key', 'seller_tax_id_key'),
+        Index('ix_invoices_buyer_tax_id_key', 'buyer_tax_id_key'),
+        Index('ix_invoices_total_amount_value', 'total_amount_value'),
+        # 按原图查找引用它的发票
+        Index('ix_invoices_image_sha256', 'image_sha256'),
+        # 全文索引（MySQL ngram 分词，支持中文和 "iPhone13" 这类部分匹配）；SQLite 使用 FTS5 虚拟表，见 db.init_full_text_index
+        Index('ix_invoices_search_text', 'search_text',
+              mysql_prefix='FULLTEXT', mysql_with_parser='ngram').ddl_if(dialect='mysql'),
+    )
     
     # 主键和基础字段
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -45,6 +62,152 @@ class Invoice(Base):
     total_amount = Column(JSON, nullable=True, comment='价税合计')
     check_code = Column(JSON, nullable=True, comment='校验码')
     
+    # 查询字段：由上面的 JSON 字段规范化得到的类型化副本，带索引，保存时自动填充
+    invoice_number_key = Column(String(32), nullable=True, comment='发票号码（查询用）')
+    invoice_code_key = Column(String(16), nullable=True, comment='发票代码（查询用）')
+    invoice_date_value = Column(Date, nullable=True, comment='开票日期（查询用）')
+    seller_tax_id_key = Column(String(32), nullable=True, comment='销售方纳税人识别号（查询用）')
+    buyer_tax_id_key = Column(String(32), nullable=True, comment='购买方纳税人识别号（查询用）')
+    total_amount_value = Column(Numeric(14, 2), nullable=True, comment='价税合计金额（查询用）')
+    search_text = Column(Text, nullable=True, comment='全文检索文本（销售方、购买方名称和项目名称）')
+    report_applied = Column(Boolean, nullable=True, default=False, comment='是否已计入汇总表（更新时据此冲销旧值）')
+    image_sha256 = Column(String(64), nullable=True, comment='原图内容哈希（原图存储中的位置，见 services/image_store.py）')
+    
     def __repr__(self):
         return f"<Invoice(id={self.id}, image_name='{self.image_name}', detection_count={self.detection_count})>"
 
+
+
+class InvoiceTombstone(Base):
+    """发票删除记录 - 供变更订阅通知下游删除"""
+    __tablename__ = 'invoice_tombstones'
+    __table_args__ = (
+        Index('ix_invoice_tombstones_deleted_at_id', 'deleted_at', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    invoice_id = Column(Integer, nullable=False, comment='被删除的发票ID')
+    image_name = Column(String(255), nullable=False, comment='图片名称')
+    deleted_at = Column(DateTime, default=datetime.now, nullable=False, comment='删除时间')
+    
+    def __repr__(self):
+        return f"<InvoiceTombstone(invoice_id={self.invoice_id}, image_name='{self.image_name}')>"
+
+
+class InvoiceItem(Base):
+    """发票明细表 - 发票上按列保存的明细字段按行拆分，每个明细行一条记录，供明细级查询使用"""
+    __tablename__ = 'invoice_items'
+    __table_args__ = (
+        Index('ix_invoice_items_invoice_id_line_no', 'invoice_id', 'line_no'),
+        # "包含某商品且金额大于 Y" 这类查询
+        Index('ix_invoice_items_item_name_amount', 'item_name', 'amount'),
+        Index('ix_invoice_items_item_category_amount', 'item_category', 'amount'),
+        Index('ix_invoice_items_amount', 'amount'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    invoice_id = Column(Integer, ForeignKey('invoices.id'), nullable=False, comment='发票ID')
+    line_no = Column(Integer, nullable=False, comment='明细行号（从 1 开始）')
+    item_category = Column(String(64), nullable=True, comment='商品和服务税收分类简称（项目名称中 *...* 部分）')
+    item_name = Column(String(255), nullable=True, comment='项目名称（不含分类简称）')
+    unit = Column(String(32), nullable=True, comment='单位')
+    quantity = Column(Numeric(18, 6), nullable=True, comment='数量')
+    unit_price = Column(Numeric(20, 8), nullable=True, comment='单价')
+    amount = Column(Numeric(14, 2), nullable=True, comment='金额')
+    tax_rate = Column(String(16), nullable=True, comment='税率（百分比，如 13）')
+    tax_amount = Column(Numeric(14, 2), nullable=True, comment='税额')
+    
+    def __repr__(self):
+        return f"<InvoiceItem(invoice_id={self.invoice_id}, line_no={self.line_no}, item_name='{self.item_name}')>"
+
+
+class InvoiceOcr(Base):
+    """发票原始识别结果 - 每个字段的 OCR 文本行、置信度和坐标，修改解析规则后可据此重新提取，无需重新推理"""
+    __tablename__ = 'invoice_ocr'
+    
+    invoice_id = Column(Integer, ForeignKey('invoices.id'), primary_key=True, comment='发票ID')
+    source = Column(String(16), nullable=False, default='ocr', comment='文字来源: ocr（图像识别）或 pdf_text（PDF 文字层）')
+    fields = Column(JSON, nullable=False, comment='各字段的原始识别结果（class_name、confidence、bbox、texts、scores、boxes、qr）')
+    created_at = Column(DateTime, default=datetime.now, comment='创建时间')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
+    
+    def __repr__(self):
+        return f"<InvoiceOcr(invoice_id={self.invoice_id}, source='{self.source}', fields={len(self.fields or [])})>"
+
+
+class Job(Base):
+    """识别作业表 - 一次批量识别请求，拆分为多个任务由各节点的 worker 领取"""
+    __tablename__ = 'jobs'
+    
+    id = Column(String(32), primary_key=True, comment='作业ID')
+    name = Column(String(255), nullable=True, comment='作业名称')
+    status = Column(String(16), nullable=False, default='pending', comment='状态: pending/running/completed')
+    options = Column(JSON, nullable=True, comment='处理选项（save_json、save_db 等）')
+    total_tasks = Column(Integer, nullable=False, default=0, comment='任务总数')
+    created_at = Column(DateTime, default=datetime.now, comment='创建时间')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
+    finished_at = Column(DateTime, nullable=True, comment='完成时间')
+    
+    def __repr__(self):
+        return f"<Job(id='{self.id}', status='{self.status}', total_tasks={self.total_tasks})>"
+
+
+class Task(Base):
+    """识别任务表 - 每个文件一个任务，worker 通过租约领取"""
+    __tablename__ = 'tasks'
+    __table_args__ = (
+        Index('ix_tasks_claim', 'status', 'available_at'),
+        Index('ix_tasks_lease', 'status', 'lease_expires_at'),
+        Index('ix_tasks_job_status', 'job_id', 'status'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(32), ForeignKey('jobs.id'), nullable=False, comment='作业ID')
+    file_path = Column(String(1024), nullable=False, comment='文件路径（各节点均可访问的共享路径）')
+    status = Column(String(16), nullable=False, default='pending', comment='状态: pending/running/success/dead')
+    attempts = Column(Integer, nullable=False, default=0, comment='已尝试次数')
+    max_attempts = Column(Integer, nullable=False, default=3, comment='最大尝试次数，超过后进入死信')
+    available_at = Column(DateTime, default=datetime.now, comment='可领取时间（失败重试时延后）')
+    worker_id = Column(String(128), nullable=True, comment='持有租约的 worker')
+    lease_expires_at = Column(DateTime, nullable=True, comment='租约到期时间')
+    heartbeat_at = Column(DateTime, nullable=True, comment='最近心跳时间')
+    last_error = Column(Text, nullable=True, comment='最近一次失败原因')
+    result = Column(JSON, nullable=True, comment='处理结果（image_name、json_path）')
+    created_at = Column(DateTime, default=datetime.now, comment='创建时间')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
+    
+    def __repr__(self):
+        return f"<Task(id={self.id}, job_id='{self.job_id}', status='{self.status}', attempts={self.attempts})>"
+
+
+class ReportMeasures:
+    """汇总表的公共度量字段"""
+    month = Column(String(7), primary_key=True, comment='开票月份 YYYY-MM，无法识别日期时为空字符串')
+    invoice_count = Column(Integer, nullable=False, default=0, comment='发票数')
+    amount_sum = Column(Numeric(16, 2), nullable=False, default=0, comment='金额合计')
+    tax_amount_sum = Column(Numeric(16, 2), nullable=False, default=0, comment='税额合计')
+    total_amount_sum = Column(Numeric(16, 2), nullable=False, default=0, comment='价税合计')
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now, comment='更新时间')
+
+
+class SellerMonthlyReport(ReportMeasures, Base):
+    """按销售方、月份汇总 - 随发票写入增量维护"""
+    __tablename__ = 'report_seller_monthly'
+    
+    seller_tax_id = Column(String(32), primary_key=True, comment='销售方纳税人识别号，无法识别时为空字符串')
+    name = Column(String(255), nullable=True, comment='最近一次识别的销售方名称')
+
+
+class BuyerMonthlyReport(ReportMeasures, Base):
+    """按购买方、月份汇总 - 随发票写入增量维护"""
+    __tablename__ = 'report_buyer_monthly'
+    
+    buyer_tax_id = Column(String(32), primary_key=True, comment='购买方纳税人识别号，无法识别时为空字符串')
+    name = Column(String(255), nullable=True, comment='最近一次识别的购买方名称')
+
+
+class TaxRateMonthlyReport(ReportMeasures, Base):
+    """按税率、月份汇总 - 发票中每个税率的明细分别计入，invoice_count 为含该税率的发票数"""
+    __tablename__ = 'report_tax_rate_monthly'
+    
+    tax_rate = Column(String(16), primary_key=True, comment='税率（如 13 表示 13%），无法识别时为空字符串')
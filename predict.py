@@ -1,5 +1,4 @@
 # predict.py
-import json
 import os
 from pathlib import Path
 
@@ -7,7 +6,11 @@ from ultralytics import YOLO
 import cv2
 import numpy as np
 from paddleocr import PaddleOCR
-from utils import extract_text_from_bbox, save_to_database
+from utils import extract_text_from_bbox, save_to_database, ocr_field_record
+from config import Config
+from services.result_sink import get_result_sink
+from services.detect_shapes import create_shape_selector
+from services.box_consolidation import consolidate_boxes
 
 
 def main(img_path, model, ocr):
@@ -23,65 +26,77 @@ def main(img_path, model, ocr):
     if not os.path.exists(img_path):
         raise FileNotFoundError(f"图像文件不存在: {img_path}")
     
-    # 对图像进行预测
-    results = model.predict(
-        source=img_path,
+    # 读取原始图像用于检测和OCR
+    original_image = cv2.imread(img_path)
+    if original_image is None:
+        raise ValueError(f"无法读取图像文件: {img_path}")
+
+    # 对图像进行预测（DETECT_ADAPTIVE 开启时按宽高比选择输入尺寸）
+    results = create_shape_selector(model).predict(
+        original_image,
         save=False,
         show=False,
         conf=0.1,
         iou=0.1,
-        imgsz=640,
     )
 
-    # 读取原始图像用于OCR
-    original_image = cv2.imread(img_path)
-    if original_image is None:
-        raise ValueError(f"无法读取图像文件: {img_path}")
-
     detection_info = {
         "image_name": Path(img_path).stem,
         "检测项数": 0,
         "detections": []
     }
+    ocr_fields = []
 
-    # 打印预测结果并进行OCR识别
+    boxes = []
     for result in results:
         if result.boxes:
-            for i, box in enumerate(result.boxes):
-                class_name = result.names[int(box.cls)]
-                confidence = box.conf.item()
-                bbox_coords = box.xyxy.tolist()[0]
-
-                extracted_text = extract_text_from_bbox(ocr, original_image, bbox_coords, class_name)
-
-                # 修复 None 检查逻辑
-                if extracted_text is None or (isinstance(extracted_text, list) and len(extracted_text) == 0):
-                    extracted_text = None
-
-                if class_name not in ["buyer", "seller"]:
-                    detection = {
-                        "class_name": class_name,
-                        "confidence": confidence,
-                        "extracted_text": extracted_text,
-                    }
-                    detection_info["detections"].append(detection)
-                    detection_info["检测项数"] += 1
-
-    # 确保输出目录存在
-    output_dir = Path("output")
-    output_dir.mkdir(exist_ok=True)
-    
-    # 保存 JSON 文件
-    output_path = output_dir / f"{detection_info['image_name']}.json"
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(detection_info, f, ensure_ascii=False, indent=4)
+            for box in result.boxes:
+                boxes.append((result.names[int(box.cls)], box.conf.item(), box.xyxy.tolist()[0]))
+
+    # 合并重叠的同类框，跳过 buyer、seller 区域框
+    boxes, consolidation = consolidate_boxes(boxes, Config.BOX_MERGE_OVERLAP, merge=Config.BOX_CONSOLIDATION)
+    detection_info["box_consolidation"] = consolidation
+    print(f"✂️ 检测框合并: {consolidation['boxes']} 个框 -> {len(boxes)} 个，减少 {consolidation['ocr_calls_saved']} 次 OCR")
+
+    # 进行OCR识别
+    for class_name, confidence, bbox_coords in boxes:
+        raw = {}
+        extracted_text = extract_text_from_bbox(ocr, original_image, bbox_coords, class_name, raw)
+
+        # 修复 None 检查逻辑
+        if extracted_text is None or (isinstance(extracted_text, list) and len(extracted_text) == 0):
+            extracted_text = None
+
+        detection = {
+            "class_name": class_name,
+            "confidence": confidence,
+            "extracted_text": extracted_text,
+        }
+        detection_info["detections"].append(detection)
+        detection_info["检测项数"] += 1
+        ocr_fields.append(ocr_field_record(class_name, confidence, bbox_coords, raw))
+
+    # 保存识别结果文件（RESULT_SINK 配置）
+    output_path = get_result_sink().write(detection_info)
     print(f"已保存结果到 {output_path}")
     
     # 保存到数据库
-    save_to_database(detection_info)
+    save_to_database(detection_info, ocr_fields if Config.STORE_RAW_OCR else None)
 
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='发票识别')
+    parser.add_argument('image', nargs='?', default='invoice_00001.jpg', help='图像文件路径')
+    parser.add_argument('--folder', type=str, default=None, help='批量处理的文件夹路径')
+    parser.add_argument('--incremental', '--resume', action='store_true',
+                        help='增量处理：跳过处理清单中已处理且未变化的文件，中断后从断点继续')
+    parser.add_argument('--hash', action=argparse.BooleanOptionalAction, default=Config.MANIFEST_USE_HASH,
+                        help='增量处理时比较文件内容哈希（默认取 MANIFEST_USE_HASH）')
+    parser.add_argument('--manifest', type=str, default=Config.MANIFEST_PATH, help='处理清单文件路径')
+    args = parser.parse_args()
+    
     # 初始化PaddleOCR
     ocr = PaddleOCR(
         ocr_version="PP-OCRv5",
@@ -99,8 +114,26 @@ if __name__ == '__main__':
         raise FileNotFoundError(f"模型文件不存在: {model_path}")
     model = YOLO(model_path)  # 使用训练好的权重文件
 
-    # 处理图像
-    img_path = "invoice_00001.jpg"
-    main(img_path, model, ocr)
+    if args.folder:
+        from services.invoice_service import InvoiceService
+        from services.manifest import ProcessingManifest
+        
+        service = InvoiceService(yolo_model=model, ocr_model=ocr)
+        manifest = ProcessingManifest(args.manifest, use_hash=args.hash) if args.incremental else None
+        try:
+            results = service.process_folder(
+                args.folder,
+                progress_callback=lambda current, total, path, status, *_: print(f"[{current}/{total}] {status}: {path}"),
+                manifest=manifest
+            )
+        finally:
+            if manifest is not None:
+                manifest.close()
+        skipped = sum(1 for r in results if r.get('skipped'))
+        failed = sum(1 for r in results if not r['success'])
+        print(f"✅ 处理完成：共 {len(results)} 个文件，跳过 {skipped} 个，失败 {failed} 个")
+    else:
+        # 处理图像
+        main(args.image, model, ocr)
 
 
@@ -1,16 +1,42 @@
 """
 API 路由 - 发票识别相关接口
 """
-from flask import Blueprint, request, jsonify, Response, stream_with_context
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from pathlib import Path
 import json
+import queue
+import shutil
+import tempfile
+import threading
 import time
 from services.invoice_service import InvoiceService
+from services.batch_runner import BatchRunner, BatchTracker
+from services.multipart_stream import iter_multipart_stream
+from services.archive_reader import ArchiveMember, is_archive, count_archive_images, iter_archive_images
+from services.manifest import ProcessingManifest
+from services.file_scanner import iter_invoice_files, relative_image_name
+from services.work_queue import WorkQueue
+from services.persist_spool import get_persist_spool
+from services.result_sink import get_result_sink
+from services.image_store import get_image_store
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 
+def _as_bool(value, default=False):
+    """解析 JSON 或表单中的布尔参数"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def _sse(payload):
+    """将事件格式化为 SSE 消息"""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
 def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
     """
     初始化 API 路由
@@ -25,6 +51,59 @@ def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in allowed_extensions
     
+    def open_manifest(data):
+        """
+        根据请求参数打开处理清单
+        
+        Args:
+            data: JSON 请求体，incremental（或 resume）为真时启用增量处理，content_hash 控制是否比较内容哈希
+            
+        Returns:
+            ProcessingManifest: 未启用增量处理时返回 None
+        """
+        if not _as_bool(data.get('incremental', data.get('resume'))):
+            return None
+        return ProcessingManifest(
+            current_app.config['MANIFEST_PATH'],
+            use_hash=_as_bool(data.get('content_hash'), current_app.config['MANIFEST_USE_HASH'])
+        )
+    
+    def get_work_queue():
+        """根据应用配置创建工作队列"""
+        return WorkQueue(
+            lease_seconds=current_app.config['QUEUE_LEASE_SECONDS'],
+            max_attempts=current_app.config['QUEUE_MAX_ATTEMPTS'],
+            retry_delay=current_app.config['QUEUE_RETRY_DELAY']
+        )
+    
+    def read_archive(archive_path, filename, max_member_size, skip=None):
+        """逐个读取保存在磁盘上的压缩包中的图像（在后台线程中迭代，读取结束后关闭文件）"""
+        with open(archive_path, 'rb') as f:
+            yield from iter_archive_images(f, filename, allowed_file, max_member_size=max_member_size, skip=skip)
+    
+    def scan_with_progress(paths, manifest, get_runner):
+        """
+        包装惰性扫描的文件路径：跳过清单中已处理的文件，扫描结束后通知总数
+        
+        Args:
+            paths: 文件路径迭代器
+            manifest: ProcessingManifest 实例或 None
+            get_runner: 返回 BatchRunner 的函数（扫描在运行器线程中进行）
+        """
+        found = skipped = 0
+        for path in paths:
+            found += 1
+            if manifest is not None and manifest.is_processed(path):
+                skipped += 1
+                continue
+            yield path
+        
+        runner = get_runner()
+        runner.total = found - skipped
+        runner.emit({'type': 'scan_complete', 'found': found, 'skipped': skipped})
+        if found == 0:
+            runner.emit({'type': 'error', 'message': '文件夹中没有找到图像文件'})
+    
     @api_bp.route('/health', methods=['GET'])
     def health_check():
         """健康检查接口"""
@@ -57,17 +136,14 @@ def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
                 if not files or all(f.filename == '' for f in files):
                     return jsonify({'error': '未选择文件'}), 400
                 
-                # 保存所有文件并处理
-                upload_dir = Path("uploads")
-                upload_dir.mkdir(exist_ok=True)
+                # 按内容哈希保存所有文件并处理
+                image_store = get_image_store()
                 
                 file_paths = []
                 for file in files:
                     if file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        file_path = upload_dir / filename
-                        file.save(str(file_path))
-                        file_paths.append(str(file_path))
+                        file_path, _ = image_store.put_stream(file.stream, file.filename)
+                        file_paths.append(file_path)
                 
                 if not file_paths:
                     return jsonify({'error': '没有有效的图像文件'}), 400
@@ -111,17 +187,27 @@ def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
                 # 处理文件夹
                 if 'folder_path' in data:
                     folder_path = data['folder_path']
-                    results = invoice_service.process_folder(
-                        folder_path,
-                        save_json=save_json,
-                        save_db=save_db
-                    )
+                    manifest = open_manifest(data)
+                    try:
+                        results = invoice_service.process_folder(
+                            folder_path,
+                            save_json=save_json,
+                            save_db=save_db,
+                            manifest=manifest,
+                            recursive=_as_bool(data.get('recursive'), True),
+                            include=data.get('include'),
+                            exclude=data.get('exclude')
+                        )
+                    finally:
+                        if manifest is not None:
+                            manifest.close()
                     
                     return jsonify({
                         'success': True,
                         'total': len(results),
                         'success_count': sum(1 for r in results if r['success']),
                         'failed_count': sum(1 for r in results if not r['success']),
+                        'skipped_count': sum(1 for r in results if r.get('skipped')),
                         'data': results
                     }), 200
                 
@@ -131,17 +217,24 @@ def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
                     if not isinstance(image_paths, list):
                         return jsonify({'error': 'image_paths 必须是数组'}), 400
                     
-                    results = invoice_service.process_batch(
-                        image_paths,
-                        save_json=save_json,
-                        save_db=save_db
-                    )
+                    manifest = open_manifest(data)
+                    try:
+                        results = invoice_service.process_batch(
+                            image_paths,
+                            save_json=save_json,
+                            save_db=save_db,
+                            manifest=manifest
+                        )
+                    finally:
+                        if manifest is not None:
+                            manifest.close()
                     
                     return jsonify({
                         'success': True,
                         'total': len(results),
                         'success_count': sum(1 for r in results if r['success']),
                         'failed_count': sum(1 for r in results if not r['success']),
+                        'skipped_count': sum(1 for r in results if r.get('skipped')),
                         'data': results
                     }), 200
                 
@@ -172,6 +265,16 @@ def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
         except Exception as e:
             return jsonify({'error': f'处理失败: {str(e)}'}), 500
     
+    def run_with_events(runner):
+        """启动运行器，并将其进度事件转换为 SSE 消息"""
+        runner.start()
+        for event in runner.events():
+            if event['type'] == 'heartbeat':
+                # SSE 注释行，客户端忽略；写入失败即说明客户端已断开
+                yield ": heartbeat\n\n"
+            else:
+                yield _sse(event)
+    
     @api_bp.route('/predict/stream', methods=['POST'])
     def predict_stream():
         """
@@ -179,11 +282,28 @@ def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
         使用 Server-Sent Events (SSE) 实时推送处理进度
         
         支持：
-        1. 多文件上传：使用 multipart/form-data，字段名为 'files[]'
-        2. 文件路径列表：使用 JSON 请求，字段名为 'image_paths'
-        3. 文件夹路径：使用 JSON 请求，字段名为 'folder_path'
+        1. 压缩包上传：使用 multipart/form-data，字段名为 'archive'（ZIP/TAR），成员不解压到磁盘
+        2. 多文件上传：使用 multipart/form-data，字段名为 'files[]'
+        3. 文件路径列表：使用 JSON 请求，字段名为 'image_paths'
+        4. 文件夹路径：使用 JSON 请求，字段名为 'folder_path'
+        5. 续传批次：使用 JSON 请求，字段名为 'resume_batch_id'
+        
+        JSON 请求可传 incremental=true 启用增量处理：跳过处理清单中已成功且未变化的文件。
+        folder_path 默认递归遍历子目录（recursive=false 关闭），可用 include/exclude glob 模式过滤；
+        目录边扫描边处理，扫描结束前进度消息中的 total 为 null，扫描结束时发送 scan_complete 消息。
+        
+        识别在后台线程中进行，等待期间定期发送心跳注释。客户端断开后，
+        剩余文件（包括当前文件中尚未执行的 OCR）会被取消，已完成的文件
+        记录在批次状态中，可通过 resume_batch_id 继续处理。
+        上传的压缩包保存在原图存储中，续传时从中重新读取尚未成功的成员。
         """
+        state_dir = current_app.config['BATCH_STATE_FOLDER']
+        heartbeat_interval = current_app.config['SSE_HEARTBEAT_INTERVAL']
+        max_member_size = current_app.config['ARCHIVE_MAX_MEMBER_SIZE']
+        
         def generate():
+            runner = None
+            manifest = None
             try:
                 save_json = request.form.get('save_json', request.json.get('save_json', True) if request.is_json else 'true')
                 save_db = request.form.get('save_db', request.json.get('save_db', True) if request.is_json else 'true')
@@ -191,103 +311,382 @@ def init_api_routes(invoice_service: InvoiceService, allowed_extensions):
                 save_db = str(save_db).lower() == 'true' if isinstance(save_db, str) else bool(save_db)
                 
                 file_paths = []
-                results = []
+                sources = None
+                total = None
+                tracker = None
                 
-                # 方式1：多文件上传
-                if 'files[]' in request.files:
+                # 方式1：压缩包上传（ZIP/TAR），成员直接读入内存处理
+                if 'archive' in request.files:
+                    archive = request.files['archive']
+                    if not archive.filename or not is_archive(archive.filename):
+                        yield _sse({'type': 'error', 'message': '不支持的压缩包格式'})
+                        return
+                    
+                    # 压缩包保存到原图存储，续传时重新读取尚未成功的成员
+                    archive_path, _ = get_image_store().put_stream(archive.stream, archive.filename)
+                    with open(archive_path, 'rb') as f:
+                        total = count_archive_images(f, archive.filename, allowed_file,
+                                                     max_member_size=max_member_size)
+                    if total == 0:
+                        yield _sse({'type': 'error', 'message': '压缩包中没有找到图像文件'})
+                        return
+                    sources = read_archive(archive_path, archive.filename, max_member_size)
+                    tracker = BatchTracker(state_dir=state_dir)
+                    tracker.set_meta(archive=archive.filename, archive_path=archive_path)
+                
+                # 方式2：多文件上传
+                elif 'files[]' in request.files:
                     files = request.files.getlist('files[]')
                     if not files or all(f.filename == '' for f in files):
-                        yield f"data: {json.dumps({'type': 'error', 'message': '未选择文件'}, ensure_ascii=False)}\n\n"
+                        yield _sse({'type': 'error', 'message': '未选择文件'})
                         return
                     
-                    upload_dir = Path("uploads")
-                    upload_dir.mkdir(exist_ok=True)
+                    image_store = get_image_store()
                     
                     for file in files:
                         if file.filename and allowed_file(file.filename):
-                            filename = secure_filename(file.filename)
-                            file_path = upload_dir / filename
-                            file.save(str(file_path))
-                            file_paths.append(str(file_path))
+                            file_path, _ = image_store.put_stream(file.stream, file.filename)
+                            file_paths.append(file_path)
                     
                     if not file_paths:
-                        yield f"data: {json.dumps({'type': 'error', 'message': '没有有效的图像文件'}, ensure_ascii=False)}\n\n"
+                        yield _sse({'type': 'error', 'message': '没有有效的图像文件'})
                         return
                 
-                # 方式2：JSON 请求
+                # 方式3：JSON 请求
                 elif request.is_json:
                     data = request.get_json()
                     
-                    if 'folder_path' in data:
+                    if 'resume_batch_id' in data:
+                        try:
+                            tracker = BatchTracker.load(data['resume_batch_id'], state_dir)
+                        except (FileNotFoundError, ValueError) as e:
+                            yield _sse({'type': 'error', 'message': str(e)})
+                            return
+                        
+                        if 'archive' in tracker.meta:
+                            # 压缩包批次：从保存的压缩包中重新读取尚未成功的成员
+                            meta = tracker.meta
+                            archive_path = meta.get('archive_path')
+                            if not archive_path or not Path(archive_path).exists():
+                                yield _sse({'type': 'error', 'message': f"批次的压缩包未保存，无法续传: {meta['archive']}"})
+                                return
+                            with open(archive_path, 'rb') as f:
+                                total = count_archive_images(f, meta['archive'], allowed_file,
+                                                             max_member_size=max_member_size)
+                            if total is not None:
+                                total -= sum(1 for label in tracker.files if tracker.is_done(label))
+                                if total <= 0:
+                                    yield _sse({'type': 'complete', 'batch_id': tracker.batch_id, 'total': 0, 'success_count': 0, 'failed_count': 0, 'data': []})
+                                    return
+                            sources = read_archive(archive_path, meta['archive'], max_member_size, skip=tracker.is_done)
+                        elif 'folder_path' in tracker.meta:
+                            # 文件夹批次：重新扫描，跳过已成功的文件（包括断开前尚未扫描到的文件）
+                            meta = tracker.meta
+                            sources = (p for p in iter_invoice_files(
+                                meta['folder_path'], allowed_extensions, include=meta.get('include'),
+                                exclude=meta.get('exclude'), recursive=meta.get('recursive', True))
+                                if not tracker.is_done(p))
+                        else:
+                            file_paths = tracker.pending_files()
+                            if not file_paths:
+                                yield _sse({'type': 'complete', 'batch_id': tracker.batch_id, 'total': 0, 'success_count': 0, 'failed_count': 0, 'data': []})
+                                return
+                    
+                    elif 'folder_path' in data:
                         folder_path = data['folder_path']
                         folder = Path(folder_path)
                         if not folder.exists() or not folder.is_dir():
-                            yield f"data: {json.dumps({'type': 'error', 'message': f'文件夹不存在: {folder_path}'}, ensure_ascii=False)}\n\n"
+                            yield _sse({'type': 'error', 'message': f'文件夹不存在: {folder_path}'})
                             return
                         
-                        image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.PNG', '.JPG', '.JPEG', '.GIF', '.BMP'}
-                        file_paths = [str(f) for f in folder.iterdir() 
-                                     if f.is_file() and f.suffix in image_extensions]
-                        
-                        if not file_paths:
-                            yield f"data: {json.dumps({'type': 'error', 'message': '文件夹中没有找到图像文件'}, ensure_ascii=False)}\n\n"
-                            return
+                        # 边扫描边处理，不预先列举整个目录树
+                        scan_options = {
+                            'include': data.get('include'),
+                            'exclude': data.get('exclude'),
+                            'recursive': _as_bool(data.get('recursive'), True),
+                        }
+                        sources = iter_invoice_files(folder, allowed_extensions, **scan_options)
+                        tracker = BatchTracker(state_dir=state_dir)
+                        tracker.set_meta(folder_path=folder_path, incremental=data.get('incremental'),
+                                         content_hash=data.get('content_hash'), **scan_options)
                     
                     elif 'image_paths' in data:
                         image_paths = data['image_paths']
                         if not isinstance(image_paths, list):
-                            yield f"data: {json.dumps({'type': 'error', 'message': 'image_paths 必须是数组'}, ensure_ascii=False)}\n\n"
+                            yield _sse({'type': 'error', 'message': 'image_paths 必须是数组'})
                             return
                         file_paths = image_paths
                     
                     else:
-                        yield f"data: {json.dumps({'type': 'error', 'message': '请提供 files[]、image_paths 或 folder_path 参数'}, ensure_ascii=False)}\n\n"
+                        yield _sse({'type': 'error', 'message': '请提供 archive、files[]、image_paths、folder_path 或 resume_batch_id 参数'})
                         return
                 
                 else:
-                    yield f"data: {json.dumps({'type': 'error', 'message': '请提供文件或 JSON 数据'}, ensure_ascii=False)}\n\n"
+                    yield _sse({'type': 'error', 'message': '请提供文件或 JSON 数据'})
                     return
                 
+                # 增量处理：跳过已处理且未变化的文件
+                skipped = 0
+                if request.is_json:
+                    # 续传的文件夹批次沿用创建时的增量处理选项
+                    options = {k: v for k, v in tracker.meta.items() if v is not None} if tracker else {}
+                    options.update(data)
+                    manifest = open_manifest(options)
+                    if manifest is not None:
+                        pending = [p for p in file_paths if not manifest.is_processed(p)]
+                        skipped = len(file_paths) - len(pending)
+                        file_paths = pending
+                
+                if sources is None:
+                    sources = file_paths
+                    total = len(file_paths)
+                elif tracker is not None and 'folder_path' in tracker.meta:
+                    # 文件夹扫描：总数未知，扫描结束后补充 total
+                    sources = scan_with_progress(sources, manifest, lambda: runner)
+                
+                # 记录批次状态，断开后可续传
+                if tracker is None:
+                    tracker = BatchTracker(state_dir=state_dir)
+                    for file_path in file_paths:
+                        tracker.add(file_path)
+                
+                # 文件夹批次以相对路径命名，不同子目录中的同名文件不会互相覆盖
+                folder_root = tracker.meta.get('folder_path')
+                
+                def handle(source, cancel_event):
+                    if isinstance(source, ArchiveMember):
+                        source.check_unique()
+                        return invoice_service.process_image_bytes(
+                            source.data, source.image_name, save_json, save_db, cancel_event=cancel_event)
+                    image_name = relative_image_name(source, folder_root) if folder_root else None
+                    return invoice_service.process_image_with_manifest(
+                        source, manifest, save_json, save_db, cancel_event=cancel_event, image_name=image_name)
+                
+                runner = BatchRunner(handle, sources, tracker=tracker,
+                                     total=total, heartbeat_interval=heartbeat_interval)
+                
                 # 发送开始消息
-                total = len(file_paths)
-                yield f"data: {json.dumps({'type': 'start', 'total': total}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'start', 'total': total, 'batch_id': tracker.batch_id, 'skipped': skipped})
+                
+                # 后台处理，实时发送进度更新
+                yield from run_with_events(runner)
+            
+            except Exception as e:
+                yield _sse({'type': 'error', 'message': f'处理失败: {str(e)}'})
+            finally:
+                # 客户端断开时生成器被关闭（GeneratorExit），取消剩余的识别任务
+                if runner is not None:
+                    runner.cancel()
+                    runner.join()
+                if manifest is not None:
+                    manifest.close()
+        
+        return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    
+    @api_bp.route('/predict/stream/incremental', methods=['POST'])
+    def predict_stream_incremental():
+        """
+        发票识别接口（边上传边识别）
+        使用 Server-Sent Events (SSE) 实时推送处理进度
+        
+        使用 multipart/form-data 上传，字段名为 'files[]'。请求体按部分逐段解析，
+        每个文件接收完成后立即开始识别，上传时间与识别时间重叠。
+        由于表单字段可能在文件之后才到达，save_json、save_db 通过查询参数传递。
+        上传完成前文件总数未知，进度消息中的 total 和 percent 为 null。
+        """
+        state_dir = current_app.config['BATCH_STATE_FOLDER']
+        heartbeat_interval = current_app.config['SSE_HEARTBEAT_INTERVAL']
+        save_json = str(request.args.get('save_json', 'true')).lower() == 'true'
+        save_db = str(request.args.get('save_db', 'true')).lower() == 'true'
+        # 直接读取原始请求体，不能访问 request.files / request.form（会触发完整解析）
+        stream = request.stream
+        content_type = request.content_type or ''
+        
+        def generate():
+            runner = None
+            receiver = None
+            try:
+                tracker = BatchTracker(state_dir=state_dir)
+                uploaded = queue.Queue()
+                
+                def sources():
+                    while True:
+                        file_path = uploaded.get()
+                        if file_path is None:
+                            return
+                        yield file_path
+                
+                def handle(img_path, cancel_event):
+                    return invoice_service.process_image(img_path, save_json, save_db, cancel_event=cancel_event)
                 
-                # 批量处理，实时发送进度更新
-                for idx, img_path in enumerate(file_paths, 1):
+                runner = BatchRunner(handle, sources(), tracker=tracker,
+                                     total=None, heartbeat_interval=heartbeat_interval)
+                
+                def receive():
+                    """接收线程：解析上传数据，每收到一个文件就移入原图存储并放入识别队列"""
+                    count = 0
+                    image_store = get_image_store()
+                    upload_dir = tempfile.mkdtemp(dir=image_store.tmp_dir)
                     try:
-                        # 发送开始处理消息
-                        yield f"data: {json.dumps({'type': 'progress', 'current': idx, 'total': total, 'percent': int((idx / total) * 100), 'file': Path(img_path).name, 'status': 'processing'}, ensure_ascii=False)}\n\n"
-                        
-                        result = invoice_service.process_image(img_path, save_json, save_db)
-                        results.append({
-                            'success': True,
-                            'file': img_path,
-                            'result': result,
-                            'index': idx,
-                            'total': total
-                        })
-                        
-                        # 发送成功消息
-                        yield f"data: {json.dumps({'type': 'progress', 'current': idx, 'total': total, 'percent': int((idx / total) * 100), 'file': Path(img_path).name, 'status': 'success'}, ensure_ascii=False)}\n\n"
+                        for kind, name, value in iter_multipart_stream(
+                                stream, content_type, upload_dir, allowed_file,
+                                cancel_event=runner.cancel_event):
+                            if kind == 'file':
+                                count += 1
+                                value, _ = image_store.put_file(value, name)
+                                tracker.add(value)
+                                uploaded.put(value)
+                                runner.emit({'type': 'upload', 'file': name, 'received': count})
+                        runner.total = count
+                        if count == 0:
+                            runner.emit({'type': 'error', 'message': '没有有效的图像文件'})
                     except Exception as e:
-                        results.append({
-                            'success': False,
-                            'file': img_path,
-                            'error': str(e),
-                            'index': idx,
-                            'total': total
-                        })
-                        
-                        # 发送失败消息
-                        yield f"data: {json.dumps({'type': 'progress', 'current': idx, 'total': total, 'percent': int((idx / total) * 100), 'file': Path(img_path).name, 'status': 'failed', 'error': str(e)}, ensure_ascii=False)}\n\n"
+                        runner.emit({'type': 'error', 'message': f'上传失败: {str(e)}'})
+                        runner.cancel()
+                    finally:
+                        shutil.rmtree(upload_dir, ignore_errors=True)
+                        uploaded.put(None)
+                
+                yield _sse({'type': 'start', 'total': None, 'batch_id': tracker.batch_id})
                 
-                # 发送完成消息
-                yield f"data: {json.dumps({'type': 'complete', 'total': len(results), 'success_count': sum(1 for r in results if r['success']), 'failed_count': sum(1 for r in results if not r['success']), 'data': results}, ensure_ascii=False)}\n\n"
+                receiver = threading.Thread(target=receive, daemon=True)
+                receiver.start()
+                yield from run_with_events(runner)
             
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'message': f'处理失败: {str(e)}'}, ensure_ascii=False)}\n\n"
+                yield _sse({'type': 'error', 'message': f'处理失败: {str(e)}'})
+            finally:
+                # 客户端断开时取消识别，并等待接收线程和识别线程结束，
+                # 响应关闭后不再有后台线程读取请求体或写入原图存储
+                if runner is not None:
+                    runner.cancel()
+                    if receiver is not None:
+                        receiver.join()
+                    runner.join()
         
         return Response(stream_with_context(generate()), mimetype='text/event-stream')
     
+    @api_bp.route('/batches/<batch_id>', methods=['GET'])
+    def get_batch(batch_id):
+        """查询批次处理状态（已完成、失败和待处理的文件）"""
+        try:
+            tracker = BatchTracker.load(batch_id, current_app.config['BATCH_STATE_FOLDER'])
+        except FileNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'data': tracker.summary()
+        }), 200
+    
+    @api_bp.route('/jobs', methods=['POST'])
+    def create_job():
+        """
+        创建分布式识别作业
+        
+        每个文件写入一个任务，由各节点上运行的 worker（python worker.py）领取处理。
+        JSON 请求：folder_path（支持 recursive、include、exclude）或 image_paths，
+        可选 name、max_attempts、save_json、save_db。
+        """
+        if not request.is_json:
+            return jsonify({'error': '请提供 JSON 数据'}), 400
+        data = request.get_json()
+        
+        if 'folder_path' in data:
+            folder = Path(data['folder_path'])
+            if not folder.is_dir():
+                return jsonify({'error': f"文件夹不存在或不是目录: {data['folder_path']}"}), 400
+            file_paths = iter_invoice_files(
+                folder, allowed_extensions,
+                include=data.get('include'),
+                exclude=data.get('exclude'),
+                recursive=_as_bool(data.get('recursive'), True)
+            )
+        elif 'image_paths' in data:
+            file_paths = data['image_paths']
+            if not isinstance(file_paths, list):
+                return jsonify({'error': 'image_paths 必须是数组'}), 400
+        else:
+            return jsonify({'error': '请提供 folder_path 或 image_paths 参数'}), 400
+        
+        max_attempts = data.get('max_attempts')
+        if max_attempts is not None and (not isinstance(max_attempts, int) or isinstance(max_attempts, bool)
+                                         or max_attempts < 1):
+            return jsonify({'error': 'max_attempts 必须是正整数'}), 400
+        
+        try:
+            work_queue = get_work_queue()
+            job_id = work_queue.create_job(
+                file_paths,
+                options={
+                    'save_json': _as_bool(data.get('save_json'), True),
+                    'save_db': _as_bool(data.get('save_db'), True),
+                    # worker 以相对于扫描根目录的路径作为 image_name
+                    'root': data.get('folder_path')
+                },
+                name=data.get('name'),
+                max_attempts=max_attempts
+            )
+            return jsonify({
+                'success': True,
+                'data': work_queue.job_summary(job_id)
+            }), 201
+        except Exception as e:
+            return jsonify({'error': f'创建作业失败: {str(e)}'}), 500
+    
+    @api_bp.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        """查询作业状态（各状态任务数及死信任务）"""
+        summary = get_work_queue().job_summary(job_id)
+        if summary is None:
+            return jsonify({'error': '作业不存在'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': summary
+        }), 200
+    
+    @api_bp.route('/jobs/<job_id>/retry', methods=['POST'])
+    def retry_job(job_id):
+        """将作业中的死信任务重新排队"""
+        work_queue = get_work_queue()
+        if work_queue.job_summary(job_id, error_limit=0) is None:
+            return jsonify({'error': '作业不存在'}), 404
+        
+        count = work_queue.retry_dead(job_id)
+        return jsonify({
+            'success': True,
+            'retried': count,
+            'data': work_queue.job_summary(job_id)
+        }), 200
+    
+    @api_bp.route('/persistence', methods=['GET'])
+    def get_persistence_status():
+        """
+        写入队列状态
+        
+        pending 为尚未写入数据库的识别结果数，failed 为无法写入、已移到 failed.jsonl 的记录数，
+        draining 表示本进程负责写入数据库（同一队列目录只有一个进程写入）。
+        """
+        return jsonify({
+            'success': True,
+            'mode': current_app.config['PERSIST_MODE'],
+            'data': get_persist_spool().stats()
+        }), 200
+    
+    @api_bp.route('/results/<image_name>', methods=['GET'])
+    def get_result(image_name):
+        """读取保存的识别结果（save_json 写入的结果，files 与 shards 两种方式均可读取）"""
+        result = get_result_sink().get(image_name)
+        if result is None:
+            return jsonify({'error': '识别结果不存在'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        }), 200
+    
     return api_bp
 
@@ -1,37 +1,263 @@
 """
 发票数据路由 - 发票查询相关接口
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, send_file
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import load_only
+from datetime import date, datetime, timezone
+from functools import wraps
+from decimal import Decimal, InvalidOperation
+import base64
+import hashlib
+import json
+from pathlib import Path
 from db import SessionLocal
-from model import Invoice
+from model import Invoice, InvoiceItem
+from utils.utils import normalize_key, delete_invoice_record
+from services.count_cache import CachedCount
+from services.cache import get_cache, invoice_detail_key, invoice_list_key, invalidate_invoice
+from services.invoice_search import apply_full_text_search
+from services.invoice_items import (
+    item_conditions, has_matching_item, item_dict, encode_item_cursor, decode_item_cursor
+)
+from services.image_store import get_image_store
+from services.change_feed import encode_feed_cursor, decode_feed_cursor, wait_for_changes
+from services.exporter import (
+    EXPORT_FORMATS, check_export_format, parse_fields, build_export_query, iter_rows, iter_export, gzip_chunks
+)
 
 invoice_bp = Blueprint('invoice', __name__, url_prefix='/api/invoices')
 
 
+# 发票识别字段名称（与CLASS_NAME_CN_MAP保持一致）
+FIELD_NAMES = [
+    'quantity', 'unit_price', 'unit', 'item_name', 'check_code',
+    'tax_amount', 'amount', 'tax_rate', 'specification',
+    'invoice_number', 'invoice_code', 'invoice_date',
+    'seller_name', 'buyer_name', 'seller_tax_id', 'buyer_tax_id',
+    'seller_bank_account', 'buyer_bank_account',
+    'seller_address_phone', 'buyer_address_phone',
+    'total_amount'
+]
+
+
+# 发票基本信息字段
+SUMMARY_FIELDS = ['id', 'image_name', 'detection_count', 'created_at', 'updated_at']
+
+
+def _count_invoices():
+    """统计发票总数（在后台线程中调用）"""
+    db = SessionLocal()
+    try:
+        return db.query(func.count(Invoice.id)).scalar()
+    finally:
+        db.close()
+
+
+# 发票总数缓存，避免每次列表请求都全表 COUNT(*)
+invoice_count = CachedCount(_count_invoices)
+
+
+def encode_cursor(invoice):
+    """将最后一条记录的 (created_at, id) 编码为游标"""
+    payload = json.dumps({'c': invoice.created_at.isoformat(), 'i': invoice.id})
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+    
+    Returns:
+        tuple: (created_at, id)
+    
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(payload['c']), int(payload['i'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+
+
+def keyset_page(query, cursor, per_page):
+    """
+    按 (created_at, id) 倒序取一页
+    
+    Args:
+        query: 发票查询（已按 created_at、id 倒序排序）
+        cursor: 上一页返回的游标，为空时取第一页
+        per_page: 每页条数
+    
+    Returns:
+        tuple: (发票列表, 下一页游标)，没有下一页时游标为 None
+    
+    Raises:
+        ValueError: 游标格式无效
+    """
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Invoice.created_at < created_at,
+            and_(Invoice.created_at == created_at, Invoice.id < last_id)
+        ))
+    
+    # 多取一条判断是否还有下一页
+    invoices = query.limit(per_page + 1).all()
+    if len(invoices) > per_page:
+        invoices = invoices[:per_page]
+        return invoices, encode_cursor(invoices[-1])
+    return invoices, None
+
+
+def _per_page():
+    """读取 per_page 参数并限制在 1 到 INVOICE_MAX_PER_PAGE 之间"""
+    max_per_page = current_app.config['INVOICE_MAX_PER_PAGE']
+    return min(max(request.args.get('per_page', 10, type=int), 1), max_per_page)
+
+
+def _invoice_summary(invoice):
+    return {
+        'id': invoice.id,
+        'image_name': invoice.image_name,
+        'detection_count': invoice.detection_count,
+        'created_at': invoice.created_at.isoformat() if invoice.created_at else None,
+        'updated_at': invoice.updated_at.isoformat() if invoice.updated_at else None
+    }
+
+
+def _records_version(payload):
+    """从响应数据中取出 (id, updated_at) 列表，用于生成 ETag 和 Last-Modified"""
+    data = payload.get('data')
+    items = data if isinstance(data, list) else [data]
+    return [(item.get('id'), item.get('updated_at')) for item in items if isinstance(item, dict)]
+
+
+def cached_view(key_func):
+    """
+    为查询接口添加响应缓存和条件请求支持
+    
+    成功的响应连同 ETag（由记录的 id 和 updated_at 计算）、Last-Modified（最大的 updated_at）一起缓存；
+    请求带 If-None-Match / If-Modified-Since 且未变化时返回 304。保存或删除发票时相应条目失效（invalidate_invoice）。
+    
+    Args:
+        key_func: 根据视图参数生成缓存键的函数
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                cache = get_cache()
+                key = key_func(*args, **kwargs)
+                entry = cache.get(key)
+            except Exception as e:
+                # 缓存不可用时直接查询数据库
+                print(f"⚠️ 读取缓存失败: {e}")
+                return view(*args, **kwargs)
+            
+            if entry is None:
+                result = view(*args, **kwargs)
+                response, status = result if isinstance(result, tuple) else (result, 200)
+                if status != 200:
+                    return result
+                payload = response.get_json()
+                versions = _records_version(payload)
+                timestamps = [ts for _, ts in versions if ts]
+                entry = {
+                    'payload': payload,
+                    'etag': hashlib.sha1(
+                        json.dumps([key, versions], ensure_ascii=False).encode('utf-8')
+                    ).hexdigest(),
+                    'last_modified': max(timestamps) if timestamps else None
+                }
+                try:
+                    cache.set(key, entry)
+                except Exception as e:
+                    print(f"⚠️ 写入缓存失败: {e}")
+            
+            response = jsonify(entry['payload'])
+            response.set_etag(entry['etag'])
+            if entry['last_modified']:
+                response.last_modified = datetime.fromisoformat(entry['last_modified']).astimezone(timezone.utc)
+            # 客户端可以缓存，但每次使用前需用条件请求校验
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
 @invoice_bp.route('', methods=['GET'])
+@cached_view(lambda: invoice_list_key(request.query_string.decode('utf-8')))
 def get_invoices():
-    """获取发票列表"""
+    """
+    获取发票列表
+    
+    两种分页方式：
+    1. 游标分页：传 cursor 参数（首页传空值），按 (created_at, id) 倒序，响应中返回 next_cursor，
+       翻页代价与页码无关
+    2. 页码分页：传 page 参数（兼容旧接口），深分页时较慢
+    
+    total 为缓存的总数，可能滞后 INVOICE_COUNT_TTL 秒
+    
+    传 q 参数时在销售方名称、购买方名称和项目名称中全文检索，结果按相关度排序，使用 page 分页
+    """
     db = SessionLocal()
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
+        per_page = _per_page()
+        
+        # 全文检索
+        q = request.args.get('q', '').strip()
+        if q:
+            page = max(request.args.get('page', 1, type=int), 1)
+            query, score = apply_full_text_search(db.query(Invoice), q)
+            rows = query.add_columns(score).offset((page - 1) * per_page).limit(per_page + 1).all()
+            has_more = len(rows) > per_page
+            
+            return jsonify({
+                'success': True,
+                'data': [dict(
+                    _invoice_summary(invoice),
+                    seller_name=invoice.seller_name,
+                    buyer_name=invoice.buyer_name,
+                    item_name=invoice.item_name,
+                    score=float(row_score) if row_score is not None else None
+                ) for invoice, row_score in rows[:per_page]],
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'has_more': has_more
+                }
+            }), 200
+        
+        total = invoice_count.get(current_app.config['INVOICE_COUNT_TTL'])
+        query = db.query(Invoice).order_by(Invoice.created_at.desc(), Invoice.id.desc())
         
-        # 查询发票列表
-        invoices = db.query(Invoice).order_by(Invoice.created_at.desc()).offset(
-            (page - 1) * per_page
-        ).limit(per_page).all()
+        # 游标分页
+        if 'cursor' in request.args:
+            try:
+                invoices, next_cursor = keyset_page(query, request.args.get('cursor'), per_page)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'success': True,
+                'data': [_invoice_summary(invoice) for invoice in invoices],
+                'pagination': {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None,
+                    'total': total
+                }
+            }), 200
         
-        total = db.query(Invoice).count()
+        # 页码分页
+        page = max(request.args.get('page', 1, type=int), 1)
+        invoices = query.offset((page - 1) * per_page).limit(per_page).all()
         
         return jsonify({
             'success': True,
-            'data': [{
-                'id': invoice.id,
-                'image_name': invoice.image_name,
-                'detection_count': invoice.detection_count,
-                'created_at': invoice.created_at.isoformat() if invoice.created_at else None,
-                'updated_at': invoice.updated_at.isoformat() if invoice.updated_at else None
-            } for invoice in invoices],
+            'data': [_invoice_summary(invoice) for invoice in invoices],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -45,28 +271,468 @@ def get_invoices():
         db.close()
 
 
+@invoice_bp.route('/search', methods=['GET'])
+def search_invoices():
+    """
+    按关键字段查询发票（使用带索引的查询字段）
+    
+    查询参数（均可选，可组合）：
+    - invoice_number、invoice_code、seller_tax_id、buyer_tax_id：精确匹配（忽略空白和大小写）
+    - date_from、date_to：开票日期范围（YYYY-MM-DD，包含两端）
+    - amount_min、amount_max：价税合计范围
+    - item_name、item_category、item_q、item_amount_min、item_amount_max、item_tax_rate：
+      存在满足条件的明细行（同 GET /api/invoices/items 的 name、category、q、amount_min、amount_max、tax_rate）
+    - cursor、per_page：游标分页，同 GET /api/invoices
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(Invoice)
+        
+        for param, column, max_length in (
+            ('invoice_number', Invoice.invoice_number_key, 32),
+            ('invoice_code', Invoice.invoice_code_key, 16),
+            ('seller_tax_id', Invoice.seller_tax_id_key, 32),
+            ('buyer_tax_id', Invoice.buyer_tax_id_key, 32),
+        ):
+            value = request.args.get(param)
+            if value:
+                query = query.filter(column == normalize_key(value, max_length))
+        
+        try:
+            date_from = request.args.get('date_from')
+            if date_from:
+                query = query.filter(Invoice.invoice_date_value >= date.fromisoformat(date_from))
+            date_to = request.args.get('date_to')
+            if date_to:
+                query = query.filter(Invoice.invoice_date_value <= date.fromisoformat(date_to))
+        except ValueError:
+            return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+        
+        try:
+            amount_min = request.args.get('amount_min')
+            if amount_min:
+                query = query.filter(Invoice.total_amount_value >= Decimal(amount_min))
+            amount_max = request.args.get('amount_max')
+            if amount_max:
+                query = query.filter(Invoice.total_amount_value <= Decimal(amount_max))
+        except InvalidOperation:
+            return jsonify({'error': '金额格式无效'}), 400
+        
+        try:
+            item_filters = _item_filters('item_')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if item_filters:
+            query = query.filter(has_matching_item(**item_filters))
+        
+        per_page = _per_page()
+        query = query.order_by(Invoice.created_at.desc(), Invoice.id.desc())
+        try:
+            invoices, next_cursor = keyset_page(query, request.args.get('cursor'), per_page)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'data': [dict(
+                _invoice_summary(invoice),
+                invoice_number=invoice.invoice_number_key,
+                invoice_code=invoice.invoice_code_key,
+                invoice_date=invoice.invoice_date_value.isoformat() if invoice.invoice_date_value else None,
+                seller_tax_id=invoice.seller_tax_id_key,
+                buyer_tax_id=invoice.buyer_tax_id_key,
+                total_amount=float(invoice.total_amount_value) if invoice.total_amount_value is not None else None
+            ) for invoice in invoices],
+            'pagination': {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+    finally:
+        db.close()
+
+
+def _item_filters(prefix=''):
+    """
+    读取明细查询参数
+    
+    Args:
+        prefix: 参数名前缀（/search 中为 item_）
+    
+    Returns:
+        dict: item_conditions 的参数，只包含请求中给出的条件
+    
+    Raises:
+        ValueError: 金额或税率格式无效
+    """
+    names = {'item_name': 'name', 'item_category': 'category', 'q': 'q', 'amount_min': 'amount_min',
+             'amount_max': 'amount_max', 'tax_rate': 'tax_rate'}
+    filters = {}
+    for key, param in names.items():
+        value = request.args.get(prefix + param, '').strip()
+        if not value:
+            continue
+        if key in ('amount_min', 'amount_max', 'tax_rate'):
+            try:
+                value = Decimal(value)
+            except InvalidOperation:
+                raise ValueError(f'{prefix + param} 格式无效')
+        filters[key] = value
+    return filters
+
+
+@invoice_bp.route('/items', methods=['GET'])
+def get_invoice_items():
+    """
+    查询明细行
+    
+    查询参数（均可选，可组合）：
+    - name：项目名称（精确匹配，不含 *分类* 部分）
+    - category：商品和服务税收分类简称（精确匹配）
+    - q：项目名称包含的文字
+    - amount_min、amount_max：明细金额范围
+    - tax_rate：税率（如 13）
+    - date_from、date_to：开票日期范围（YYYY-MM-DD）
+    - seller_tax_id：销售方纳税人识别号
+    - cursor、per_page：游标分页，按明细 id 倒序
+    
+    每个明细行附带所属发票的 image_name、发票号码和开票日期。
+    """
+    db = SessionLocal()
+    try:
+        try:
+            filters = _item_filters()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query = db.query(InvoiceItem, Invoice.image_name, Invoice.invoice_number_key, Invoice.invoice_date_value) \
+            .join(Invoice, Invoice.id == InvoiceItem.invoice_id) \
+            .filter(*item_conditions(**filters))
+        
+        try:
+            date_from = request.args.get('date_from')
+            if date_from:
+                query = query.filter(Invoice.invoice_date_value >= date.fromisoformat(date_from))
+            date_to = request.args.get('date_to')
+            if date_to:
+                query = query.filter(Invoice.invoice_date_value <= date.fromisoformat(date_to))
+        except ValueError:
+            return jsonify({'error': '日期格式应为 YYYY-MM-DD'}), 400
+        seller_tax_id = request.args.get('seller_tax_id')
+        if seller_tax_id:
+            query = query.filter(Invoice.seller_tax_id_key == normalize_key(seller_tax_id, 32))
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                query = query.filter(InvoiceItem.id < decode_item_cursor(cursor))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        per_page = _per_page()
+        rows = query.order_by(InvoiceItem.id.desc()).limit(per_page + 1).all()
+        next_cursor = encode_item_cursor(rows[per_page - 1][0].id) if len(rows) > per_page else None
+        
+        return jsonify({
+            'success': True,
+            'data': [dict(
+                item_dict(item),
+                image_name=image_name,
+                invoice_number=invoice_number,
+                invoice_date=invoice_date.isoformat() if invoice_date else None
+            ) for item, image_name, invoice_number, invoice_date in rows[:per_page]],
+            'pagination': {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+    finally:
+        db.close()
+
+
+@invoice_bp.route('/<int:invoice_id>/items', methods=['GET'])
+def get_invoice_item_lines(invoice_id):
+    """获取一张发票的明细行"""
+    db = SessionLocal()
+    try:
+        if db.query(Invoice.id).filter(Invoice.id == invoice_id).first() is None:
+            return jsonify({'error': '发票不存在'}), 404
+        items = db.query(InvoiceItem).filter(InvoiceItem.invoice_id == invoice_id) \
+            .order_by(InvoiceItem.line_no).all()
+        return jsonify({
+            'success': True,
+            'data': [item_dict(item) for item in items]
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+    finally:
+        db.close()
+
+
+@invoice_bp.route('/<int:invoice_id>/image', methods=['GET'])
+def get_invoice_image(invoice_id):
+    """下载发票的原图（按记录的内容哈希从原图存储中定位）"""
+    db = SessionLocal()
+    try:
+        row = db.query(Invoice.image_sha256).filter(Invoice.id == invoice_id).first()
+    finally:
+        db.close()
+    if row is None:
+        return jsonify({'error': '发票不存在'}), 404
+    
+    path = get_image_store().locate(row.image_sha256) if row.image_sha256 else None
+    if path is None:
+        return jsonify({'error': '原图不存在'}), 404
+    return send_file(path, download_name=Path(path).name, max_age=86400)
+
+
+@invoice_bp.route('/export', methods=['GET'])
+def export_invoices():
+    """
+    流式导出发票
+    
+    查询参数：
+    - format：csv（默认）、jsonl 或 parquet
+    - fields：逗号分隔的导出字段，默认导出所有识别字段
+    - date_from、date_to：开票日期范围（YYYY-MM-DD）
+    - seller_tax_id：销售方纳税人识别号
+    
+    数据以服务端游标分批读取并分块输出；客户端支持 gzip 时 CSV / JSONL 使用 gzip 压缩（Parquet 自带压缩）
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    try:
+        check_export_format(export_format)
+        fields = parse_fields(request.args.get('fields'))
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        date_from = date.fromisoformat(date_from) if date_from else None
+        date_to = date.fromisoformat(date_to) if date_to else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    seller_tax_id = normalize_key(request.args.get('seller_tax_id'), 32)
+    
+    def generate():
+        db = SessionLocal()
+        try:
+            query = build_export_query(db, fields, date_from, date_to, seller_tax_id)
+            yield from iter_export(iter_rows(query), fields, export_format)
+        finally:
+            db.close()
+    
+    chunks = generate()
+    headers = {
+        'Content-Disposition': f'attachment; filename=invoices.{export_format}'
+    }
+    if export_format != 'parquet' and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    
+    return Response(stream_with_context(chunks), content_type=EXPORT_FORMATS[export_format], headers=headers)
+
+
+def _invoice_with_fields(invoice):
+    """发票基本信息和所有识别字段"""
+    return dict(_invoice_summary(invoice), **{name: getattr(invoice, name) for name in FIELD_NAMES})
+
+
+@invoice_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    变更订阅：返回游标之后新增、修改和删除的发票
+    
+    查询参数：
+    - cursor：上次响应中的 next_cursor，首次订阅不传（从头开始）
+    - limit：每次最多返回的变更数（默认 100，最大 INVOICE_MAX_PER_PAGE）
+    - wait：没有变更时最长等待的秒数（长轮询，最大 CHANGE_FEED_MAX_WAIT）
+    
+    每个变更的 op 为 upsert（携带发票全部字段）或 delete（仅 id 和 image_name）。
+    下游保存 next_cursor，下次从该位置继续；has_more 为 true 时应立即再次请求。
+    """
+    try:
+        position = decode_feed_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    limit = min(max(request.args.get('limit', 100, type=int), 1), current_app.config['INVOICE_MAX_PER_PAGE'])
+    wait = min(max(request.args.get('wait', 0, type=float), 0), current_app.config['CHANGE_FEED_MAX_WAIT'])
+    
+    try:
+        changes, position = wait_for_changes(
+            SessionLocal, position, limit, wait, _invoice_with_fields,
+            settle_seconds=current_app.config['CHANGE_FEED_SETTLE_SECONDS']
+        )
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'data': changes,
+        'next_cursor': encode_feed_cursor(position),
+        'has_more': len(changes) >= limit
+    }), 200
+
+
+@invoice_bp.route('/<int:invoice_id>', methods=['DELETE'])
+def delete_invoice(invoice_id):
+    """删除发票：冲销汇总表，并写入删除记录供变更订阅通知下游"""
+    db = SessionLocal()
+    try:
+        invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+        if not invoice:
+            return jsonify({'error': '发票不存在'}), 404
+        
+        delete_invoice_record(db, invoice)
+        db.commit()
+        invoice_count.invalidate()
+        invalidate_invoice(invoice_id)
+        
+        return jsonify({
+            'success': True,
+            'message': f'发票已删除: {invoice_id}'
+        }), 200
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': f'删除失败: {str(e)}'}), 500
+    finally:
+        db.close()
+
+
+def parse_projection(fields):
+    """
+    解析 fields 投影参数
+    
+    Args:
+        fields: 逗号分隔的字段名（基本信息字段或识别字段），为空时返回 None（全部字段）
+    
+    Returns:
+        list: 识别字段列表，或 None
+    
+    Raises:
+        ValueError: 包含不支持的字段
+    """
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    fields = [f.strip() for f in fields if f and f.strip()]
+    unknown = [f for f in fields if f not in FIELD_NAMES and f not in SUMMARY_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的字段: {', '.join(unknown)}")
+    return fields
+
+
+@invoice_bp.route('/batch', methods=['GET', 'POST'])
+def get_invoices_batch():
+    """
+    批量获取发票详情（一次 IN 查询）
+    
+    参数（GET 查询参数用逗号分隔，POST 使用 JSON 数组）：
+    - ids：发票 ID 列表
+    - image_names：图片名称列表
+    - fields：只查询和返回这些字段（基本信息字段或识别字段），默认返回全部字段
+    
+    ids 和 image_names 合计最多 INVOICE_BATCH_MAX 个；返回顺序与请求顺序一致，未找到的放在 missing 中
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        ids = data.get('ids') or []
+        image_names = data.get('image_names') or []
+        fields = data.get('fields')
+    else:
+        ids = [v for v in request.args.get('ids', '').split(',') if v.strip()]
+        image_names = [v for v in request.args.get('image_names', '').split(',') if v.strip()]
+        fields = request.args.get('fields')
+    
+    if not isinstance(ids, list) or not isinstance(image_names, list):
+        return jsonify({'error': 'ids 和 image_names 必须是数组'}), 400
+    try:
+        ids = [int(v) for v in ids]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'ids 必须是整数'}), 400
+    try:
+        fields = parse_projection(fields)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    image_names = [str(v) for v in image_names]
+    
+    if not ids and not image_names:
+        return jsonify({'error': '请提供 ids 或 image_names 参数'}), 400
+    max_batch = current_app.config['INVOICE_BATCH_MAX']
+    if len(ids) + len(image_names) > max_batch:
+        return jsonify({'error': f'一次最多查询 {max_batch} 张发票'}), 400
+    
+    # 只查询所需的列（id、image_name 用于匹配请求，始终查询）
+    selected = fields if fields is not None else SUMMARY_FIELDS + FIELD_NAMES
+    columns = ['id', 'image_name'] + [f for f in selected if f not in ('id', 'image_name')]
+    
+    db = SessionLocal()
+    try:
+        conditions = []
+        if ids:
+            conditions.append(Invoice.id.in_(ids))
+        if image_names:
+            conditions.append(Invoice.image_name.in_(image_names))
+        rows = db.query(*[getattr(Invoice, c) for c in columns]).filter(or_(*conditions)).all()
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+    finally:
+        db.close()
+    
+    by_id = {}
+    by_name = {}
+    for row in rows:
+        item = {}
+        for column, value in zip(columns, row):
+            if column in selected:
+                item[column] = value.isoformat() if isinstance(value, datetime) else value
+        by_id[row[0]] = item
+        by_name[row[1]] = item
+    
+    data = []
+    missing = []
+    for key, lookup in [(v, by_id) for v in ids] + [(v, by_name) for v in image_names]:
+        if key in lookup:
+            data.append(lookup[key])
+        else:
+            missing.append(key)
+    
+    return jsonify({
+        'success': True,
+        'data': data,
+        'missing': missing
+    }), 200
+
+
 @invoice_bp.route('/<int:invoice_id>', methods=['GET'])
+@cached_view(lambda invoice_id: invoice_detail_key(invoice_id, request.args.get('fields', '')))
 def get_invoice_detail(invoice_id):
-    """获取发票详情"""
+    """
+    获取发票详情
+    
+    可选 fields 参数（逗号分隔的识别字段）：只查询并返回这些字段的 detections
+    """
+    try:
+        fields = parse_projection(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    field_names = [f for f in fields if f in FIELD_NAMES] if fields is not None else FIELD_NAMES
+    
     db = SessionLocal()
     try:
-        invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+        invoice = db.query(Invoice).options(
+            load_only(*[getattr(Invoice, f) for f in SUMMARY_FIELDS + field_names])
+        ).filter(Invoice.id == invoice_id).first()
         
         if not invoice:
             return jsonify({'error': '发票不存在'}), 404
         
         # 将Invoice记录的所有字段转换为detections数组格式（保持API兼容性）
         detections_list = []
-        # 定义所有字段名称（与CLASS_NAME_CN_MAP保持一致）
-        field_names = [
-            'quantity', 'unit_price', 'unit', 'item_name', 'check_code',
-            'tax_amount', 'amount', 'tax_rate', 'specification',
-            'invoice_number', 'invoice_code', 'invoice_date',
-            'seller_name', 'buyer_name', 'seller_tax_id', 'buyer_tax_id',
-            'seller_bank_account', 'buyer_bank_account',
-            'seller_address_phone', 'buyer_address_phone',
-            'total_amount'
-        ]
         
         # 遍历所有字段，将非None的字段添加到detections列表
         for field_name in field_names:
@@ -0,0 +1,95 @@
+"""
+报表路由 - 读取汇总表的统计接口
+"""
+import re
+from flask import Blueprint, request, jsonify
+from db import SessionLocal
+from services.reports import query_report, monthly_totals
+
+report_bp = Blueprint('report', __name__, url_prefix='/api/reports')
+
+# 报表路径 -> 汇总维度
+REPORT_PATHS = {
+    'sellers': 'seller',
+    'buyers': 'buyer',
+    'tax-rates': 'tax_rate',
+}
+
+
+def _month_range():
+    """
+    读取 month_from、month_to 参数（YYYY-MM）
+    
+    Raises:
+        ValueError: 月份格式无效
+    """
+    months = []
+    for param in ('month_from', 'month_to'):
+        value = request.args.get(param)
+        if value and not re.fullmatch(r'\d{4}-\d{2}', value):
+            raise ValueError(f'{param} 格式应为 YYYY-MM')
+        months.append(value or None)
+    return months
+
+
+@report_bp.route('/monthly', methods=['GET'])
+def get_monthly_report():
+    """按月汇总发票数、金额、税额和价税合计"""
+    db = SessionLocal()
+    try:
+        try:
+            month_from, month_to = _month_range()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'data': monthly_totals(db, month_from, month_to)
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+    finally:
+        db.close()
+
+
+@report_bp.route('/<report>', methods=['GET'])
+def get_report(report):
+    """
+    按销售方、购买方或税率汇总
+    
+    路径：/api/reports/sellers、/api/reports/buyers、/api/reports/tax-rates
+    查询参数：
+    - month_from、month_to：月份范围（YYYY-MM，包含两端）
+    - key：只查询指定的纳税人识别号或税率
+    - by_month：为 true 时按月分别返回
+    - order_by：排序度量（invoice_count、amount_sum、tax_amount_sum、total_amount_sum），倒序
+    - limit：最多返回的行数（默认 100，最大 1000）
+    """
+    dimension = REPORT_PATHS.get(report)
+    if dimension is None:
+        return jsonify({'error': f'不支持的报表: {report}'}), 404
+    
+    db = SessionLocal()
+    try:
+        try:
+            month_from, month_to = _month_range()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        data = query_report(
+            db, dimension,
+            month_from=month_from,
+            month_to=month_to,
+            key=request.args.get('key'),
+            by_month=request.args.get('by_month', 'false').lower() in ('1', 'true', 'yes', 'on'),
+            order_by=request.args.get('order_by', 'total_amount_sum'),
+            limit=min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        )
+        return jsonify({
+            'success': True,
+            'data': data
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+    finally:
+        db.close()
@@ -0,0 +1,152 @@
+"""
+压缩包读取 - 逐个读取 ZIP/TAR 中的发票图像到内存，不解压到磁盘
+"""
+import tarfile
+import zipfile
+from pathlib import PurePosixPath
+
+from services.file_scanner import path_image_name
+
+
+# 支持的压缩包格式
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_archive(filename):
+    """检查文件名是否为支持的压缩包格式"""
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+class ArchiveMember:
+    """压缩包中的一个图像文件（内容已读入内存）"""
+
+    def __init__(self, archive_name, name, data, duplicate_of=None):
+        """
+        Args:
+            archive_name: 压缩包文件名
+            name: 成员在压缩包内的路径
+            data: 成员的字节内容（重复的成员为 None，不读取）
+            duplicate_of: 与本成员 image_name 相同的前一个成员的路径
+        """
+        self.archive_name = archive_name
+        self.name = name
+        self.data = data
+        self.duplicate_of = duplicate_of
+
+    @property
+    def image_name(self):
+        """图片名称：成员在压缩包内的路径（不含扩展名，见 path_image_name），branchA/0001.jpg -> branchA__0001"""
+        return path_image_name(self.name)
+
+    def check_unique(self):
+        """
+        Raises:
+            ValueError: 压缩包中有 image_name 相同的成员（两者会互相覆盖发票记录和结果文件）
+        """
+        if self.duplicate_of is not None:
+            raise ValueError(f"压缩包中有同名文件，已跳过: {self.name}（与 {self.duplicate_of} 同名）")
+
+    def __str__(self):
+        return member_label(self.archive_name, self.name)
+
+
+def member_label(archive_name, name):
+    """成员在批次状态中的标识：<压缩包文件名>/<成员路径>"""
+    return f"{archive_name}/{name}"
+
+
+def count_archive_images(fileobj, filename, allowed_file, max_member_size=None):
+    """
+    统计压缩包中的图像数量
+
+    ZIP 的目录位于文件末尾，可以直接得到总数；TAR 需要顺序读取整个流，返回 None 表示未知。
+    """
+    if not filename.lower().endswith('.zip'):
+        return None
+    with zipfile.ZipFile(fileobj) as zf:
+        count = sum(1 for info in zf.infolist()
+                    if not info.is_dir() and allowed_file(info.filename)
+                    and not (max_member_size and info.file_size > max_member_size))
+    fileobj.seek(0)
+    return count
+
+
+def iter_archive_images(fileobj, filename, allowed_file, max_member_size=None, skip=None):
+    """
+    逐个读取压缩包中的图像文件
+
+    TAR 以流模式（r|*）顺序读取，不需要随机访问；ZIP 依赖文件末尾的目录，
+    需要可 seek 的文件对象（上传文件由 Werkzeug 缓存在临时文件中）。
+    每次只有一个成员的内容驻留在内存中。
+    image_name 与之前的成员相同的成员（如重复的路径、0001.jpg 与 0001.png）不读取内容，
+    产出时带有 duplicate_of，由调用方作为失败处理（见 ArchiveMember.check_unique）。
+
+    Args:
+        fileobj: 压缩包文件对象
+        filename: 压缩包文件名，用于判断格式
+        allowed_file: 成员文件名校验函数
+        max_member_size: 单个成员的最大字节数，超过时跳过（防止压缩炸弹）
+        skip: 参数为成员标识（见 member_label）的函数，返回 True 时跳过且不读取内容（续传时跳过已成功的成员）
+
+    Yields:
+        ArchiveMember: 压缩包中的图像文件
+    """
+    archive_name = PurePosixPath(filename).name
+    lower = filename.lower()
+    seen = {}
+
+    def duplicate_of(name):
+        """返回 image_name 相同的前一个成员（续传时跳过的成员也要登记）"""
+        image_name = path_image_name(name)
+        if image_name in seen:
+            return seen[image_name]
+        seen[image_name] = name
+        return None
+
+    if lower.endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not allowed_file(info.filename):
+                    continue
+                first = duplicate_of(info.filename)
+                if first == info.filename:
+                    # 同一路径出现多次（追加写入的 ZIP），批次状态中的标识相同，只处理第一个
+                    print(f"⚠️ 跳过重复的文件: {info.filename}")
+                    continue
+                if first is not None:
+                    yield ArchiveMember(archive_name, info.filename, None, duplicate_of=first)
+                    continue
+                if skip is not None and skip(member_label(archive_name, info.filename)):
+                    continue
+                if max_member_size and info.file_size > max_member_size:
+                    print(f"⚠️ 跳过过大的文件: {info.filename} ({info.file_size} 字节)")
+                    continue
+                with zf.open(info) as member:
+                    data = member.read()
+                yield ArchiveMember(archive_name, info.filename, data)
+
+    elif lower.endswith(ARCHIVE_SUFFIXES):
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tf:
+            for info in tf:
+                if not info.isfile() or not allowed_file(info.name):
+                    continue
+                first = duplicate_of(info.name)
+                if first == info.name:
+                    # 同一路径出现多次（追加写入的 ZIP），批次状态中的标识相同，只处理第一个
+                    print(f"⚠️ 跳过重复的文件: {info.name}")
+                    continue
+                if first is not None:
+                    yield ArchiveMember(archive_name, info.name, None, duplicate_of=first)
+                    continue
+                if skip is not None and skip(member_label(archive_name, info.name)):
+                    continue
+                if max_member_size and info.size > max_member_size:
+                    print(f"⚠️ 跳过过大的文件: {info.name} ({info.size} 字节)")
+                    continue
+                member = tf.extractfile(info)
+                if member is None:
+                    continue
+                yield ArchiveMember(archive_name, info.name, member.read())
+
+    else:
+        raise ValueError(f"不支持的压缩包格式: {filename}")
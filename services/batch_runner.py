@@ -0,0 +1,307 @@
+"""
+批处理运行器 - 在后台线程中执行批量识别，支持客户端断开时取消以及断点续传
+"""
+import json
+import queue
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+
+class BatchCancelled(Exception):
+    """批处理已被取消（例如 SSE 客户端已断开连接）"""
+
+
+def check_cancelled(cancel_event):
+    """
+    检查取消标志，已取消时抛出 BatchCancelled
+
+    Args:
+        cancel_event: threading.Event 或 None
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise BatchCancelled("批处理已取消")
+
+
+class BatchTracker:
+    """
+    批处理状态记录
+
+    每个批次对应 state_dir 下的一个追加写入的 JSONL 文件，逐行记录文件的处理状态。
+    追加写入使得记录开销与批次大小无关，中断后重放日志即可得到已完成和待处理的文件。
+    """
+
+    def __init__(self, batch_id=None, state_dir='output/batches'):
+        """
+        初始化批处理状态记录
+
+        Args:
+            batch_id: 批次 ID，为 None 时自动生成
+            state_dir: 状态文件目录
+        """
+        self.batch_id = batch_id or uuid.uuid4().hex
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.state_dir / f"{self.batch_id}.jsonl"
+        self.status = 'running'
+        self.meta = {}
+        # 文件 -> 状态（pending / success / failed），保持发现顺序
+        self.files = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, batch_id, state_dir='output/batches'):
+        """
+        从状态文件恢复批次
+
+        Args:
+            batch_id: 批次 ID
+            state_dir: 状态文件目录
+
+        Returns:
+            BatchTracker: 恢复后的批次记录
+        """
+        # 批次 ID 由 uuid 生成，拒绝包含路径分隔符的输入
+        if not batch_id or Path(batch_id).name != batch_id:
+            raise ValueError(f"无效的批次 ID: {batch_id}")
+        tracker = cls(batch_id, state_dir)
+        if not tracker.state_path.exists():
+            raise FileNotFoundError(f"批次不存在: {batch_id}")
+
+        with open(tracker.state_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程崩溃时最后一行可能不完整
+                    continue
+                event = record.get('event')
+                if event == 'meta':
+                    tracker.meta.update(record.get('meta', {}))
+                elif event == 'file':
+                    tracker.files[record['file']] = record['status']
+                    if record.get('error'):
+                        tracker.errors[record['file']] = record['error']
+                elif event == 'status':
+                    tracker.status = record['status']
+        return tracker
+
+    def _append(self, record):
+        """追加一条状态记录"""
+        record['time'] = datetime.now().isoformat()
+        with open(self.state_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def set_meta(self, **meta):
+        """记录批次元信息（如来源文件夹），用于续传时重建任务"""
+        with self._lock:
+            self.meta.update(meta)
+            self._append({'event': 'meta', 'meta': meta})
+
+    def add(self, file):
+        """登记待处理文件"""
+        with self._lock:
+            if file not in self.files:
+                self.files[file] = 'pending'
+                self._append({'event': 'file', 'file': file, 'status': 'pending'})
+
+    def mark(self, file, status, error=None):
+        """
+        记录文件处理结果
+
+        Args:
+            file: 文件标识
+            status: success 或 failed
+            error: 失败原因
+        """
+        with self._lock:
+            self.files[file] = status
+            record = {'event': 'file', 'file': file, 'status': status}
+            if error:
+                self.errors[file] = error
+                record['error'] = error
+            self._append(record)
+
+    def finish(self, status):
+        """
+        记录批次结束状态
+
+        Args:
+            status: completed 或 cancelled
+        """
+        with self._lock:
+            self.status = status
+            self._append({'event': 'status', 'status': status})
+
+    def is_done(self, file):
+        """文件是否已成功处理"""
+        return self.files.get(file) == 'success'
+
+    def pending_files(self):
+        """获取尚未成功处理的文件（包括失败的文件，续传时重试）"""
+        return [f for f, status in self.files.items() if status != 'success']
+
+    def summary(self):
+        """获取批次状态摘要"""
+        counts = {'pending': 0, 'success': 0, 'failed': 0}
+        for status in self.files.values():
+            counts[status] = counts.get(status, 0) + 1
+        return {
+            'batch_id': self.batch_id,
+            'status': self.status,
+            'meta': self.meta,
+            'total': len(self.files),
+            'success_count': counts['success'],
+            'failed_count': counts['failed'],
+            'pending_count': counts['pending'],
+            'pending_files': self.pending_files(),
+            'errors': self.errors,
+        }
+
+
+class BatchRunner:
+    """
+    批处理运行器
+
+    在后台线程中逐个处理文件，并通过队列向调用方推送进度事件。调用方（SSE 生成器）
+    在等待期间定期收到心跳事件，写出心跳即可及时发现客户端断开；断开后调用 cancel()，
+    后台线程会在当前文件的下一个 OCR 调用前停止，剩余文件不再处理。
+    """
+
+    _DONE = object()
+
+    def __init__(self, handler, sources, tracker=None, total=None, heartbeat_interval=5):
+        """
+        初始化运行器
+
+        Args:
+            handler: 处理函数，签名为 handler(source, cancel_event)，返回识别结果
+            sources: 待处理的文件可迭代对象
+            tracker: BatchTracker 实例，用于记录进度
+            total: 文件总数，未知时为 None
+            heartbeat_interval: 心跳间隔（秒）
+        """
+        self.handler = handler
+        self.sources = sources
+        self.tracker = tracker
+        self.total = total
+        self.heartbeat_interval = heartbeat_interval
+        self.cancel_event = threading.Event()
+        self.results = []
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        """启动后台处理线程"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """取消剩余的处理任务"""
+        self.cancel_event.set()
+    
+    def join(self, timeout=None):
+        """等待后台线程结束（当前文件会在下一次 OCR 前停止）"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def emit(self, event):
+        """向调用方推送一条自定义事件"""
+        self._queue.put(event)
+
+    def _progress(self, idx, source, status, error=None):
+        event = {
+            'type': 'progress',
+            'current': idx,
+            'total': self.total,
+            'percent': int((idx / self.total) * 100) if self.total else None,
+            'file': Path(str(source)).name,
+            'status': status,
+        }
+        if error:
+            event['error'] = error
+        self.emit(event)
+
+    def _run(self):
+        """后台线程：逐个处理文件"""
+        cancelled = False
+        try:
+            idx = 0
+            for source in self.sources:
+                if self.cancel_event.is_set():
+                    cancelled = True
+                    break
+                idx += 1
+                label = str(source)
+                if self.tracker:
+                    self.tracker.add(label)
+
+                self._progress(idx, source, 'processing')
+                try:
+                    result = self.handler(source, self.cancel_event)
+                except BatchCancelled:
+                    cancelled = True
+                    break
+                except Exception as e:
+                    self.results.append({
+                        'success': False,
+                        'file': label,
+                        'error': str(e),
+                        'index': idx,
+                        'total': self.total
+                    })
+                    if self.tracker:
+                        self.tracker.mark(label, 'failed', str(e))
+                    self._progress(idx, source, 'failed', str(e))
+                    continue
+
+                self.results.append({
+                    'success': True,
+                    'file': label,
+                    'result': result,
+                    'index': idx,
+                    'total': self.total
+                })
+                if self.tracker:
+                    self.tracker.mark(label, 'success')
+                self._progress(idx, source, 'success')
+        except Exception as e:
+            self.emit({'type': 'error', 'message': f'处理失败: {str(e)}'})
+        finally:
+            cancelled = cancelled or self.cancel_event.is_set()
+            if self.tracker:
+                self.tracker.finish('cancelled' if cancelled else 'completed')
+            if cancelled:
+                print(f"⚠️ 批处理已取消，已完成 {len(self.results)} 个文件")
+            else:
+                self.emit({
+                    'type': 'complete',
+                    'batch_id': self.tracker.batch_id if self.tracker else None,
+                    'total': len(self.results),
+                    'success_count': sum(1 for r in self.results if r['success']),
+                    'failed_count': sum(1 for r in self.results if not r['success']),
+                    'data': self.results
+                })
+            self._queue.put(self._DONE)
+
+    def events(self):
+        """
+        获取进度事件
+
+        Yields:
+            dict: 进度事件；等待超过心跳间隔时产生 {'type': 'heartbeat'}
+        """
+        while True:
+            try:
+                event = self._queue.get(timeout=self.heartbeat_interval)
+            except queue.Empty:
+                yield {'type': 'heartbeat'}
+                continue
+            if event is self._DONE:
+                return
+            yield event
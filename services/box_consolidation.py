@@ -0,0 +1,123 @@
+"""
+检测框合并 - OCR 之前去掉重复和无用的检测框，减少 OCR 调用
+
+YOLO 以 conf=0.1、iou=0.1 检测时同一类别常有多个重叠的框，每个框都会单独 OCR 一次：
+- 同一类别中重叠的框合并为外接矩形，只 OCR 一次（拆开识别的文字行也能完整读取）
+- 发票号码、开票日期等表头字段每张发票只有一个，只保留置信度最高的框
+- buyer、seller 是包含购买方、销售方各字段的区域框，识别结果不使用，不 OCR
+"""
+
+
+# 不读取文字的区域类别
+SKIP_CLASSES = ('buyer', 'seller')
+
+# 每个类别最多保留的框数（未列出的类别不限制，如明细列）
+MAX_BOXES_PER_CLASS = {
+    'invoice_code': 1,
+    'invoice_number': 1,
+    'invoice_date': 1,
+    'check_code': 1,
+    'seller_name': 1,
+    'seller_tax_id': 1,
+    'seller_bank_account': 1,
+    'seller_address_phone': 1,
+    'buyer_name': 1,
+    'buyer_tax_id': 1,
+    'buyer_bank_account': 1,
+    'buyer_address_phone': 1,
+    'total_amount': 1,
+}
+
+
+def _area(box):
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+
+def overlap_ratio(a, b):
+    """
+    两个框的交集占较小框面积的比例（小框落在大框内时为 1，IoU 在这种情况下很小）
+
+    Args:
+        a, b: [x1, y1, x2, y2]
+    """
+    intersection = _area([max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])])
+    smaller = min(_area(a), _area(b))
+    return intersection / smaller if smaller > 0 else 0.0
+
+
+def _merge_overlapping(boxes, min_overlap):
+    """
+    反复合并重叠的框，直到没有可合并的框（合并后的外接矩形可能与其他框重叠）
+
+    Args:
+        boxes: [(confidence, [x1, y1, x2, y2])]，同一类别
+
+    Returns:
+        tuple: (合并后的框列表, 合并掉的框数)
+    """
+    merged = [(confidence, list(bbox)) for confidence, bbox in boxes]
+    count = 0
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                if overlap_ratio(merged[i][1], merged[j][1]) >= min_overlap:
+                    (conf_a, a), (conf_b, b) = merged[i], merged[j]
+                    merged[i] = (max(conf_a, conf_b),
+                                 [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])])
+                    del merged[j]
+                    count += 1
+                    changed = True
+                    break
+            if changed:
+                break
+    return merged, count
+
+
+def consolidate_boxes(boxes, min_overlap=0.3, max_per_class=None, merge=True):
+    """
+    合并检测框
+
+    Args:
+        boxes: [(class_name, confidence, [x1, y1, x2, y2])]
+        min_overlap: 合并的最小重叠比例（见 overlap_ratio）
+        max_per_class: 每个类别最多保留的框数，默认为 MAX_BOXES_PER_CLASS
+        merge: 为 False 时只跳过区域类别，不合并、不限制数量
+
+    Returns:
+        tuple: (合并后的框列表（按置信度从高到低）, 统计 {'boxes', 'skipped', 'merged', 'dropped', 'ocr_calls_saved'})
+    """
+    if max_per_class is None:
+        max_per_class = MAX_BOXES_PER_CLASS
+
+    by_class = {}
+    skipped = 0
+    for class_name, confidence, bbox in boxes:
+        if class_name in SKIP_CLASSES:
+            skipped += 1
+            continue
+        by_class.setdefault(class_name, []).append((confidence, bbox))
+
+    kept = []
+    merged_count = 0
+    dropped = 0
+    for class_name, class_boxes in by_class.items():
+        if merge:
+            class_boxes, count = _merge_overlapping(class_boxes, min_overlap)
+            merged_count += count
+            class_boxes.sort(key=lambda item: item[0], reverse=True)
+            limit = max_per_class.get(class_name)
+            if limit is not None and len(class_boxes) > limit:
+                dropped += len(class_boxes) - limit
+                class_boxes = class_boxes[:limit]
+        kept.extend((class_name, confidence, bbox) for confidence, bbox in class_boxes)
+
+    kept.sort(key=lambda item: item[1], reverse=True)
+    return kept, {
+        'boxes': len(boxes),
+        'skipped': skipped,
+        'merged': merged_count,
+        'dropped': dropped,
+        'ocr_calls_saved': len(boxes) - len(kept),
+    }
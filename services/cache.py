@@ -0,0 +1,160 @@
+"""
+读缓存 - 发票查询接口的响应缓存
+
+默认使用进程内 LRU + TTL 缓存；多进程部署（多个 gunicorn worker、单独的识别 worker）时
+可配置 CACHE_BACKEND=redis 使用共享的本地缓存进程，写入发票时的失效在所有进程中生效。
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis 为可选依赖，仅使用共享缓存时需要
+    redis = None
+
+
+class LRUCache:
+    """进程内 LRU 缓存，条目超过 ttl 秒后失效"""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        # 计数器单独保存，不参与 LRU 淘汰
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        """计数器加一（不过期），用于使一组缓存条目整体失效"""
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+
+class RedisCache:
+    """基于 Redis 的共享缓存，值以 JSON 保存"""
+
+    def __init__(self, url, ttl=60, prefix='invoice-cache:'):
+        if redis is None:
+            raise ValueError("使用 Redis 缓存需要安装 redis: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=int(ttl or self.ttl))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def get_counter(self, key):
+        value = self.client.get(self.prefix + key)
+        return int(value) if value is not None else 0
+
+
+class NullCache:
+    """不缓存（CACHE_BACKEND=none）"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def incr(self, key):
+        return 0
+
+    def get_counter(self, key):
+        return 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """根据配置创建（或返回已创建的）缓存实例"""
+    global _cache
+    if _cache is None:
+        from config import Config
+        with _cache_lock:
+            if _cache is None:
+                if Config.CACHE_BACKEND == 'redis':
+                    _cache = RedisCache(Config.CACHE_URL, ttl=Config.CACHE_TTL)
+                elif Config.CACHE_BACKEND == 'none':
+                    _cache = NullCache()
+                else:
+                    _cache = LRUCache(Config.CACHE_MAX_ENTRIES, ttl=Config.CACHE_TTL)
+    return _cache
+
+
+# 发票缓存的版本号：任何发票写入都会使其加一，列表和详情的缓存键中带有版本号，旧条目自然失效
+LIST_VERSION_KEY = 'invoices:version'
+
+
+def invoice_detail_key(invoice_id, fields=''):
+    """
+    发票详情的缓存键
+
+    键中带有版本号：查询前生成的键在查询期间发生写入时即已失效，查询到的旧数据不会在新版本下被缓存。
+    """
+    return f'invoice:{invoice_id}:v{get_cache().get_counter(LIST_VERSION_KEY)}:{fields}'
+
+
+def invoice_list_key(query_string):
+    return f'invoices:v{get_cache().get_counter(LIST_VERSION_KEY)}:{query_string}'
+
+
+def invalidate_invoice(invoice_id):
+    """
+    使发票的缓存失效（写入或删除发票后调用）
+
+    版本号加一后，所有列表和详情条目整体失效（旧条目在 TTL 后过期）。
+
+    Args:
+        invoice_id: 发票 ID
+    """
+    try:
+        get_cache().incr(LIST_VERSION_KEY)
+    except Exception as e:
+        # 缓存不可用不影响写入，条目会在 TTL 后过期
+        print(f"⚠️ 缓存失效失败: {e}")
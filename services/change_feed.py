@@ -0,0 +1,139 @@
+"""
+变更订阅 - 按 (updated_at, id) 游标增量读取新增、修改和删除的发票
+
+游标记录两个位置：发票表的 (updated_at, id) 和删除记录表的 (deleted_at, id)。每次读取从游标之后
+按时间顺序返回变更，查询走对应的复合索引，代价只与变更数量有关，与发票总数无关。
+"""
+import base64
+import json
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from model import Invoice, InvoiceTombstone
+
+
+def encode_feed_cursor(position):
+    """将位置 {'u': (updated_at, id), 'd': (deleted_at, id)} 编码为游标"""
+    payload = {k: [v[0].isoformat(), v[1]] for k, v in position.items() if v is not None}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+def decode_feed_cursor(cursor):
+    """
+    解析游标
+
+    Returns:
+        dict: {'u': (updated_at, id) 或 None, 'd': (deleted_at, id) 或 None}
+
+    Raises:
+        ValueError: 游标格式无效
+    """
+    position = {'u': None, 'd': None}
+    if not cursor:
+        return position
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        for key in position:
+            if key in payload:
+                position[key] = (datetime.fromisoformat(payload[key][0]), int(payload[key][1]))
+    except (ValueError, KeyError, TypeError, IndexError) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+    return position
+
+
+def _after(time_column, id_column, position):
+    """(time, id) > position"""
+    if position is None:
+        return None
+    ts, last_id = position
+    return or_(time_column > ts, and_(time_column == ts, id_column > last_id))
+
+
+def read_changes(db, position, limit, settle_seconds=1.0):
+    """
+    读取游标之后的变更
+
+    只返回 settle_seconds 之前的变更：写入时间早但提交较晚的事务在提交前不可见，
+    留出一段时间可以避免游标越过这些记录而漏读。
+
+    Args:
+        db: 数据库会话
+        position: decode_feed_cursor 的返回值
+        limit: 最多返回的变更数
+        settle_seconds: 稳定等待时间（秒）
+
+    Returns:
+        tuple: ([(时间, 'upsert', Invoice) 或 (时间, 'delete', InvoiceTombstone)], 新位置)
+    """
+    horizon = datetime.now() - timedelta(seconds=settle_seconds)
+
+    query = db.query(Invoice).filter(Invoice.updated_at <= horizon)
+    condition = _after(Invoice.updated_at, Invoice.id, position['u'])
+    if condition is not None:
+        query = query.filter(condition)
+    invoices = query.order_by(Invoice.updated_at, Invoice.id).limit(limit).all()
+
+    query = db.query(InvoiceTombstone).filter(InvoiceTombstone.deleted_at <= horizon)
+    condition = _after(InvoiceTombstone.deleted_at, InvoiceTombstone.id, position['d'])
+    if condition is not None:
+        query = query.filter(condition)
+    tombstones = query.order_by(InvoiceTombstone.deleted_at, InvoiceTombstone.id).limit(limit).all()
+
+    # 合并两路变更并按时间排序，只取前 limit 条，游标分别推进到各自最后返回的记录
+    changes = [(i.updated_at, 'upsert', i) for i in invoices] + \
+              [(t.deleted_at, 'delete', t) for t in tombstones]
+    changes.sort(key=lambda c: (c[0], c[1], c[2].id))
+    changes = changes[:limit]
+
+    position = dict(position)
+    for ts, op, record in changes:
+        position['u' if op == 'upsert' else 'd'] = (ts, record.id)
+    return changes, position
+
+
+def wait_for_changes(session_factory, position, limit, wait_seconds, serialize,
+                     settle_seconds=1.0, poll_interval=1.0):
+    """
+    长轮询：没有变更时每隔 poll_interval 秒重新查询，直到有变更或等待超时
+
+    Args:
+        session_factory: 数据库会话工厂
+        position: 游标位置
+        limit: 最多返回的变更数
+        wait_seconds: 最长等待时间（秒），为 0 时立即返回
+        serialize: 将 Invoice 转换为字典的函数（在会话关闭前调用）
+        settle_seconds: 稳定等待时间（秒）
+        poll_interval: 轮询间隔（秒）
+
+    Returns:
+        tuple: (变更字典列表, 新位置)
+    """
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        db = session_factory()
+        try:
+            changes, new_position = read_changes(db, position, limit, settle_seconds)
+            if changes or time.monotonic() >= deadline:
+                return [_change_dict(ts, op, record, serialize) for ts, op, record in changes], new_position
+        finally:
+            db.close()
+        time.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+
+
+def _change_dict(ts, op, record, serialize):
+    if op == 'delete':
+        return {
+            'op': 'delete',
+            'id': record.invoice_id,
+            'image_name': record.image_name,
+            'changed_at': ts.isoformat()
+        }
+    return {
+        'op': 'upsert',
+        'id': record.id,
+        'image_name': record.image_name,
+        'changed_at': ts.isoformat(),
+        'invoice': serialize(record)
+    }
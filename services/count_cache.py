@@ -0,0 +1,70 @@
+"""
+计数缓存 - 缓存代价较高的 COUNT(*) 结果，过期后在后台线程刷新
+"""
+import threading
+import time
+
+
+class CachedCount:
+    """
+    带过期时间的计数缓存
+
+    首次获取时同步计算；之后缓存过期时立即返回旧值，同时在后台线程重新计数，
+    请求不会因为大表的 COUNT(*) 而阻塞。
+    """
+
+    def __init__(self, count_func):
+        """
+        初始化计数缓存
+
+        Args:
+            count_func: 计算总数的函数（在后台线程中调用，需自行管理数据库会话）
+        """
+        self.count_func = count_func
+        self._value = None
+        self._updated_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            value = self.count_func()
+            with self._lock:
+                self._value = value
+                self._updated_at = time.monotonic()
+        except Exception as e:
+            print(f"⚠️ 刷新计数失败: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self, ttl):
+        """
+        获取计数
+
+        Args:
+            ttl: 缓存有效时间（秒）
+
+        Returns:
+            int: 计数（可能是 ttl 之前的值）
+        """
+        with self._lock:
+            value = self._value
+            stale = time.monotonic() - self._updated_at > ttl
+            start_refresh = value is not None and stale and not self._refreshing
+            if start_refresh:
+                self._refreshing = True
+
+        if value is None:
+            value = self.count_func()
+            with self._lock:
+                self._value = value
+                self._updated_at = time.monotonic()
+        elif start_refresh:
+            threading.Thread(target=self._refresh, daemon=True).start()
+        return value
+
+    def invalidate(self):
+        """使缓存过期，下次获取时在后台刷新"""
+        with self._lock:
+            self._updated_at = 0
@@ -0,0 +1,182 @@
+"""
+自适应检测尺寸 - 按图像宽高比选择 YOLO 的矩形输入尺寸
+
+自适应模式按宽高比分桶，每个桶的输入尺寸与 imgsz x imgsz 面积相近、宽高比接近发票、边长按步长对齐。
+两类模型的效果不同：
+
+- 导出的固定尺寸模型（ONNX、TensorRT 等）只接受导出时的尺寸，默认的 640x640 正方形输入中，
+  增值税发票（约 1.6:1）有三分之一以上是填充。按桶导出（utils/export_buckets.py，文件名为
+  <模型名>_<高>x<宽>.<扩展名>，放在 DETECT_BUCKET_MODEL_DIR 目录中）后计算量相近，填充更少，长边分到更多像素。
+- .pt 模型在 predict 时默认启用 rect，LetterBox(auto=True) 只填充到步长的整数倍，1.6:1 的发票本来就以约
+  416x640 输入，没有多余的填充。自适应模式相当于提高分辨率（480x832 的计算量约为 1.5 倍），
+  小字段分到更多像素，但检测更慢。
+
+自适应模式下同一个 .pt 模型的 imgsz 每次都可能不同，而 Model.predict 把参数写入共享的 predictor.args，
+并发调用时可能使用另一张图像的尺寸，因此对默认模型的调用串行执行（见 DetectShapeSelector.predict）。
+"""
+import math
+import re
+import threading
+from pathlib import Path
+
+
+# 桶模型文件名中的尺寸：best_480x832.onnx、best_480x832_openvino_model
+BUCKET_NAME_PATTERN = re.compile(r'_(\d+)x(\d+)(?:\.[^.]+|_\w+_model)$')
+
+
+def _align(value, stride):
+    return max(stride, int(round(value / stride)) * stride)
+
+
+def parse_aspect_ratios(spec):
+    """
+    解析宽高比列表："1,1.41,1.75" -> [1.0, 1.41, 1.75]
+
+    Raises:
+        ValueError: 格式错误
+    """
+    ratios = [float(part) for part in str(spec).split(',') if part.strip()]
+    if not ratios or any(r <= 0 for r in ratios):
+        raise ValueError(f"无效的宽高比列表: {spec}")
+    return ratios
+
+
+def bucket_shapes(imgsz=640, aspect_ratios=(1.0, 1.41, 1.75, 2.0), stride=32):
+    """
+    计算各宽高比桶的输入尺寸（横向和纵向各一个），面积与 imgsz x imgsz 相近
+
+    Args:
+        imgsz: 正方形输入的边长
+        aspect_ratios: 宽高比（宽 / 高，大于等于 1）
+        stride: 模型步长，尺寸按步长对齐
+
+    Returns:
+        list: [(高, 宽)]，按宽高比排序，不重复
+    """
+    area = imgsz * imgsz
+    shapes = set()
+    for ratio in aspect_ratios:
+        ratio = max(ratio, 1 / ratio)
+        short = _align(math.sqrt(area / ratio), stride)
+        long = _align(math.sqrt(area * ratio), stride)
+        shapes.add((short, long))
+        shapes.add((long, short))
+    return sorted(shapes, key=lambda shape: shape[1] / shape[0])
+
+
+def choose_shape(height, width, shapes):
+    """
+    选择宽高比最接近的桶（按对数比较，2:1 与 1:2 对称）
+
+    Args:
+        height: 图像高度
+        width: 图像宽度
+        shapes: bucket_shapes 的返回值
+
+    Returns:
+        tuple: (高, 宽)
+    """
+    aspect = math.log(width / height)
+    return min(shapes, key=lambda shape: abs(math.log(shape[1] / shape[0]) - aspect))
+
+
+def find_bucket_models(directory):
+    """
+    查找目录中按桶导出的模型
+
+    Returns:
+        dict: {(高, 宽): 模型路径}
+    """
+    models = {}
+    directory = Path(directory)
+    if not directory.is_dir():
+        return models
+    for path in sorted(directory.iterdir()):
+        match = BUCKET_NAME_PATTERN.search(path.name)
+        if match:
+            models[(int(match.group(1)), int(match.group(2)))] = path
+    return models
+
+
+class DetectShapeSelector:
+    """为每张图像选择检测尺寸和对应的模型"""
+
+    def __init__(self, default_model, imgsz=640, adaptive=False, aspect_ratios=(1.0, 1.41, 1.75, 2.0),
+                 bucket_model_dir=None, stride=32):
+        """
+        Args:
+            default_model: 默认的 YOLO 模型（.pt 可接受任意尺寸）
+            imgsz: 非自适应模式的输入边长，也是自适应模式的目标面积
+            adaptive: 是否按宽高比选择矩形输入尺寸
+            aspect_ratios: 宽高比桶
+            bucket_model_dir: 按桶导出的模型目录，没有对应桶模型时使用默认模型
+            stride: 模型步长
+        """
+        self.default_model = default_model
+        self.imgsz = imgsz
+        self.adaptive = adaptive
+        self.bucket_models = find_bucket_models(bucket_model_dir) if bucket_model_dir else {}
+        # 有导出的桶模型时只使用这些尺寸
+        self.shapes = sorted(self.bucket_models) or bucket_shapes(imgsz, aspect_ratios, stride)
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self._predict_lock = threading.Lock()
+        if adaptive and self.bucket_models:
+            print(f"✅ 找到 {len(self.bucket_models)} 个按宽高比导出的检测模型: "
+                  f"{', '.join(f'{h}x{w}' for h, w in self.shapes)}")
+
+    def select(self, image_shape):
+        """
+        Args:
+            image_shape: 图像数组的 shape（高, 宽, ...）
+
+        Returns:
+            tuple: (YOLO 模型, imgsz)
+        """
+        if not self.adaptive:
+            return self.default_model, self.imgsz
+        shape = choose_shape(image_shape[0], image_shape[1], self.shapes)
+        return self._model_for(shape), list(shape)
+
+    def predict(self, image, **kwargs):
+        """
+        按图像尺寸选择模型和 imgsz 并检测
+
+        自适应模式下默认模型的 imgsz 随图像变化，Model.predict 会把 imgsz 写入共享的 predictor.args，
+        因此串行调用；非自适应模式和按桶导出的模型的 imgsz 固定，不加锁。
+
+        Args:
+            image: BGR 格式的图像数组
+            **kwargs: 传给 YOLO.predict 的其他参数
+
+        Returns:
+            list: YOLO 的检测结果
+        """
+        model, imgsz = self.select(image.shape)
+        if self.adaptive and model is self.default_model:
+            with self._predict_lock:
+                return model.predict(source=image, imgsz=imgsz, **kwargs)
+        return model.predict(source=image, imgsz=imgsz, **kwargs)
+
+    def _model_for(self, shape):
+        path = self.bucket_models.get(shape)
+        if path is None:
+            return self.default_model
+        if shape not in self._loaded:
+            from ultralytics import YOLO
+            with self._lock:
+                if shape not in self._loaded:
+                    self._loaded[shape] = YOLO(str(path), task='detect')
+        return self._loaded[shape]
+
+
+def create_shape_selector(default_model):
+    """根据配置创建检测尺寸选择器"""
+    from config import Config
+    return DetectShapeSelector(
+        default_model,
+        imgsz=Config.DETECT_IMGSZ,
+        adaptive=Config.DETECT_ADAPTIVE,
+        aspect_ratios=parse_aspect_ratios(Config.DETECT_ASPECT_RATIOS),
+        bucket_model_dir=Config.DETECT_BUCKET_MODEL_DIR or None
+    )
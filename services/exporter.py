@@ -0,0 +1,314 @@
+"""
+发票导出 - 以服务端游标流式读取发票，边读边输出 CSV / JSONL / Parquet，内存占用与导出行数无关
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from model import Invoice
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖，仅导出 Parquet 时需要
+    pa = None
+    pq = None
+
+
+# 可导出的字段及其类型
+EXPORT_FIELDS = {
+    'id': 'int',
+    'image_name': 'text',
+    'detection_count': 'int',
+    'created_at': 'datetime',
+    'updated_at': 'datetime',
+    'invoice_code': 'text',
+    'invoice_number': 'text',
+    'invoice_date': 'text',
+    'invoice_date_value': 'date',
+    'seller_name': 'text',
+    'seller_tax_id': 'text',
+    'seller_bank_account': 'text',
+    'seller_address_phone': 'text',
+    'buyer_name': 'text',
+    'buyer_tax_id': 'text',
+    'buyer_bank_account': 'text',
+    'buyer_address_phone': 'text',
+    'item_name': 'text_list',
+    'specification': 'text',
+    'unit': 'text_list',
+    'quantity': 'number_list',
+    'unit_price': 'number_list',
+    'amount': 'number_list',
+    'tax_rate': 'number_list',
+    'tax_amount': 'number_list',
+    'total_amount': 'text',
+    'total_amount_value': 'decimal',
+    'check_code': 'text',
+}
+
+# 未指定字段时导出的默认字段（不含查询用的派生字段）
+DEFAULT_EXPORT_FIELDS = [f for f in EXPORT_FIELDS if f not in ('invoice_date_value', 'total_amount_value')]
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def parse_fields(fields):
+    """
+    解析导出字段
+
+    Args:
+        fields: 逗号分隔的字符串或列表，为空时使用默认字段
+
+    Returns:
+        list: 字段列表
+
+    Raises:
+        ValueError: 包含不支持的字段
+    """
+    if not fields:
+        return list(DEFAULT_EXPORT_FIELDS)
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    fields = [f.strip() for f in fields if f.strip()]
+    unknown = [f for f in fields if f not in EXPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"不支持的导出字段: {', '.join(unknown)}")
+    return fields
+
+
+def check_export_format(export_format):
+    """
+    检查导出格式是否可用
+
+    Raises:
+        ValueError: 不支持的格式，或导出 Parquet 但未安装 pyarrow
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {export_format}（可选 {', '.join(EXPORT_FORMATS)}）")
+    if export_format == 'parquet' and pa is None:
+        raise ValueError("导出 Parquet 需要安装 pyarrow: pip install pyarrow")
+
+
+def build_export_query(db, fields, date_from=None, date_to=None, seller_tax_id=None):
+    """
+    构建导出查询（只查询所选字段）
+
+    Args:
+        db: 数据库会话
+        fields: 字段列表
+        date_from: 开票日期起（date，包含）
+        date_to: 开票日期止（date，包含）
+        seller_tax_id: 销售方纳税人识别号（已规范化）
+
+    Returns:
+        Query: 按 id 排序的查询
+    """
+    query = db.query(*[getattr(Invoice, f) for f in fields])
+    if date_from:
+        query = query.filter(Invoice.invoice_date_value >= date_from)
+    if date_to:
+        query = query.filter(Invoice.invoice_date_value <= date_to)
+    if seller_tax_id:
+        query = query.filter(Invoice.seller_tax_id_key == seller_tax_id)
+    return query.order_by(Invoice.id)
+
+
+def iter_rows(query, batch_size=1000):
+    """
+    以服务端游标分批读取查询结果
+
+    yield_per 使 MySQL 使用流式游标（不把整个结果集读入客户端内存），每次只缓存 batch_size 行。
+
+    Yields:
+        tuple: 查询结果行
+    """
+    yield from query.execution_options(yield_per=batch_size)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ';'.join(str(v) for v in value if v is not None)
+    return _json_value(value)
+
+
+def iter_csv(rows, fields):
+    """
+    输出 CSV（带 BOM，Excel 可直接打开中文），列表字段用分号连接
+
+    Yields:
+        str: CSV 文本块
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(fields)
+    for index, row in enumerate(rows, 1):
+        writer.writerow([_csv_value(v) for v in row])
+        if index % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_jsonl(rows, fields):
+    """
+    输出 JSON Lines，每行一张发票
+
+    Yields:
+        str: JSONL 文本块
+    """
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({f: _json_value(v) for f, v in zip(fields, row)}, ensure_ascii=False))
+        if len(lines) >= 500:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+class _ChunkSink(io.RawIOBase):
+    """只写的文件对象，写入的数据暂存在内存中，由调用方取走"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_type(kind):
+    return {
+        'int': pa.int64(),
+        'text': pa.string(),
+        'datetime': pa.timestamp('us'),
+        'date': pa.date32(),
+        'decimal': pa.decimal128(14, 2),
+        'number_list': pa.list_(pa.float64()),
+        'text_list': pa.list_(pa.string()),
+    }[kind]
+
+
+def _parquet_value(kind, value):
+    if kind == 'number_list':
+        numbers = []
+        for v in _as_list(value):
+            try:
+                numbers.append(float(v))
+            except (TypeError, ValueError):
+                continue
+        return numbers or None
+    if kind == 'text_list':
+        return [str(v) for v in _as_list(value)] or None
+    if kind == 'text' and value is not None and not isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def iter_parquet(rows, fields, row_group_size=50000):
+    """
+    输出 Parquet（列式，zstd 压缩），每 row_group_size 行写一个行组
+
+    Yields:
+        bytes: Parquet 文件数据块
+    """
+    check_export_format('parquet')
+
+    kinds = [EXPORT_FIELDS[f] for f in fields]
+    schema = pa.schema([(f, _parquet_type(k)) for f, k in zip(fields, kinds)])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def flush(columns):
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(values, type=schema.field(i).type) for i, values in enumerate(columns)],
+            schema=schema
+        ))
+        return sink.drain()
+
+    columns = [[] for _ in fields]
+    count = 0
+    for row in rows:
+        for i, (kind, value) in enumerate(zip(kinds, row)):
+            columns[i].append(_parquet_value(kind, value))
+        count += 1
+        if count >= row_group_size:
+            yield flush(columns)
+            columns = [[] for _ in fields]
+            count = 0
+    if count:
+        yield flush(columns)
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(rows, fields, export_format):
+    """
+    按格式输出导出数据
+
+    Args:
+        rows: 查询结果行迭代器
+        fields: 字段列表
+        export_format: 'csv'、'jsonl' 或 'parquet'
+
+    Yields:
+        bytes: 数据块
+    """
+    if export_format == 'parquet':
+        yield from iter_parquet(rows, fields)
+        return
+    chunks = iter_csv(rows, fields) if export_format == 'csv' else iter_jsonl(rows, fields)
+    for chunk in chunks:
+        if chunk:
+            yield chunk.encode('utf-8')
+
+
+def gzip_chunks(chunks, level=6):
+    """流式 gzip 压缩"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
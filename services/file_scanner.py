@@ -0,0 +1,115 @@
+"""
+目录扫描 - 使用 os.scandir 惰性遍历（可递归）目录树，边扫描边产出待处理文件
+"""
+import hashlib
+import os
+from fnmatch import fnmatchcase
+from pathlib import PurePosixPath
+
+
+# image_name 同时用作结果文件名，子目录中的文件用此分隔符连接相对路径的各部分
+IMAGE_NAME_SEPARATOR = '__'
+# image_name 的最大长度（数据库列为 255，多页 PDF 还要加 _p<页码>）
+MAX_IMAGE_NAME_LENGTH = 200
+
+
+def _as_patterns(patterns):
+    """将 include/exclude 参数统一为小写的模式列表"""
+    if not patterns:
+        return []
+    if isinstance(patterns, str):
+        patterns = [p for p in patterns.split(',')]
+    return [p.strip().lower() for p in patterns if p and p.strip()]
+
+
+def _matches(rel_path, name, patterns):
+    """相对路径或文件名匹配任一模式（不区分大小写）"""
+    rel_path = rel_path.lower()
+    name = name.lower()
+    return any(fnmatchcase(rel_path, p) or fnmatchcase(name, p) for p in patterns)
+
+
+def path_image_name(rel_path):
+    """
+    由相对路径生成 image_name：2024/01/A/0001.jpg -> 2024__01__A__0001
+
+    按年/月/网点归档的目录中同名文件很常见，以相对路径命名后不会互相覆盖发票记录和结果文件；
+    根目录中的文件仍为不含扩展名的文件名。超长时保留末尾部分，并以完整路径的哈希开头。
+
+    Args:
+        rel_path: 以 / 分隔的相对路径（压缩包成员路径同样适用，其中的 .. 和空段被忽略）
+
+    Raises:
+        ValueError: 路径为空
+    """
+    parts = [part for part in rel_path.replace('\\', '/').split('/') if part not in ('', '.', '..')]
+    if not parts:
+        raise ValueError(f"无效的文件路径: {rel_path}")
+    parts[-1] = PurePosixPath(parts[-1]).stem
+    name = IMAGE_NAME_SEPARATOR.join(parts)
+    if len(name) > MAX_IMAGE_NAME_LENGTH:
+        digest = hashlib.sha1(rel_path.encode('utf-8')).hexdigest()[:12]
+        tail = name[-(MAX_IMAGE_NAME_LENGTH - len(digest) - len(IMAGE_NAME_SEPARATOR)):]
+        name = f"{digest}{IMAGE_NAME_SEPARATOR}{tail}"
+    return name
+
+
+def relative_image_name(path, root):
+    """扫描目录中文件的 image_name（见 path_image_name）"""
+    return path_image_name(os.path.relpath(path, root).replace(os.sep, '/'))
+
+
+def iter_invoice_files(root, extensions, include=None, exclude=None, recursive=True):
+    """
+    惰性遍历目录，产出扩展名符合要求的文件路径
+
+    不会预先构建完整的文件列表：每个目录读取后立即产出其中的文件，子目录按深度优先
+    继续遍历，内存占用只与单个目录的大小有关。同一目录内按名称排序，保证多次运行顺序一致。
+
+    Args:
+        root: 根目录
+        extensions: 允许的扩展名集合（不含点，不区分大小写），如 {'png', 'jpg', 'pdf'}
+        include: glob 模式（列表或逗号分隔的字符串），匹配相对路径或文件名；为空时包含所有文件
+        exclude: glob 模式，匹配的文件被跳过，匹配的目录整个跳过
+        recursive: 是否遍历子目录
+
+    Yields:
+        str: 文件路径
+    """
+    extensions = {e.lower().lstrip('.') for e in extensions}
+    include = _as_patterns(include)
+    exclude = _as_patterns(exclude)
+
+    stack = [(str(root), '')]
+    while stack:
+        directory, rel_dir = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"⚠️ 无法读取目录 {directory}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and not _matches(rel_path, entry.name, exclude):
+                        subdirs.append((entry.path, rel_path))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if '.' not in entry.name or entry.name.rsplit('.', 1)[1].lower() not in extensions:
+                continue
+            if include and not _matches(rel_path, entry.name, include):
+                continue
+            if exclude and _matches(rel_path, entry.name, exclude):
+                continue
+            yield entry.path
+
+        # 逆序入栈，使子目录按名称顺序遍历
+        stack.extend(reversed(subdirs))
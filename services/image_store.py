@@ -0,0 +1,378 @@
+"""
+原图存储 - 按内容哈希保存上传的原始图像
+
+文件保存在 <IMAGE_STORE_DIR>/<sha256 前两位>/<第三、四位>/<sha256>/<文件名>，目录名为原始字节的 SHA-256：
+- 相同内容重复上传只保存一份，不同文件名通过硬链接指向同一份数据
+- 同名但内容不同的文件在不同的目录中，不会互相覆盖
+- 文件名（不含扩展名）仍是客户端的文件名；已有内容不同的同名发票时，识别结果的 image_name
+  加上哈希后缀（见 utils.upload_image_name），不会覆盖之前的发票记录
+- 发票记录保存 image_sha256，按哈希直接定位原图，不需要扫描目录
+
+后台压缩任务把 PNG、BMP、TIFF 原图转换为无损 WebP（解码后的像素完全一致才替换），
+可选把 JPEG 转换为高质量 WebP（IMAGE_COMPACT_JPEG_QUALITY）。压缩后目录名仍是原始字节的哈希，
+相同原图再次上传时仍然命中。
+"""
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能单进程压缩同一存储目录
+    fcntl = None
+
+
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# 无损压缩的原图格式
+LOSSLESS_SOURCE_EXTENSIONS = {'.png', '.bmp', '.tif', '.tiff'}
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+
+# 文件名的最大字节数（大多数文件系统限制为 255）
+MAX_NAME_BYTES = 200
+
+
+def client_filename(filename, sha256):
+    """
+    保存时使用的文件名：保留客户端文件名（包括中文），只去掉路径部分
+
+    secure_filename 会删除所有非 ASCII 字符，"发票.jpg" 会变成 "jpg"，不同文件得到相同的 image_name。
+    去掉路径后文件名（不含扩展名）为空时使用 <sha256><扩展名>；扩展名始终保留（PDF、OFD 按扩展名识别）。
+
+    Args:
+        filename: 客户端文件名
+        sha256: 文件内容哈希
+
+    Returns:
+        str: 文件名
+    """
+    name = Path(str(filename or '').replace('\\', '/')).name.replace('\x00', '')
+    stem, dot, ext = name.rpartition('.')
+    if not dot:
+        stem, ext = name, ''
+    suffix = f".{ext}" if ext else ''
+    # 以点开头的文件在查找时被忽略（视为临时文件）
+    stem = stem.strip().lstrip('.').strip()
+    while len(stem.encode('utf-8')) > MAX_NAME_BYTES:
+        stem = stem[:-1]
+    return (stem or sha256) + suffix
+
+
+class ImageStore:
+    """按内容哈希保存原图"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = self.root / 'tmp'
+        self.tmp_dir.mkdir(exist_ok=True)
+        self._lock_fd = None
+
+    def object_dir(self, sha256):
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    # ---------- 写入 ----------
+
+    def put_stream(self, stream, filename, chunk_size=1024 * 1024):
+        """
+        保存上传的文件流（边写入临时文件边计算哈希）
+
+        Args:
+            stream: 可读的文件对象（如 Flask FileStorage.stream）
+            filename: 客户端文件名
+
+        Returns:
+            tuple: (保存路径, sha256)
+        """
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._ingest(tmp_path, digest.hexdigest(), filename)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def put_bytes(self, data, filename):
+        """
+        保存内存中的文件内容
+
+        Returns:
+            tuple: (保存路径, sha256)
+        """
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        try:
+            tmp_path.write_bytes(data)
+            return self._ingest(tmp_path, hashlib.sha256(data).hexdigest(), filename)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def put_file(self, path, filename=None, chunk_size=1024 * 1024):
+        """
+        把已保存到本地的文件移入存储（源文件被移动或删除）
+
+        Args:
+            path: 文件路径（需与存储目录在同一文件系统，如 tmp_dir 下）
+            filename: 客户端文件名，默认为源文件名
+
+        Returns:
+            tuple: (保存路径, sha256)
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        try:
+            return self._ingest(Path(path), digest.hexdigest(), filename or Path(path).name)
+        finally:
+            Path(path).unlink(missing_ok=True)
+
+    def _ingest(self, tmp_path, sha256, filename):
+        """把临时文件移入哈希目录；内容已存在时链接到已有文件，临时文件由调用方删除"""
+        name = client_filename(filename, sha256)
+        object_dir = self.object_dir(sha256)
+        existing = self._files(object_dir)
+
+        if existing:
+            # 已压缩过的原图保存为 WebP，新文件名使用实际保存的格式
+            suffix = Path(name).suffix
+            if existing[0].suffix == '.webp' and suffix.lower() in LOSSLESS_SOURCE_EXTENSIONS | JPEG_EXTENSIONS:
+                suffix = '.webp'
+            target = object_dir / (Path(name).stem + suffix)
+            if not target.exists():
+                try:
+                    os.link(existing[0], target)
+                except OSError:
+                    shutil.copyfile(existing[0], target)
+            print(f"♻️ 原图已存在，不重复保存: {name} ({sha256[:12]})")
+        else:
+            object_dir.mkdir(parents=True, exist_ok=True)
+            target = object_dir / name
+            os.replace(tmp_path, target)
+        return str(target), sha256
+
+    # ---------- 查找 ----------
+
+    @staticmethod
+    def _files(object_dir):
+        try:
+            return sorted(p for p in object_dir.iterdir() if p.is_file() and not p.name.startswith('.'))
+        except FileNotFoundError:
+            return []
+
+    def locate(self, sha256):
+        """
+        按哈希定位原图
+
+        Returns:
+            str: 原图路径，不存在时返回 None
+        """
+        if not SHA256_PATTERN.match(sha256 or ''):
+            return None
+        files = self._files(self.object_dir(sha256))
+        return str(files[0]) if files else None
+
+    def sha_of(self, path):
+        """
+        存储中文件的内容哈希（即所在目录名）
+
+        Returns:
+            str: sha256，文件不在存储中时返回 None
+        """
+        path = Path(path).absolute()
+        sha256 = path.parent.name
+        if SHA256_PATTERN.match(sha256) and path.parent == self.object_dir(sha256).absolute():
+            return sha256
+        return None
+
+    def resolve(self, path):
+        """
+        存储中的文件被压缩后扩展名会改变，按文件名（不含扩展名）找到当前的文件
+
+        Returns:
+            str: 当前的文件路径（不在存储中或未改变时原样返回）
+        """
+        if os.path.exists(path) or self.sha_of(path) is None:
+            return path
+        path = Path(path)
+        for candidate in self._files(path.parent):
+            if candidate.stem == path.stem:
+                return str(candidate)
+        return str(path)
+
+    def iter_objects(self):
+        """
+        Yields:
+            Path: 哈希目录
+        """
+        for object_dir in sorted(self.root.glob('??/??/*')):
+            if object_dir.is_dir() and SHA256_PATTERN.match(object_dir.name):
+                yield object_dir
+
+    # ---------- 压缩 ----------
+
+    @staticmethod
+    def _encode_compact(path, jpeg_quality):
+        """
+        Returns:
+            bytes: 压缩后的 WebP 内容，不适合压缩或不能减小体积时返回 None
+        """
+        suffix = path.suffix.lower()
+        if suffix not in LOSSLESS_SOURCE_EXTENSIONS and not (jpeg_quality and suffix in JPEG_EXTENSIONS):
+            return None
+
+        original = cv2.imdecode(np.fromfile(str(path), dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if original is None:
+            return None
+        lossless = suffix in LOSSLESS_SOURCE_EXTENSIONS
+        # OpenCV 中 WebP 质量大于 100 表示无损
+        quality = 101 if lossless else jpeg_quality
+        ok, encoded = cv2.imencode('.webp', original, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        if not ok or encoded.size >= path.stat().st_size:
+            return None
+        if lossless:
+            # 16 位、多页等 WebP 无法无损表示的图像，解码后像素不一致，保留原图
+            decoded = cv2.imdecode(encoded, cv2.IMREAD_UNCHANGED)
+            if decoded is None or decoded.shape != original.shape or not np.array_equal(decoded, original):
+                return None
+        return encoded.tobytes()
+
+    def compact_object(self, object_dir, jpeg_quality=0):
+        """
+        压缩一个哈希目录中的原图，所有文件名都改为指向压缩后的文件
+
+        Returns:
+            int: 节省的字节数（未压缩时为 0）
+        """
+        files = self._files(object_dir)
+        if not files:
+            return 0
+        encoded = self._encode_compact(files[0], jpeg_quality)
+        if encoded is None:
+            return 0
+
+        # 硬链接的文件只占一份空间
+        saved = len({os.stat(p).st_ino for p in files}) * files[0].stat().st_size - len(encoded)
+        tmp_path = object_dir / f".{uuid.uuid4().hex}.webp"
+        tmp_path.write_bytes(encoded)
+        try:
+            for path in files:
+                target = path.with_suffix('.webp')
+                try:
+                    os.link(tmp_path, target)
+                except FileExistsError:
+                    pass
+                except OSError:
+                    shutil.copyfile(tmp_path, target)
+                if target != path:
+                    path.unlink(missing_ok=True)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return saved
+
+    def _acquire_compact_lock(self):
+        """获取存储目录的压缩锁，同一目录只有一个进程压缩"""
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.root / 'compact.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        self._lock_fd = fd
+        return True
+
+    def _clean_tmp(self, max_age):
+        """清理写入中断留下的临时文件和目录（流式上传的临时目录在上传结束时删除，进程崩溃时会留下）"""
+        for tmp_path in self.tmp_dir.iterdir():
+            try:
+                if time.time() - tmp_path.stat().st_mtime <= max_age:
+                    continue
+                if tmp_path.is_dir():
+                    shutil.rmtree(tmp_path)
+                else:
+                    tmp_path.unlink(missing_ok=True)
+            except OSError as e:
+                print(f"⚠️ 清理临时文件失败 {tmp_path.name}: {e}")
+
+    def compact(self, min_age=3600, jpeg_quality=0, dry_run=False):
+        """
+        压缩保存超过 min_age 秒的原图（刚上传、可能仍在识别的原图不处理）
+
+        Args:
+            min_age: 最短保存时间（秒）
+            jpeg_quality: JPEG 转换为 WebP 的质量，0 表示不转换 JPEG
+            dry_run: 只统计可压缩的原图，不修改文件
+
+        Returns:
+            dict: {'compacted': 压缩的原图数, 'saved_bytes': 节省的字节数}，其他进程正在压缩时返回 None
+        """
+        if not dry_run and not self._acquire_compact_lock():
+            return None
+
+        if not dry_run:
+            self._clean_tmp(max(min_age, 3600))
+
+        compacted = 0
+        saved_bytes = 0
+        cutoff = time.time() - min_age
+        for object_dir in self.iter_objects():
+            files = self._files(object_dir)
+            if not files or files[0].stat().st_mtime > cutoff:
+                continue
+            try:
+                if dry_run:
+                    encoded = self._encode_compact(files[0], jpeg_quality)
+                    saved = files[0].stat().st_size - len(encoded) if encoded is not None else 0
+                else:
+                    saved = self.compact_object(object_dir, jpeg_quality)
+            except (OSError, cv2.error) as e:
+                print(f"⚠️ 压缩原图失败 {object_dir.name[:12]}: {e}")
+                continue
+            if saved:
+                compacted += 1
+                saved_bytes += saved
+        return {'compacted': compacted, 'saved_bytes': saved_bytes}
+
+    def start_compaction(self, interval, min_age=3600, jpeg_quality=0):
+        """启动后台压缩线程，每 interval 秒压缩一次"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    stats = self.compact(min_age=min_age, jpeg_quality=jpeg_quality)
+                    if stats and stats['compacted']:
+                        print(f"🗜️ 已压缩 {stats['compacted']} 张原图，节省 {stats['saved_bytes'] / 1024 / 1024:.1f} MB")
+                except Exception as e:
+                    print(f"⚠️ 原图压缩失败: {e}")
+
+        thread = threading.Thread(target=run, name='image-compaction', daemon=True)
+        thread.start()
+        return thread
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """根据配置创建（或返回已创建的）原图存储"""
+    global _store
+    if _store is None:
+        from config import Config
+        with _store_lock:
+            if _store is None:
+                _store = ImageStore(Config.IMAGE_STORE_DIR)
+    return _store
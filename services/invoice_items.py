@@ -0,0 +1,189 @@
+"""
+发票明细 - 将发票上按列保存的明细字段（项目名称、单位、数量、单价、金额、税率、税额）对齐为明细行
+
+写入发票时在同一事务中重建该发票的明细行（invoice_items 表），
+"包含商品 X 且金额大于 Y 的发票" 这类明细级查询直接走明细表的索引，无需逐行解析 JSON 列表。
+"""
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import exists
+
+from model import Invoice, InvoiceItem
+from services.reports import rate_key
+
+
+# 发票上按明细行对齐的列表字段
+ITEM_FIELDS = ('item_name', 'unit', 'quantity', 'unit_price', 'amount', 'tax_rate', 'tax_amount')
+
+# 超出字段精度范围的数值视为识别错误
+MAX_NUMBER = Decimal('1e12')
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _to_decimal(value, places):
+    try:
+        number = Decimal(str(value).replace(',', '')).quantize(Decimal(1).scaleb(-places))
+    except (InvalidOperation, ValueError):
+        return None
+    return number if abs(number) < MAX_NUMBER else None
+
+
+def _text(value, max_length):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text[:max_length] if text else None
+
+
+def split_item_name(value):
+    """
+    拆分项目名称："电子产品:手机" -> ("电子产品", "手机")（extract_values 用冒号连接 *分类* 和名称）
+
+    Returns:
+        tuple: (分类简称, 名称)
+    """
+    text = _text(value, 1024)
+    if text is None:
+        return None, None
+    if ':' in text:
+        category, name = text.split(':', 1)
+        return _text(category, 64), _text(name, 255)
+    return None, text[:255]
+
+
+def build_invoice_items(invoice):
+    """
+    将发票的明细列表字段按下标对齐为明细行
+
+    各列表长度可能不一致（某一列漏识别），以最长的列表为准，缺失的值为空。
+
+    Args:
+        invoice: Invoice 实例
+
+    Returns:
+        list: InvoiceItem 列表（未加入会话）
+    """
+    columns = {field: _as_list(getattr(invoice, field)) for field in ITEM_FIELDS}
+    line_count = max(len(values) for values in columns.values())
+
+    def cell(field, index):
+        values = columns[field]
+        return values[index] if index < len(values) else None
+
+    items = []
+    for index in range(line_count):
+        category, name = split_item_name(cell('item_name', index))
+        items.append(InvoiceItem(
+            invoice_id=invoice.id,
+            line_no=index + 1,
+            item_category=category,
+            item_name=name,
+            unit=_text(cell('unit', index), 32),
+            quantity=_to_decimal(cell('quantity', index), 6),
+            unit_price=_to_decimal(cell('unit_price', index), 8),
+            amount=_to_decimal(cell('amount', index), 2),
+            tax_rate=rate_key(cell('tax_rate', index)) or None,
+            tax_amount=_to_decimal(cell('tax_amount', index), 2),
+        ))
+    return items
+
+
+def replace_invoice_items(db, invoice):
+    """
+    重建发票的明细行，不提交事务
+
+    Args:
+        db: 数据库会话（与发票写入使用同一事务）
+        invoice: Invoice 实例（需已有 id）
+
+    Returns:
+        int: 明细行数
+    """
+    db.query(InvoiceItem).filter(InvoiceItem.invoice_id == invoice.id).delete(synchronize_session=False)
+    items = build_invoice_items(invoice)
+    db.add_all(items)
+    return len(items)
+
+
+def encode_item_cursor(item_id):
+    return base64.urlsafe_b64encode(json.dumps({'i': item_id}).encode('utf-8')).decode('ascii')
+
+
+def decode_item_cursor(cursor):
+    """
+    Raises:
+        ValueError: 游标格式无效
+    """
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))['i'])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+
+
+def item_conditions(item_name=None, item_category=None, q=None, amount_min=None, amount_max=None,
+                    tax_rate=None):
+    """
+    明细查询条件
+
+    Args:
+        item_name: 项目名称（精确匹配，走 (item_name, amount) 索引）
+        item_category: 分类简称（精确匹配，走 (item_category, amount) 索引）
+        q: 项目名称包含的文字（LIKE，不走索引）
+        amount_min: 金额下限（Decimal，包含）
+        amount_max: 金额上限（Decimal，包含）
+        tax_rate: 税率（如 13、0.13）
+
+    Returns:
+        list: 条件表达式列表
+    """
+    conditions = []
+    if item_name:
+        conditions.append(InvoiceItem.item_name == item_name)
+    if item_category:
+        conditions.append(InvoiceItem.item_category == item_category)
+    if q:
+        escaped = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions.append(InvoiceItem.item_name.like(f'%{escaped}%', escape='\\'))
+    if amount_min is not None:
+        conditions.append(InvoiceItem.amount >= amount_min)
+    if amount_max is not None:
+        conditions.append(InvoiceItem.amount <= amount_max)
+    if tax_rate is not None:
+        conditions.append(InvoiceItem.tax_rate == rate_key(tax_rate))
+    return conditions
+
+
+def has_matching_item(**filters):
+    """
+    发票存在满足条件的明细行（EXISTS 子查询），用于按明细条件筛选发票
+
+    Args:
+        **filters: 同 item_conditions
+
+    Returns:
+        EXISTS 条件表达式
+    """
+    return exists().where(InvoiceItem.invoice_id == Invoice.id, *item_conditions(**filters))
+
+
+def item_dict(item):
+    return {
+        'id': item.id,
+        'invoice_id': item.invoice_id,
+        'line_no': item.line_no,
+        'item_category': item.item_category,
+        'item_name': item.item_name,
+        'unit': item.unit,
+        'quantity': float(item.quantity) if item.quantity is not None else None,
+        'unit_price': float(item.unit_price) if item.unit_price is not None else None,
+        'amount': float(item.amount) if item.amount is not None else None,
+        'tax_rate': item.tax_rate,
+        'tax_amount': float(item.tax_amount) if item.tax_amount is not None else None,
+    }
@@ -0,0 +1,83 @@
+"""
+发票全文检索 - 在销售方名称、购买方名称和项目名称中检索，按相关度排序
+
+MySQL 使用 ngram FULLTEXT 索引（MATCH ... AGAINST），SQLite 使用 FTS5 trigram 虚拟表（bm25 排序）。
+短于分词长度的关键词无法使用全文索引，对这部分关键词退化为 LIKE 过滤。
+"""
+from sqlalchemy import Float, Integer, inspect, literal, text
+from sqlalchemy.dialects.mysql import match
+
+from model import Invoice
+
+
+# 各数据库全文索引可检索的最短关键词长度（MySQL ngram_token_size 默认为 2，SQLite trigram 为 3）
+MIN_TOKEN_LENGTH = {'mysql': 2, 'sqlite': 3}
+
+# SQLite 是否已创建 FTS5 索引（按引擎缓存）
+_fts_available = {}
+
+
+def split_terms(q):
+    """将检索词按空白拆分，去除重复项"""
+    terms = []
+    for term in q.split():
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+def _has_sqlite_fts(bind):
+    if bind not in _fts_available:
+        _fts_available[bind] = inspect(bind).has_table('invoices_fts')
+    return _fts_available[bind]
+
+
+def _like_pattern(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def apply_full_text_search(query, q):
+    """
+    为发票查询添加全文检索条件和相关度
+
+    所有关键词都需要匹配（AND），关键词内部按短语匹配。
+
+    Args:
+        query: Invoice 查询
+        q: 检索词，多个关键词用空格分隔
+
+    Returns:
+        tuple: (添加了检索条件并按相关度排序的查询, 相关度表达式)；
+               相关度越大越相关，LIKE 退化时为常量 0
+    """
+    bind = query.session.get_bind()
+    dialect = bind.dialect.name
+    min_length = MIN_TOKEN_LENGTH.get(dialect)
+    if dialect == 'sqlite' and not _has_sqlite_fts(bind):
+        min_length = None
+
+    terms = split_terms(q)
+    indexed = [t for t in terms if min_length is not None and len(t) >= min_length]
+    for term in terms:
+        if term not in indexed:
+            query = query.filter(Invoice.search_text.like(_like_pattern(term), escape='\\'))
+
+    if not indexed:
+        return query.order_by(Invoice.created_at.desc(), Invoice.id.desc()), literal(0)
+
+    if dialect == 'mysql':
+        # 布尔模式下每个关键词作为必须匹配的短语
+        against = " ".join('+"{}"'.format(t.replace('"', ' ')) for t in indexed)
+        score = match(Invoice.search_text, against=against).in_boolean_mode()
+        query = query.filter(score > 0)
+    else:
+        # FTS5：每个关键词作为短语，空格表示 AND；bm25 越小越相关，取负值作为相关度
+        fts_query = " ".join('"{}"'.format(t.replace('"', '""')) for t in indexed)
+        fts = text(
+            "SELECT rowid AS id, -bm25(invoices_fts) AS score FROM invoices_fts WHERE invoices_fts MATCH :q"
+        ).bindparams(q=fts_query).columns(id=Integer, score=Float).subquery('fts')
+        query = query.join(fts, fts.c.id == Invoice.id)
+        score = fts.c.score
+
+    return query.order_by(score.desc(), Invoice.id.desc()), score
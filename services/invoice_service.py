@@ -1,12 +1,23 @@
 """
 发票识别服务 - 处理发票识别的业务逻辑
 """
-import json
 import os
 from pathlib import Path
 import cv2
-from utils import extract_text_from_bbox, save_to_database
+import numpy as np
+from config import Config
+from utils import extract_values, extract_text_from_bbox, normalize_field_value, ocr_field_record, upload_image_name
 from utils.image_preprocessor import ImagePreprocessor
+from services.batch_runner import BatchCancelled, check_cancelled
+from services.pdf_reader import is_pdf_bytes, open_pdf, get_page_words, has_text_layer, render_page, words_in_bbox
+from services.ofd_reader import is_ofd_bytes, read_ofd_invoice
+from services.qr_reader import decode_invoice_qr, check_qr_amount
+from services.file_scanner import iter_invoice_files, relative_image_name
+from services.persist_spool import persist_detection
+from services.result_sink import get_result_sink
+from services.image_store import get_image_store
+from services.detect_shapes import create_shape_selector
+from services.box_consolidation import consolidate_boxes
 
 
 class InvoiceService:
@@ -23,6 +34,7 @@ class InvoiceService:
         """
         self.yolo_model = yolo_model
         self.ocr_model = ocr_model
+        self.shape_selector = create_shape_selector(yolo_model)
         self.enable_preprocessing = enable_preprocessing
         if enable_preprocessing:
             self.preprocessor = ImagePreprocessor(enable_ocr_preprocess=True)
@@ -30,7 +42,8 @@ class InvoiceService:
             self.preprocessor = None
     
     def process_image(self, img_path, save_json=True, save_db=True, 
-                     enable_rotation=True, enable_perspective=True, enable_text_correction=True):
+                     enable_rotation=True, enable_perspective=True, enable_text_correction=True,
+                     cancel_event=None, image_name=None):
         """
         处理单个图像文件
         
@@ -41,106 +54,360 @@ class InvoiceService:
             enable_rotation: 是否启用旋转调整
             enable_perspective: 是否启用透视变换
             enable_text_correction: 是否启用文字水平调整
+            cancel_event: 取消标志（threading.Event），设置后在下一次 OCR 前停止处理
+            image_name: 图片名称，默认为不含扩展名的文件名（目录扫描时为相对路径，见 relative_image_name；
+                        原图存储中的文件与内容不同的已有发票同名时加上哈希后缀，见 upload_image_name）
             
         Returns:
             dict: 检测结果
         """
+        check_cancelled(cancel_event)
+        
+        # 原图存储中的文件压缩后扩展名会改变
+        image_store = get_image_store()
+        img_path = image_store.resolve(img_path)
+        image_sha256 = image_store.sha_of(img_path)
+        
         # 检查图像文件是否存在
         if not os.path.exists(img_path):
             raise FileNotFoundError(f"图像文件不存在: {img_path}")
+        if image_name is None:
+            image_name = Path(img_path).stem
+            if image_sha256 and save_db:
+                image_name = upload_image_name(image_name, image_sha256)
+        
+        # PDF 发票：优先读取文字层
+        if Path(img_path).suffix.lower() == '.pdf':
+            return self.process_pdf(img_path, image_name, save_json, save_db, cancel_event=cancel_event,
+                                    image_sha256=image_sha256)
+        
+        # OFD 发票：直接解析 XML，不需要模型推理
+        if Path(img_path).suffix.lower() == '.ofd':
+            return self.process_ofd(img_path, image_name, save_json, save_db, image_sha256=image_sha256)
         
         # 读取原始图像
         original_image = cv2.imread(img_path)
         if original_image is None:
             raise ValueError(f"无法读取图像文件: {img_path}")
         
+        return self.process_image_data(
+            original_image,
+            image_name,
+            save_json=save_json,
+            save_db=save_db,
+            enable_rotation=enable_rotation,
+            enable_perspective=enable_perspective,
+            enable_text_correction=enable_text_correction,
+            cancel_event=cancel_event,
+            image_sha256=image_sha256
+        )
+    
+    def process_image_bytes(self, data, image_name, save_json=True, save_db=True, cancel_event=None):
+        """
+        处理内存中的图像数据（例如从压缩包中直接读取的文件）
+        
+        Args:
+            data: 图像、PDF 或 OFD 文件的字节内容
+            image_name: 图片名称（不含扩展名）
+            save_json: 是否保存 JSON 文件
+            save_db: 是否保存到数据库
+            cancel_event: 取消标志（threading.Event）
+            
+        Returns:
+            dict: 检测结果
+        """
+        check_cancelled(cancel_event)
+        
+        if is_pdf_bytes(data):
+            return self.process_pdf(data, image_name, save_json, save_db, cancel_event=cancel_event)
+        
+        if is_ofd_bytes(data):
+            return self.process_ofd(data, image_name, save_json, save_db)
+        
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"无法解码图像数据: {image_name}")
+        
+        return self.process_image_data(image, image_name, save_json, save_db, cancel_event=cancel_event)
+    
+    def process_image_data(self, original_image, image_name, save_json=True, save_db=True,
+                           enable_rotation=True, enable_perspective=True, enable_text_correction=True,
+                           cancel_event=None, image_sha256=None):
+        """
+        处理已解码的图像
+        
+        Args:
+            original_image: BGR 格式的图像数组
+            image_name: 图片名称（不含扩展名），用作结果文件名和数据库记录名
+            save_json: 是否保存 JSON 文件
+            save_db: 是否保存到数据库
+            enable_rotation: 是否启用旋转调整
+            enable_perspective: 是否启用透视变换
+            enable_text_correction: 是否启用文字水平调整
+            cancel_event: 取消标志（threading.Event），设置后在下一次 OCR 前停止处理
+            image_sha256: 原图在原图存储中的内容哈希，保存到发票记录
+            
+        Returns:
+            dict: 检测结果
+        """
         # 图像预处理
         if self.enable_preprocessing and self.preprocessor:
-            print(f"🔄 开始预处理图像: {img_path}")
+            print(f"🔄 开始预处理图像: {image_name}")
             processed_image = self.preprocessor.preprocess(
                 original_image,
                 enable_rotation=enable_rotation,
                 enable_perspective=enable_perspective,
                 enable_text_correction=enable_text_correction
             )
-            # 保存预处理后的图像到临时文件，用于YOLO预测
-            temp_path = str(Path(img_path).parent / f"temp_{Path(img_path).name}")
-            cv2.imwrite(temp_path, processed_image)
-            predict_source = temp_path
         else:
             processed_image = original_image
-            predict_source = img_path
         
-        # 对图像进行预测
-        results = self.yolo_model.predict(
-            source=predict_source,
+        # 使用预处理后的图像进行OCR（如果进行了预处理）
+        ocr_image = processed_image
+        
+        # 二维码中已包含的字段（发票代码、号码、日期、校验码）不再 OCR
+        qr_info = decode_invoice_qr(processed_image) if Config.QR_ENABLED else None
+        qr_fields = qr_info['fields'] if qr_info else {}
+        qr_mismatches = {}
+        ocr_fields = []
+        
+        def read_text(bbox_coords, class_name, raw):
+            if class_name in qr_fields and not Config.QR_CROSS_CHECK:
+                raw["qr"] = qr_fields[class_name]
+                return qr_fields[class_name]
+            
+            extracted_text = extract_text_from_bbox(
+                self.ocr_model, 
+                ocr_image, 
+                bbox_coords, 
+                class_name,
+                raw
+            )
+            
+            # 核对模式：仍然 OCR，记录与二维码不一致的字段，以二维码为准
+            if class_name in qr_fields:
+                if normalize_field_value(class_name, extracted_text) != qr_fields[class_name]:
+                    qr_mismatches[class_name] = extracted_text
+                raw["qr"] = qr_fields[class_name]
+                return qr_fields[class_name]
+            return extracted_text
+        
+        detection_info = self._build_detection_info(
+            image_name, self._detect(processed_image), read_text, cancel_event, ocr_fields)
+        
+        if qr_info:
+            # YOLO 未检测到的字段直接使用二维码中的值
+            detected = {d["class_name"] for d in detection_info["detections"]}
+            for class_name, value in qr_fields.items():
+                if class_name not in detected:
+                    detection_info["detections"].append({
+                        "class_name": class_name,
+                        "confidence": 1.0,
+                        "extracted_text": value,
+                    })
+                    detection_info["检测项数"] += 1
+                    ocr_fields.append(ocr_field_record(class_name, None, None, {"qr": value}))
+            
+            detection_info["qr_code"] = {
+                "invoice_type": qr_info["invoice_type"],
+                "amount": qr_info["amount"],
+                "fields": sorted(qr_fields),
+                "amount_check": check_qr_amount(qr_info["amount"], detection_info["detections"]),
+            }
+            if Config.QR_CROSS_CHECK:
+                detection_info["qr_code"]["ocr_mismatches"] = qr_mismatches
+        
+        self._save_results(detection_info, save_json, save_db, ocr_fields, image_sha256=image_sha256)
+        
+        return detection_info
+    
+    def _detect(self, image):
+        """
+        使用 YOLO 检测发票字段区域
+        
+        Args:
+            image: BGR 格式的图像数组（直接传入，无需写临时文件）
+            
+        Returns:
+            list: (class_name, confidence, bbox_coords) 列表，坐标为原图坐标
+        """
+        # 自适应模式按宽高比选择矩形输入尺寸（DETECT_ADAPTIVE）
+        results = self.shape_selector.predict(
+            image,
             save=False,
             show=False,
             conf=0.1,
             iou=0.1,
-            imgsz=640,
         )
         
-        # 使用预处理后的图像进行OCR（如果进行了预处理）
-        ocr_image = processed_image if self.enable_preprocessing else original_image
+        boxes = []
+        for result in results:
+            if result.boxes:
+                for box in result.boxes:
+                    boxes.append((result.names[int(box.cls)], box.conf.item(), box.xyxy.tolist()[0]))
+        return boxes
+    
+    def _build_detection_info(self, image_name, boxes, read_text, cancel_event=None, ocr_fields=None):
+        """
+        读取每个检测框的文字并组装检测结果
         
-        # 清理临时文件
-        if self.enable_preprocessing and self.preprocessor and predict_source != img_path:
-            try:
-                if os.path.exists(predict_source):
-                    os.remove(predict_source)
-            except Exception as e:
-                print(f"⚠️ 清理临时文件失败: {e}")
+        读取前先合并检测框（见 services/box_consolidation.py），减少的 OCR 次数记录在 box_consolidation 中。
+        
+        Args:
+            image_name: 图片名称
+            boxes: _detect 的返回值
+            read_text: 文字读取函数，签名为 read_text(bbox_coords, class_name, raw)，返回提取的值，
+                       并把原始识别结果（texts、scores、boxes 或 qr）写入 raw 字典
+            cancel_event: 取消标志（threading.Event），设置后在下一次读取前停止处理
+            ocr_fields: 传入列表时追加每个字段的原始识别记录（见 ocr_field_record）
+            
+        Returns:
+            dict: 检测结果
+        """
+        boxes, consolidation = consolidate_boxes(
+            boxes, Config.BOX_MERGE_OVERLAP, merge=Config.BOX_CONSOLIDATION)
+        if consolidation["ocr_calls_saved"]:
+            print(f"✂️ 检测框合并: {consolidation['boxes']} 个框 -> {len(boxes)} 个，"
+                  f"减少 {consolidation['ocr_calls_saved']} 次 OCR")
         
         detection_info = {
-            "image_name": Path(img_path).stem,
+            "image_name": image_name,
             "检测项数": 0,
-            "detections": []
+            "detections": [],
+            "box_consolidation": consolidation
         }
         
-        # 处理预测结果并进行OCR识别
-        for result in results:
-            if result.boxes:
-                for box in result.boxes:
-                    class_name = result.names[int(box.cls)]
-                    confidence = box.conf.item()
-                    bbox_coords = box.xyxy.tolist()[0]
-                    
-                    extracted_text = extract_text_from_bbox(
-                        self.ocr_model, 
-                        ocr_image, 
-                        bbox_coords, 
-                        class_name
-                    )
+        for class_name, confidence, bbox_coords in boxes:
+            # 客户端断开后不再执行剩余的 OCR 调用
+            check_cancelled(cancel_event)
+            
+            raw = {}
+            extracted_text = read_text(bbox_coords, class_name, raw)
+            
+            # 处理 None 或空列表
+            if extracted_text is None or (isinstance(extracted_text, list) and len(extracted_text) == 0):
+                extracted_text = None
+            
+            # buyer 和 seller 区域框已在合并检测框时排除
+            detection = {
+                "class_name": class_name,
+                "confidence": confidence,
+                "extracted_text": extracted_text,
+            }
+            detection_info["detections"].append(detection)
+            detection_info["检测项数"] += 1
+            if ocr_fields is not None:
+                ocr_fields.append(ocr_field_record(class_name, confidence, bbox_coords, raw))
+        
+        return detection_info
+    
+    def process_pdf(self, source, image_name, save_json=True, save_db=True, cancel_event=None, image_sha256=None):
+        """
+        处理 PDF 发票
+        
+        有文字层的页面（数字版发票）：以低分辨率渲染后仅用于 YOLO 定位字段，
+        字段文字直接从文字层按坐标读取，再交给 extract_values 解析，不调用 OCR。
+        没有文字层的页面（扫描件）：以较高分辨率渲染后走常规的 OCR 流程。
+        多页 PDF 的每一页作为一张发票，名称为 <image_name>_p<页码>。
+        
+        Args:
+            source: PDF 文件路径或字节内容
+            image_name: 图片名称（不含扩展名）
+            save_json: 是否保存 JSON 文件
+            save_db: 是否保存到数据库
+            cancel_event: 取消标志（threading.Event）
+            image_sha256: 原文件在原图存储中的内容哈希（每一页的发票记录都引用同一个文件）
+            
+        Returns:
+            dict: 检测结果；多页 PDF 时 pages 字段包含每一页的结果
+        """
+        check_cancelled(cancel_event)
+        
+        with open_pdf(source) as doc:
+            if doc.page_count == 0:
+                raise ValueError(f"PDF 文件没有页面: {image_name}")
+            
+            pages = []
+            for page in doc:
+                check_cancelled(cancel_event)
+                page_name = image_name if doc.page_count == 1 else f"{image_name}_p{page.number + 1}"
+                words = get_page_words(page)
+                
+                if has_text_layer(words, Config.PDF_TEXT_MIN_CHARS):
+                    dpi = Config.PDF_DETECT_DPI
+                    image = render_page(page, dpi)
                     
-                    # 处理 None 或空列表
-                    if extracted_text is None or (isinstance(extracted_text, list) and len(extracted_text) == 0):
-                        extracted_text = None
+                    def read_text(bbox_coords, class_name, raw):
+                        lines = words_in_bbox(words, bbox_coords, dpi)
+                        raw["texts"] = lines
+                        return extract_values(lines, class_name) if lines else None
                     
-                    # 排除 buyer 和 seller 类别
-                    if class_name not in ["buyer", "seller"]:
-                        detection = {
-                            "class_name": class_name,
-                            "confidence": confidence,
-                            "extracted_text": extracted_text,
-                        }
-                        detection_info["detections"].append(detection)
-                        detection_info["检测项数"] += 1
-        
-        # 保存 JSON 文件
+                    ocr_fields = []
+                    detection_info = self._build_detection_info(
+                        page_name, self._detect(image), read_text, cancel_event, ocr_fields)
+                    detection_info["source"] = "pdf_text"
+                    self._save_results(detection_info, save_json, save_db, ocr_fields, "pdf_text", image_sha256)
+                else:
+                    print(f"📄 PDF 页面没有文字层，使用 OCR 识别: {page_name}")
+                    image = render_page(page, Config.PDF_OCR_DPI)
+                    detection_info = self.process_image_data(
+                        image, page_name, save_json, save_db, cancel_event=cancel_event, image_sha256=image_sha256)
+                pages.append(detection_info)
+        
+        if len(pages) == 1:
+            return pages[0]
+        return {
+            "image_name": image_name,
+            "检测项数": sum(p["检测项数"] for p in pages),
+            "detections": [d for p in pages for d in p["detections"]],
+            "pages": pages
+        }
+    
+    def process_ofd(self, source, image_name, save_json=True, save_db=True, image_sha256=None):
+        """
+        处理 OFD 发票
+        
+        OFD 中的文字和坐标是精确的，直接映射为与图像识别相同结构的检测结果，
+        不调用 YOLO 和 OCR。
+        
+        Args:
+            source: OFD 文件路径或字节内容
+            image_name: 图片名称（不含扩展名）
+            save_json: 是否保存 JSON 文件
+            save_db: 是否保存到数据库
+            image_sha256: 原文件在原图存储中的内容哈希
+            
+        Returns:
+            dict: 检测结果
+        """
+        detection_info = read_ofd_invoice(source, image_name)
+        self._save_results(detection_info, save_json, save_db, image_sha256=image_sha256)
+        return detection_info
+    
+    def _save_results(self, detection_info, save_json, save_db, ocr_fields=None, ocr_source="ocr", image_sha256=None):
+        """
+        保存识别结果
+        
+        Args:
+            detection_info: 检测结果
+            save_json: 是否保存 JSON 文件
+            save_db: 是否保存到数据库，保存状态写入 detection_info["persistence"]（见 persist_detection）
+            ocr_fields: 各字段的原始识别记录，STORE_RAW_OCR 开启时保存到数据库
+            ocr_source: 原始识别结果的文字来源（ocr 或 pdf_text）
+            image_sha256: 原图在原图存储中的内容哈希
+        """
+        if image_sha256:
+            detection_info["image_sha256"] = image_sha256
+        
+        # 保存识别结果文件（RESULT_SINK 配置）
         if save_json:
-            output_dir = Path("output")
-            output_dir.mkdir(exist_ok=True)
-            output_path = output_dir / f"{detection_info['image_name']}.json"
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(detection_info, f, ensure_ascii=False, indent=4)
+            output_path = get_result_sink().write(detection_info)
             print(f"已保存结果到 {output_path}")
         
         # 保存到数据库
         if save_db:
-            save_to_database(detection_info)
-        
-        return detection_info
+            detection_info["persistence"] = persist_detection(
+                detection_info, ocr_fields if Config.STORE_RAW_OCR else None, ocr_source)
     
     def process_uploaded_file(self, file, save_json=True, save_db=True):
         """
@@ -154,47 +421,89 @@ class InvoiceService:
         Returns:
             dict: 检测结果
         """
-        # 创建临时目录
-        upload_dir = Path("uploads")
-        upload_dir.mkdir(exist_ok=True)
+        # 按内容哈希保存上传的原图（相同内容只保存一份）
+        file_path, _ = get_image_store().put_stream(file.stream, file.filename)
         
-        # 保存上传的文件
-        filename = file.filename
-        file_path = upload_dir / filename
-        file.save(str(file_path))
+        # 处理图像
+        return self.process_image(file_path, save_json, save_db)
+    
+    def process_image_with_manifest(self, img_path, manifest, save_json=True, save_db=True, cancel_event=None,
+                                    image_name=None):
+        """
+        处理单个图像文件，并在处理清单中记录结果
+        
+        Args:
+            img_path: 图像文件路径
+            manifest: ProcessingManifest 实例，为 None 时等同于 process_image
+            save_json: 是否保存 JSON 文件
+            save_db: 是否保存到数据库
+            cancel_event: 取消标志（threading.Event）
+            image_name: 图片名称，默认为不含扩展名的文件名
+            
+        Returns:
+            dict: 检测结果
+        """
+        if manifest is None:
+            return self.process_image(img_path, save_json, save_db, cancel_event=cancel_event, image_name=image_name)
         
         try:
-            # 处理图像
-            result = self.process_image(str(file_path), save_json, save_db)
-            return result
-        finally:
-            # 可选：处理完后删除临时文件
-            # os.remove(file_path)
-            pass
+            result = self.process_image(img_path, save_json, save_db, cancel_event=cancel_event, image_name=image_name)
+        except BatchCancelled:
+            raise
+        except Exception as e:
+            if os.path.exists(img_path):
+                manifest.mark(img_path, 'failed', error=str(e))
+            raise
+        
+        json_path = get_result_sink().location(result['image_name']) if save_json else None
+        manifest.mark(img_path, 'success', image_name=result['image_name'], json_path=json_path)
+        return result
     
-    def process_batch(self, file_paths, save_json=True, save_db=True, progress_callback=None):
+    def process_batch(self, file_paths, save_json=True, save_db=True, progress_callback=None,
+                      cancel_event=None, manifest=None, root=None):
         """
         批量处理多个图像文件
         
         Args:
-            file_paths: 图像文件路径列表
+            file_paths: 图像文件路径列表（也可以是惰性产出路径的迭代器，此时进度回调中的 total 为 None）
             save_json: 是否保存 JSON 文件
             save_db: 是否保存到数据库
             progress_callback: 进度回调函数，接收 (current, total, file_path, status) 参数
+            cancel_event: 取消标志（threading.Event），设置后跳过剩余文件
+            manifest: ProcessingManifest 实例；提供时跳过已处理且未变化的文件（增量处理）
+            root: 扫描的根目录；提供时 image_name 为相对于根目录的路径（见 relative_image_name）
             
         Returns:
             list: 检测结果列表，每个元素包含 (success, result/error)
         """
         results = []
-        total = len(file_paths)
+        total = len(file_paths) if hasattr(file_paths, '__len__') else None
         
         for idx, img_path in enumerate(file_paths, 1):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            
+            # 增量处理：跳过已处理且未变化的文件
+            if manifest is not None and manifest.is_processed(img_path):
+                results.append({
+                    'success': True,
+                    'skipped': True,
+                    'file': img_path,
+                    'index': idx,
+                    'total': total
+                })
+                if progress_callback:
+                    progress_callback(idx, total, img_path, 'skipped')
+                continue
+            
             try:
                 # 通知进度：开始处理
                 if progress_callback:
                     progress_callback(idx, total, img_path, 'processing')
                 
-                result = self.process_image(img_path, save_json, save_db)
+                image_name = relative_image_name(img_path, root) if root is not None else None
+                result = self.process_image_with_manifest(img_path, manifest, save_json, save_db,
+                                                          cancel_event=cancel_event, image_name=image_name)
                 results.append({
                     'success': True,
                     'file': img_path,
@@ -206,6 +515,8 @@ class InvoiceService:
                 # 通知进度：处理成功
                 if progress_callback:
                     progress_callback(idx, total, img_path, 'success')
+            except BatchCancelled:
+                break
             except Exception as e:
                 results.append({
                     'success': False,
@@ -221,15 +532,22 @@ class InvoiceService:
         
         return results
     
-    def process_folder(self, folder_path, save_json=True, save_db=True, progress_callback=None):
+    def process_folder(self, folder_path, save_json=True, save_db=True, progress_callback=None,
+                       manifest=None, recursive=True, include=None, exclude=None):
         """
         处理文件夹中的所有图像文件
         
+        文件由 iter_invoice_files 边扫描边处理，无需等待整个目录树列举完成。
+        
         Args:
             folder_path: 文件夹路径
             save_json: 是否保存 JSON 文件
             save_db: 是否保存到数据库
-            progress_callback: 进度回调函数
+            progress_callback: 进度回调函数（total 为 None，扫描完成前总数未知）
+            manifest: ProcessingManifest 实例；提供时跳过已处理且未变化的文件，中断后可从断点继续
+            recursive: 是否递归处理子目录
+            include: 包含的 glob 模式（匹配相对路径或文件名）
+            exclude: 排除的 glob 模式（匹配的目录整个跳过）
             
         Returns:
             list: 检测结果列表
@@ -238,15 +556,14 @@ class InvoiceService:
         if not folder.exists() or not folder.is_dir():
             raise ValueError(f"文件夹不存在或不是目录: {folder_path}")
         
-        # 支持的图像格式
-        image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.PNG', '.JPG', '.JPEG', '.GIF', '.BMP'}
-        
-        # 获取所有图像文件
-        image_files = [str(f) for f in folder.iterdir() 
-                      if f.is_file() and f.suffix in image_extensions]
+        image_files = iter_invoice_files(
+            folder, Config.ALLOWED_EXTENSIONS,
+            include=include, exclude=exclude, recursive=recursive
+        )
+        results = self.process_batch(image_files, save_json, save_db, progress_callback, manifest=manifest,
+                                     root=folder)
         
-        if not image_files:
+        if not results:
             raise ValueError(f"文件夹中没有找到图像文件: {folder_path}")
         
-        return self.process_batch(image_files, save_json, save_db, progress_callback)
-
+        return results
@@ -0,0 +1,138 @@
+"""
+处理清单 - 记录已处理文件的状态，增量处理时跳过未变化的文件
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+
+class ProcessingManifest:
+    """
+    已处理文件清单
+
+    使用本地 SQLite 文件保存，以文件绝对路径为键，记录文件大小、修改时间（可选内容哈希）、
+    处理状态和结果位置。每处理完一个文件立即提交，进程中断后重新运行会从第一个
+    未成功处理的文件继续。
+    """
+
+    def __init__(self, path='output/manifest.db', use_hash=False):
+        """
+        初始化清单
+
+        Args:
+            path: 清单文件路径
+            use_hash: 是否比较内容哈希；开启后文件被复制或 touch（大小、修改时间变化但内容不变）时仍视为已处理
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.use_hash = use_hash
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS processed_files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT,
+                status TEXT NOT NULL,
+                image_name TEXT,
+                json_path TEXT,
+                error TEXT,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _key(file_path):
+        return os.path.abspath(file_path)
+
+    @staticmethod
+    def file_hash(file_path):
+        """计算文件内容的 SHA-256"""
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def is_processed(self, file_path):
+        """
+        文件是否已成功处理且未发生变化
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            bool: 是否可以跳过
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256, status FROM processed_files WHERE path = ?",
+                (self._key(file_path),)
+            ).fetchone()
+        if row is None or row[3] != 'success':
+            return False
+
+        size, mtime_ns, sha256, _ = row
+        if size == stat.st_size and mtime_ns == stat.st_mtime_ns:
+            return True
+        # 大小未变但修改时间变化：比较内容哈希
+        if self.use_hash and sha256 and size == stat.st_size and self.file_hash(file_path) == sha256:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE processed_files SET mtime_ns = ? WHERE path = ?",
+                    (stat.st_mtime_ns, self._key(file_path))
+                )
+                self._conn.commit()
+            return True
+        return False
+
+    def mark(self, file_path, status, image_name=None, json_path=None, error=None):
+        """
+        记录文件处理结果
+
+        Args:
+            file_path: 文件路径
+            status: success 或 failed
+            image_name: 数据库中的发票图片名称
+            json_path: JSON 结果文件路径
+            error: 失败原因
+        """
+        stat = os.stat(file_path)
+        sha256 = self.file_hash(file_path) if self.use_hash else None
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO processed_files
+                    (path, size, mtime_ns, sha256, status, image_name, json_path, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (self._key(file_path), stat.st_size, stat.st_mtime_ns, sha256, status,
+                 image_name, json_path, error, datetime.now().isoformat())
+            )
+            self._conn.commit()
+
+    def get(self, file_path):
+        """获取文件的处理记录"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT * FROM processed_files WHERE path = ?", (self._key(file_path),)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
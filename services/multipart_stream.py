@@ -0,0 +1,87 @@
+"""
+流式 multipart 解析 - 边接收上传数据边保存文件，每个文件接收完成后立即交给识别流程
+"""
+from pathlib import Path
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from werkzeug.utils import secure_filename
+
+
+def iter_multipart_stream(stream, content_type, upload_dir, allowed_file,
+                          file_field='files[]', chunk_size=64 * 1024, cancel_event=None):
+    """
+    逐段解析 multipart/form-data 请求体
+
+    与 request.files 不同，本函数不会等待整个请求体解析完成：每个文件部分
+    接收完毕后立即产出，调用方可以在上传剩余文件的同时开始识别。
+
+    Args:
+        stream: 原始请求体流（request.stream）
+        content_type: 请求的 Content-Type 头
+        upload_dir: 文件保存目录
+        allowed_file: 文件名校验函数
+        file_field: 文件字段名
+        chunk_size: 每次读取的字节数
+        cancel_event: 取消标志（threading.Event），设置后停止读取
+
+    Yields:
+        tuple: ('field', 字段名, 值) 或 ('file', 原始文件名, 保存路径)
+    """
+    mimetype, options = parse_options_header(content_type)
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('请求必须是带 boundary 的 multipart/form-data')
+
+    upload_dir = Path(upload_dir)
+    upload_dir.mkdir(exist_ok=True)
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    # 当前部分的状态
+    part = None
+    field_data = []
+    out = None
+    out_path = None
+
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            break
+
+        chunk = stream.read(chunk_size)
+        # 传入 None 表示数据已全部接收
+        decoder.receive_data(chunk or None)
+
+        event = decoder.next_event()
+        while not isinstance(event, (Epilogue, NeedData)):
+            if isinstance(event, File):
+                part = event
+                filename = event.filename or ''
+                if event.name == file_field and filename and allowed_file(filename):
+                    out_path = upload_dir / secure_filename(filename)
+                    out = open(out_path, 'wb')
+            elif isinstance(event, Field):
+                part = event
+                field_data = []
+            elif isinstance(event, Data):
+                if isinstance(part, File):
+                    if out is not None:
+                        out.write(event.data)
+                    if not event.more_data:
+                        if out is not None:
+                            out.close()
+                            out = None
+                            yield 'file', part.filename, str(out_path)
+                        part = None
+                elif isinstance(part, Field):
+                    field_data.append(event.data)
+                    if not event.more_data:
+                        yield 'field', part.name, b''.join(field_data).decode('utf-8', 'replace')
+                        part = None
+            event = decoder.next_event()
+
+        if isinstance(event, Epilogue) or not chunk:
+            break
+
+    if out is not None:
+        # 上传中断，丢弃不完整的文件
+        out.close()
+        out_path.unlink(missing_ok=True)
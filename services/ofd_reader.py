@@ -0,0 +1,377 @@
+"""
+OFD 读取 - 直接解析 OFD 版数电发票（压缩包内的 XML），不经过 YOLO 和 OCR
+
+OFD 文件是 ZIP 压缩包，入口 OFD.xml 指向文档 Document.xml，页面内容中的
+TextObject 带有精确的文字和坐标（单位毫米）。发票字段的取值顺序：
+1. 自定义标签（CustomTags）中发票字段到 TextObject 的引用；
+2. 按标签文字（如“发票号码”）在同一行右侧查找取值；
+3. 明细行按表头（如“项目名称”“金额”）所在列从上到下收集，直到“合计”行。
+"""
+import io
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from utils.utils import extract_values, normalize_field_value
+
+
+# 发票自定义标签名称 -> 字段名称（兼容增值税电子发票和数电发票的标签命名）
+OFD_TAG_FIELDS = {
+    'InvoiceCode': 'invoice_code',
+    'InvoiceNo': 'invoice_number',
+    'InvoiceNumber': 'invoice_number',
+    'IssueDate': 'invoice_date',
+    'InvoiceCheckCode': 'check_code',
+    'CheckCode': 'check_code',
+    'BuyerName': 'buyer_name',
+    'BuyerTaxID': 'buyer_tax_id',
+    'BuyerIdNum': 'buyer_tax_id',
+    'BuyerAddrTel': 'buyer_address_phone',
+    'BuyerFinancialAccount': 'buyer_bank_account',
+    'SellerName': 'seller_name',
+    'SellerTaxID': 'seller_tax_id',
+    'SellerIdNum': 'seller_tax_id',
+    'SellerAddrTel': 'seller_address_phone',
+    'SellerFinancialAccount': 'seller_bank_account',
+    'TaxInclusiveTotalAmount': 'total_amount',
+    'TotalTax-includedAmount': 'total_amount',
+}
+
+# 标签文字 -> 字段名称；购买方和销售方使用相同的标签，先出现的（上方或左侧）为购买方
+OFD_LABEL_FIELDS = {
+    '发票代码': ['invoice_code'],
+    '发票号码': ['invoice_number'],
+    '开票日期': ['invoice_date'],
+    '校验码': ['check_code'],
+    '名称': ['buyer_name', 'seller_name'],
+    '纳税人识别号': ['buyer_tax_id', 'seller_tax_id'],
+    '统一社会信用代码/纳税人识别号': ['buyer_tax_id', 'seller_tax_id'],
+    '地址、电话': ['buyer_address_phone', 'seller_address_phone'],
+    '开户行及账号': ['buyer_bank_account', 'seller_bank_account'],
+    '（小写）': ['total_amount'],
+    '(小写)': ['total_amount'],
+}
+
+# 明细表头文字 -> 字段名称
+OFD_ITEM_HEADERS = {
+    '项目名称': 'item_name',
+    '货物或应税劳务、服务名称': 'item_name',
+    '货物或应税劳务名称': 'item_name',
+    '规格型号': 'specification',
+    '单位': 'unit',
+    '数量': 'quantity',
+    '单价': 'unit_price',
+    '金额': 'amount',
+    '税率': 'tax_rate',
+    '税率/征收率': 'tax_rate',
+    '税额': 'tax_amount',
+}
+
+
+class TextObject:
+    """页面上的一个文字对象"""
+
+    def __init__(self, object_id, x, y, w, h, text):
+        self.id = object_id
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.text = text
+
+    @property
+    def cx(self):
+        return self.x + self.w / 2
+
+    @property
+    def cy(self):
+        return self.y + self.h / 2
+
+    @property
+    def key(self):
+        """用于匹配标签的文字（去掉空白和冒号）"""
+        return re.sub(r'[\s:：]', '', self.text)
+
+
+def _local(tag):
+    """去掉 XML 命名空间前缀"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _find_all(root, name):
+    return [e for e in root.iter() if _local(e.tag) == name]
+
+
+def _find_text(root, name):
+    for e in root.iter():
+        if _local(e.tag) == name and e.text:
+            return e.text.strip()
+    return None
+
+
+def is_ofd_bytes(data):
+    """检查字节内容是否为 OFD 文件（包含 OFD.xml 的 ZIP 压缩包）"""
+    if data[:2] != b'PK':
+        return False
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            return 'OFD.xml' in zf.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+class OFDDocument:
+    """OFD 文档读取器"""
+
+    def __init__(self, source):
+        """
+        Args:
+            source: OFD 文件路径或字节内容
+        """
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        self.zip = zipfile.ZipFile(source)
+        self.names = set(self.zip.namelist())
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _resolve(self, base_file, loc):
+        """解析 OFD 中的路径：以 / 开头为包内绝对路径，否则相对于引用文件所在目录"""
+        loc = loc.strip()
+        if loc.startswith('/'):
+            path = loc.lstrip('/')
+        else:
+            path = posixpath.normpath(posixpath.join(posixpath.dirname(base_file), loc))
+        return path
+
+    def _parse(self, path):
+        if path not in self.names:
+            return None
+        return ET.fromstring(self.zip.read(path))
+
+    def _document_path(self):
+        root = self._parse('OFD.xml')
+        if root is None:
+            raise ValueError("无效的 OFD 文件：缺少 OFD.xml")
+        doc_root = _find_text(root, 'DocRoot')
+        if not doc_root:
+            raise ValueError("无效的 OFD 文件：缺少 DocRoot")
+        return self._resolve('OFD.xml', doc_root)
+
+    def _read_text_objects(self, path):
+        root = self._parse(path)
+        if root is None:
+            return []
+        objects = []
+        for elem in _find_all(root, 'TextObject'):
+            boundary = elem.get('Boundary', '0 0 0 0').split()
+            try:
+                x, y, w, h = (float(v) for v in boundary[:4])
+            except ValueError:
+                continue
+            text = ''.join(code.text or '' for code in _find_all(elem, 'TextCode')).strip()
+            if text:
+                objects.append(TextObject(elem.get('ID'), x, y, w, h, text))
+        return objects
+
+    def read(self):
+        """
+        读取第一页的文字对象和发票自定义标签
+
+        Returns:
+            tuple: (文字对象列表, {标签名称: [对象 ID]})
+        """
+        doc_path = self._document_path()
+        doc = self._parse(doc_path)
+        if doc is None:
+            raise ValueError(f"无效的 OFD 文件：缺少 {doc_path}")
+
+        # 模板页（如发票版式中的固定标签文字）
+        templates = {}
+        for tpl in _find_all(doc, 'TemplatePage'):
+            if tpl.get('BaseLoc'):
+                templates[tpl.get('ID')] = self._resolve(doc_path, tpl.get('BaseLoc'))
+
+        pages = [p for p in _find_all(doc, 'Page') if p.get('BaseLoc')]
+        if not pages:
+            raise ValueError("OFD 文件没有页面")
+        page_path = self._resolve(doc_path, pages[0].get('BaseLoc'))
+
+        objects = self._read_text_objects(page_path)
+        page_root = self._parse(page_path)
+        if page_root is not None:
+            for tpl in _find_all(page_root, 'Template'):
+                tpl_path = templates.get(tpl.get('TemplateID'))
+                if tpl_path:
+                    objects.extend(self._read_text_objects(tpl_path))
+
+        return objects, self._read_tags(doc_path, doc)
+
+    def _read_tags(self, doc_path, doc):
+        """读取自定义标签：标签名称 -> 引用的文字对象 ID 列表"""
+        tags = {}
+        custom_tags_loc = _find_text(doc, 'CustomTags')
+        if not custom_tags_loc:
+            return tags
+        custom_tags_path = self._resolve(doc_path, custom_tags_loc)
+        custom_tags = self._parse(custom_tags_path)
+        if custom_tags is None:
+            return tags
+
+        for file_loc in _find_all(custom_tags, 'FileLoc'):
+            if not file_loc.text:
+                continue
+            tag_root = self._parse(self._resolve(custom_tags_path, file_loc.text))
+            if tag_root is None:
+                continue
+            for elem in tag_root.iter():
+                refs = [r.text.strip() for r in elem if _local(r.tag) == 'ObjectRef' and r.text]
+                if refs:
+                    tags.setdefault(_local(elem.tag), []).extend(refs)
+        return tags
+
+
+def _value_right_of(label, objects, labels):
+    """在标签右侧同一行查找取值"""
+    # 标签和值在同一个文字对象中，例如 “名称：某某公司”
+    parts = re.split(r'[:：]', label.text, maxsplit=1)
+    if len(parts) == 2 and parts[1].strip():
+        return parts[1].strip()
+
+    candidates = [
+        o for o in objects
+        if o is not label and o.key not in labels
+        and o.x >= label.x + label.w - 0.5
+        and abs(o.cy - label.cy) <= max(label.h, o.h) / 2
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda o: o.x).text
+
+
+def _read_items(objects):
+    """按表头所在列收集明细行"""
+    headers = [o for o in objects if o.key in OFD_ITEM_HEADERS]
+    if not headers:
+        return {}
+
+    header_y = min(h.cy for h in headers)
+    headers = sorted((h for h in headers if abs(h.cy - header_y) <= h.h), key=lambda h: h.cx)
+    # 明细区域的下边界：“合计”行
+    bottom = min((o.y for o in objects if o.key in ('合计', '合 计') and o.cy > header_y), default=float('inf'))
+
+    # 以相邻表头中点划分各列范围
+    bounds = []
+    for i, header in enumerate(headers):
+        left = (headers[i - 1].cx + header.cx) / 2 if i > 0 else float('-inf')
+        right = (header.cx + headers[i + 1].cx) / 2 if i < len(headers) - 1 else float('inf')
+        bounds.append((left, right, OFD_ITEM_HEADERS[header.key]))
+
+    columns = {}
+    for o in sorted(objects, key=lambda o: (o.cy, o.x)):
+        if not (header_y + 0.5 < o.cy < bottom) or o.key in OFD_ITEM_HEADERS:
+            continue
+        for left, right, field in bounds:
+            if left <= o.cx < right:
+                values = columns.setdefault(field, [])
+                # 折行的项目名称：不以 * 开头的行接到上一行
+                if field == 'item_name' and values and not o.text.startswith('*'):
+                    values[-1] += o.text
+                else:
+                    values.append(o.text)
+                break
+    return columns
+
+
+def _shape_value(class_name, texts):
+    """将文字转换为与 extract_values 输出一致的取值，再交给 normalize_field_value 规范化"""
+    if class_name == 'invoice_date':
+        text = texts[0]
+        if re.match(r'^\d{4}-\d{2}-\d{2}$', text):
+            value = text
+        else:
+            value = extract_values([text], class_name)
+    elif class_name == 'item_name':
+        # 与 OCR 结果相同的 “*类别*名称” -> “类别:名称” 转换
+        value = ["".join(extract_values(['', text], class_name)) or text for text in texts]
+    elif class_name in ('quantity', 'unit_price', 'amount', 'tax_rate', 'tax_amount'):
+        value = [v for text in texts for v in (extract_values([text], class_name) or [])]
+    elif class_name == 'total_amount':
+        value = texts[-1].replace('¥', '').replace('￥', '').strip()
+    elif class_name == 'unit':
+        value = texts
+    else:
+        value = " ".join(texts)
+    return normalize_field_value(class_name, value)
+
+
+def read_ofd_invoice(source, image_name):
+    """
+    解析 OFD 发票，返回与图像识别相同结构的检测结果
+
+    Args:
+        source: OFD 文件路径或字节内容
+        image_name: 图片名称（不含扩展名）
+
+    Returns:
+        dict: 检测结果（detection_info），取值已规范化
+    """
+    with OFDDocument(source) as doc:
+        objects, tags = doc.read()
+
+    by_id = {o.id: o for o in objects if o.id}
+    fields = {}
+
+    # 1. 自定义标签
+    for tag, refs in tags.items():
+        class_name = OFD_TAG_FIELDS.get(tag)
+        if class_name and class_name not in fields:
+            texts = [by_id[ref].text for ref in refs if ref in by_id]
+            if texts:
+                fields[class_name] = texts
+
+    # 2. 标签文字
+    labels = {o.key for o in objects if o.key in OFD_LABEL_FIELDS}
+    seen = {}
+    for o in sorted(objects, key=lambda o: (o.y, o.x)):
+        label_key = re.split(r'[:：]', o.text, maxsplit=1)[0].strip()
+        label_key = re.sub(r'\s', '', label_key)
+        class_names = OFD_LABEL_FIELDS.get(label_key)
+        if not class_names:
+            continue
+        index = seen.get(label_key, 0)
+        seen[label_key] = index + 1
+        if index >= len(class_names) or class_names[index] in fields:
+            continue
+        value = _value_right_of(o, objects, labels)
+        if value:
+            fields[class_names[index]] = [value]
+
+    # 3. 明细行
+    for class_name, texts in _read_items(objects).items():
+        fields.setdefault(class_name, texts)
+
+    detection_info = {
+        "image_name": image_name,
+        "检测项数": 0,
+        "detections": [],
+        "source": "ofd"
+    }
+    for class_name, texts in fields.items():
+        value = _shape_value(class_name, texts)
+        if value is None:
+            continue
+        detection_info["detections"].append({
+            "class_name": class_name,
+            "confidence": 1.0,
+            "extracted_text": value,
+        })
+        detection_info["检测项数"] += 1
+    return detection_info
@@ -0,0 +1,112 @@
+"""
+PDF 读取 - 读取数字版发票 PDF 的文字层（含坐标），并按检测框分配文字
+"""
+import cv2
+import numpy as np
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF 为可选依赖，仅处理 PDF 时需要
+    pymupdf = None
+
+
+# PDF 坐标单位为点（1/72 英寸）
+PDF_POINTS_PER_INCH = 72
+
+
+def is_pdf_bytes(data):
+    """检查字节内容是否为 PDF 文件"""
+    return data[:5] == b'%PDF-'
+
+
+def open_pdf(source):
+    """
+    打开 PDF 文档
+
+    Args:
+        source: PDF 文件路径或字节内容
+
+    Returns:
+        pymupdf.Document: PDF 文档
+    """
+    if pymupdf is None:
+        raise ValueError("处理 PDF 需要安装 PyMuPDF: pip install pymupdf")
+    if isinstance(source, (bytes, bytearray)):
+        return pymupdf.open(stream=bytes(source), filetype='pdf')
+    return pymupdf.open(source)
+
+
+def get_page_words(page):
+    """
+    读取页面文字层中的单词及其坐标
+
+    Args:
+        page: PDF 页面
+
+    Returns:
+        list: (x0, y0, x1, y1, text, block_no, line_no) 列表，坐标单位为点
+    """
+    return [tuple(w[:7]) for w in page.get_text('words') if w[4].strip()]
+
+
+def has_text_layer(words, min_chars):
+    """
+    判断页面是否有可用的文字层（扫描件转换的 PDF 通常没有）
+
+    Args:
+        words: get_page_words 的返回值
+        min_chars: 最少字符数
+
+    Returns:
+        bool: 文字层字符数是否达到 min_chars
+    """
+    return sum(len(w[4].strip()) for w in words) >= min_chars
+
+
+def render_page(page, dpi):
+    """
+    将页面渲染为 BGR 图像
+
+    Args:
+        page: PDF 页面
+        dpi: 渲染分辨率
+
+    Returns:
+        np.ndarray: BGR 格式的图像
+    """
+    zoom = dpi / PDF_POINTS_PER_INCH
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+    image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+
+def words_in_bbox(words, bbox, dpi):
+    """
+    获取检测框内的文字行
+
+    单词中心点落在检测框内即认为属于该框；同一行的单词按从左到右拼接，
+    各行按从上到下排列，与 OCR 的 rec_texts 顺序一致，可直接交给 extract_values。
+
+    Args:
+        words: get_page_words 的返回值
+        bbox: 检测框坐标 [x1, y1, x2, y2]，单位为渲染图像的像素
+        dpi: 渲染图像的分辨率
+
+    Returns:
+        list: 文字行列表
+    """
+    scale = PDF_POINTS_PER_INCH / dpi
+    x1, y1, x2, y2 = (v * scale for v in bbox)
+
+    lines = {}
+    for wx0, wy0, wx1, wy1, text, block_no, line_no in words:
+        cx = (wx0 + wx1) / 2
+        cy = (wy0 + wy1) / 2
+        if x1 <= cx <= x2 and y1 <= cy <= y2:
+            lines.setdefault((block_no, line_no), []).append((wx0, wy0, text))
+
+    # 各行按顶部坐标、左侧坐标排序
+    ordered = sorted(lines.values(), key=lambda ws: (round(min(w[1] for w in ws)), min(w[0] for w in ws)))
+    return [" ".join(w[2] for w in sorted(ws)) for ws in ordered]
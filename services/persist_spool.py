@@ -0,0 +1,360 @@
+"""
+写入队列 - 识别结果先追加到本地队列文件，由后台线程批量写入数据库
+
+识别请求只等待本地文件追加完成，不等待数据库；数据库变慢或不可用时结果保留在队列文件中，
+恢复后按写入顺序补写，识别吞吐量不受数据库状态影响。
+
+队列文件按分钟分段（spool-YYYYmmddHHMM.jsonl），每行一条记录，只追加不修改；
+已写入数据库的位置记录在同名 .offset 文件中。同一目录可由多个进程共同追加，
+但只有持有 drain.lock 文件锁的一个进程负责写入数据库。
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只能单进程使用同一队列目录
+    fcntl = None
+
+
+# 分段在其所属分钟结束后再等待的秒数，之后不再有进程追加，写完即可删除
+SEGMENT_CLOSE_GRACE = 5
+
+
+def is_transient_error(error):
+    """数据库连接断开、锁等待超时、死锁等可以重试的错误"""
+    if isinstance(error, (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class PersistSpool:
+    """本地写入队列及其后台写入线程"""
+
+    def __init__(self, directory, save_batch, batch_size=50, fsync=True,
+                 retry_delay=1.0, max_retry_delay=60.0, poll_interval=1.0):
+        """
+        Args:
+            directory: 队列目录
+            save_batch: 批量写入函数，参数为 (detection_info, ocr_fields, ocr_source) 列表
+            batch_size: 每批写入的记录数
+            fsync: 追加后是否 fsync（关闭后进程崩溃不会丢数据，但断电可能丢失最近的记录）
+            retry_delay: 数据库不可用时的首次重试间隔（秒），之后每次翻倍
+            max_retry_delay: 最大重试间隔（秒）
+            poll_interval: 队列为空时的检查间隔（秒）
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.save_batch = save_batch
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.poll_interval = poll_interval
+
+        self.saved = 0
+        self.last_error = None
+        self._lock_fd = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+
+    # ---------- 追加 ----------
+
+    @staticmethod
+    def _segment_name(ts):
+        return time.strftime('spool-%Y%m%d%H%M.jsonl', time.gmtime(ts))
+
+    def append(self, detection_info, ocr_fields=None, ocr_source='ocr'):
+        """
+        追加一条识别结果，返回后即已落盘
+
+        Returns:
+            str: 记录 ID
+        """
+        record = {
+            'id': uuid.uuid4().hex,
+            'queued_at': time.time(),
+            'detection_info': detection_info,
+            'ocr_fields': ocr_fields,
+            'ocr_source': ocr_source,
+        }
+        line = (json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+
+        path = self.directory / self._segment_name(record['queued_at'])
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # O_APPEND 下一次 write 整行追加，多个进程同时追加也不会交错
+            if os.write(fd, line) != len(line):
+                raise OSError(f"写入队列文件不完整: {path}")
+            if self.fsync:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        self.start()
+        self._wakeup.set()
+        return record['id']
+
+    # ---------- 读取 ----------
+
+    def _segments(self):
+        return sorted(self.directory.glob('spool-*.jsonl'))
+
+    @staticmethod
+    def _offset_path(segment):
+        return segment.with_suffix('.offset')
+
+    def _read_offset(self, segment):
+        try:
+            return int(self._offset_path(segment).read_text().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_offset(self, segment, offset):
+        path = self._offset_path(segment)
+        tmp_path = path.with_suffix('.offset.tmp')
+        tmp_path.write_text(str(offset))
+        os.replace(tmp_path, path)
+
+    def _is_closed(self, segment):
+        return segment.name < self._segment_name(time.time() - SEGMENT_CLOSE_GRACE)
+
+    def _remove_segment(self, segment):
+        segment.unlink(missing_ok=True)
+        self._offset_path(segment).unlink(missing_ok=True)
+
+    def _next_batch(self):
+        """
+        读取下一批待写入的记录（只读取以换行结尾的完整行），删除已写完并关闭的分段
+
+        Returns:
+            tuple: (分段路径, [(行结束位置, 行内容)])，没有待写入的记录时返回 None
+        """
+        for segment in self._segments():
+            offset = self._read_offset(segment)
+            closed = self._is_closed(segment)
+            entries = []
+            with open(segment, 'rb') as f:
+                f.seek(offset)
+                while len(entries) < self.batch_size:
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        # 已关闭分段末尾的不完整行是追加时进程崩溃留下的，不会再被补全
+                        if line and closed and not entries:
+                            self._dead_letter(line, '不完整的记录')
+                            entries.append((f.tell(), None))
+                        break
+                    entries.append((f.tell(), line))
+            if entries:
+                return segment, entries
+            if closed:
+                self._remove_segment(segment)
+        return None
+
+    # ---------- 写入数据库 ----------
+
+    def _dead_letter(self, line, error):
+        """无法写入的记录移到 failed.jsonl，不阻塞后续记录"""
+        text = line.decode('utf-8', errors='replace').rstrip('\n') if isinstance(line, bytes) else line
+        with open(self.directory / 'failed.jsonl', 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'error': str(error), 'failed_at': time.time(), 'line': text},
+                               ensure_ascii=False) + '\n')
+        print(f"❌ 识别结果写入数据库失败，已移到 failed.jsonl: {error}")
+
+    def _drain_batch(self, segment, entries):
+        """
+        写入一批记录并推进位置
+
+        整批在一个事务中写入；批量写入失败且不是连接类错误时逐条写入，找出有问题的记录移到 failed.jsonl。
+
+        Raises:
+            Exception: 数据库暂时不可用（is_transient_error），位置不推进，稍后重试
+        """
+        records = []
+        for _, line in entries:
+            if line is None:
+                continue
+            try:
+                data = json.loads(line)
+                records.append((data, (data['detection_info'], data.get('ocr_fields'), data.get('ocr_source', 'ocr'))))
+            except (ValueError, KeyError, TypeError) as e:
+                self._dead_letter(line, f'无法解析的记录: {e}')
+
+        saved = len(records)
+        if records:
+            try:
+                self.save_batch([args for _, args in records])
+            except Exception as e:
+                if is_transient_error(e):
+                    raise
+                for data, args in records:
+                    try:
+                        self.save_batch([args])
+                    except Exception as record_error:
+                        if is_transient_error(record_error):
+                            raise
+                        self._dead_letter(json.dumps(data, ensure_ascii=False), record_error)
+                        saved -= 1
+        self.saved += saved
+        self._write_offset(segment, entries[-1][0])
+
+    def _acquire_drain_lock(self):
+        """获取队列目录的写入锁，同一目录只有一个进程写入数据库"""
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.directory / 'drain.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        self._lock_fd = fd
+        return True
+
+    def _run(self):
+        delay = self.retry_delay
+        while not self._stop.is_set():
+            if not self._acquire_drain_lock():
+                # 其他进程正在写入，定期检查它是否已退出
+                self._stop.wait(self.poll_interval * 5)
+                continue
+            try:
+                batch = self._next_batch()
+                if batch is None:
+                    if self._wakeup.wait(self.poll_interval):
+                        self._wakeup.clear()
+                    continue
+                self._drain_batch(*batch)
+                delay = self.retry_delay
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"⚠️ 写入队列暂时无法写入数据库，{delay:g} 秒后重试: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def start(self):
+        """启动后台写入线程（已启动时不重复启动）"""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='persist-spool', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def pending(self):
+        """
+        Returns:
+            int: 尚未写入数据库的记录数
+        """
+        count = 0
+        for segment in self._segments():
+            try:
+                with open(segment, 'rb') as f:
+                    f.seek(self._read_offset(segment))
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        count += chunk.count(b'\n')
+            except FileNotFoundError:
+                continue
+        return count
+
+    def flush(self, timeout=30):
+        """
+        等待队列中的记录全部写入数据库（进程退出前调用）
+
+        Returns:
+            bool: 是否已全部写入
+        """
+        self.start()
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if time.monotonic() >= deadline:
+                return False
+            self._wakeup.set()
+            time.sleep(0.2)
+        return True
+
+    def stats(self):
+        failed_path = self.directory / 'failed.jsonl'
+        failed = 0
+        if failed_path.exists():
+            with open(failed_path, 'rb') as f:
+                failed = sum(1 for _ in f)
+        return {
+            'pending': self.pending(),
+            'saved': self.saved,
+            'failed': failed,
+            'draining': self._lock_fd is not None,
+            'last_error': self.last_error,
+        }
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_persist_spool():
+    """根据配置创建（或返回已创建的）写入队列，并启动后台写入线程"""
+    global _spool
+    if _spool is None:
+        from config import Config
+        from utils.utils import save_many_to_database
+        with _spool_lock:
+            if _spool is None:
+                _spool = PersistSpool(
+                    Config.PERSIST_SPOOL_DIR,
+                    save_many_to_database,
+                    batch_size=Config.PERSIST_BATCH_SIZE,
+                    fsync=Config.PERSIST_FSYNC,
+                    retry_delay=Config.PERSIST_RETRY_DELAY,
+                    max_retry_delay=Config.PERSIST_MAX_RETRY_DELAY
+                )
+                _spool.start()
+    return _spool
+
+
+def has_spooled_records(directory):
+    """队列目录中是否有未删除的分段（启动时据此决定是否恢复写入）"""
+    return any(Path(directory).glob('spool-*.jsonl'))
+
+
+def persist_detection(detection_info, ocr_fields=None, ocr_source='ocr'):
+    """
+    保存识别结果
+
+    PERSIST_MODE=async 时追加到写入队列后立即返回；sync（默认）时直接写入数据库，
+    数据库暂时不可用时改为写入队列，识别结果不丢失、请求也不失败。
+    sync 模式下队列中还有记录时也写入队列，保证同一张图像的新结果不会被补写的旧结果覆盖。
+
+    Returns:
+        dict: 持久化状态，status 为 saved（已写入数据库）或 queued（已写入队列，id 为队列记录 ID）
+    """
+    from config import Config
+    from utils.utils import save_to_database
+
+    if Config.PERSIST_MODE != 'async' and not has_spooled_records(Config.PERSIST_SPOOL_DIR):
+        try:
+            return {'status': 'saved', 'invoice_id': save_to_database(detection_info, ocr_fields, ocr_source)}
+        except Exception as e:
+            if not is_transient_error(e):
+                raise
+            print(f"⚠️ 数据库暂时不可用，识别结果写入本地队列: {e}")
+            spool_id = get_persist_spool().append(detection_info, ocr_fields, ocr_source)
+            return {'status': 'queued', 'id': spool_id, 'error': str(e)}
+
+    return {'status': 'queued', 'id': get_persist_spool().append(detection_info, ocr_fields, ocr_source)}
@@ -0,0 +1,127 @@
+"""
+发票二维码读取 - 使用 OpenCV 定位并解码发票左上角的二维码
+
+增值税发票二维码内容为逗号分隔的字段：
+版本,发票种类,发票代码,发票号码,金额,开票日期(YYYYMMDD),校验码,加密信息
+例如：01,10,044031900111,12345678,100.00,20200101,12345678901234567890,ABCD
+数电发票没有发票代码和校验码，对应位置为空。
+"""
+import re
+import cv2
+
+
+# 二维码解码前的最大边长，过大的图像先缩小以加快定位
+QR_MAX_SIDE = 1600
+
+
+def parse_invoice_qr(text):
+    """
+    解析发票二维码内容
+
+    Args:
+        text: 二维码文本
+
+    Returns:
+        dict: {'raw', 'invoice_type', 'amount', 'fields'}，fields 为可直接使用的字段取值；
+              不是发票二维码时返回 None
+    """
+    parts = [p.strip() for p in text.split(',')]
+    if len(parts) < 6 or parts[0] != '01':
+        return None
+
+    invoice_code, invoice_number, amount, date = parts[2], parts[3], parts[4], parts[5]
+    check_code = parts[6] if len(parts) > 6 else ''
+
+    fields = {}
+    if re.fullmatch(r'\d{10,12}', invoice_code):
+        fields['invoice_code'] = invoice_code
+    if re.fullmatch(r'\d{8}|\d{20}', invoice_number):
+        fields['invoice_number'] = invoice_number
+    if re.fullmatch(r'\d{8}', date):
+        fields['invoice_date'] = f"{date[:4]}-{date[4:6]}-{date[6:]}"
+    if re.fullmatch(r'\d{20}', check_code):
+        fields['check_code'] = check_code
+    if not fields:
+        return None
+
+    try:
+        amount = float(amount)
+    except ValueError:
+        amount = None
+
+    return {
+        'raw': text,
+        'invoice_type': parts[1],
+        'amount': amount,
+        'fields': fields,
+    }
+
+
+def decode_invoice_qr(image):
+    """
+    定位并解码图像中的发票二维码
+
+    Args:
+        image: BGR 格式的图像数组
+
+    Returns:
+        dict: parse_invoice_qr 的返回值，未找到或无法解码时返回 None
+    """
+    scale = QR_MAX_SIDE / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    detector = cv2.QRCodeDetector()
+    try:
+        text, points, _ = detector.detectAndDecode(image)
+    except cv2.error as e:
+        print(f"⚠️ 二维码解码失败: {e}")
+        return None
+
+    if not text:
+        return None
+    return parse_invoice_qr(text)
+
+
+def check_qr_amount(qr_amount, detections):
+    """
+    用二维码中的金额核对 OCR 结果
+
+    二维码金额一般为不含税合计金额，数电发票可能为价税合计，两者都进行比较。
+
+    Args:
+        qr_amount: 二维码中的金额
+        detections: 检测结果列表
+
+    Returns:
+        str: 'amount'（与明细金额之和一致）、'total_amount'（与价税合计一致）、
+             'mismatch'（都不一致），无法比较时返回 None
+    """
+    if qr_amount is None:
+        return None
+
+    amounts = []
+    totals = []
+    for detection in detections:
+        value = detection.get('extracted_text')
+        if value is None:
+            continue
+        values = value if isinstance(value, list) else [value]
+        numbers = []
+        for v in values:
+            try:
+                numbers.append(float(str(v).replace('¥', '').replace('￥', '')))
+            except ValueError:
+                continue
+        if detection['class_name'] == 'amount':
+            amounts.extend(numbers)
+        elif detection['class_name'] == 'total_amount':
+            totals.extend(numbers)
+
+    if not amounts and not totals:
+        return None
+    if amounts and abs(sum(amounts) - qr_amount) < 0.01:
+        return 'amount'
+    if any(abs(t - qr_amount) < 0.01 for t in totals):
+        return 'total_amount'
+    return 'mismatch'
@@ -0,0 +1,257 @@
+"""
+汇总报表 - 按销售方、购买方、税率和月份维护发票汇总表
+
+每张发票写入时在同一事务中把它的金额计入汇总表；更新时先按旧值冲销再计入新值，
+报表接口直接读取汇总表，无需扫描发票表。
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+
+from model import Invoice, SellerMonthlyReport, BuyerMonthlyReport, TaxRateMonthlyReport
+
+
+# 汇总维度：名称 -> (汇总表, 维度列名)
+REPORT_DIMENSIONS = {
+    'seller': (SellerMonthlyReport, 'seller_tax_id'),
+    'buyer': (BuyerMonthlyReport, 'buyer_tax_id'),
+    'tax_rate': (TaxRateMonthlyReport, 'tax_rate'),
+}
+
+MEASURES = ('invoice_count', 'amount_sum', 'tax_amount_sum', 'total_amount_sum')
+
+CENT = Decimal('0.01')
+
+
+def _to_decimal(value):
+    try:
+        return Decimal(str(value)).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _sum(values):
+    return sum((d for d in (_to_decimal(v) for v in values) if d is not None), Decimal('0.00'))
+
+
+def rate_key(rate):
+    """税率键：13.0 -> '13'，0.13 -> '13'（按百分比表示）"""
+    try:
+        rate = float(rate)
+    except (TypeError, ValueError):
+        return ''
+    if 0 < rate < 1:
+        rate *= 100
+    return f"{round(rate, 2):g}"
+
+
+def invoice_contributions(invoice):
+    """
+    计算发票对各汇总表的贡献
+
+    Args:
+        invoice: Invoice 实例（类型化查询字段已填充）
+
+    Returns:
+        list: (维度名称, 维度取值, 月份, 名称, 度量字典) 列表
+    """
+    month = invoice.invoice_date_value.strftime('%Y-%m') if invoice.invoice_date_value else ''
+    amounts = _as_list(invoice.amount)
+    tax_amounts = _as_list(invoice.tax_amount)
+    measures = {
+        'invoice_count': 1,
+        'amount_sum': _sum(amounts),
+        'tax_amount_sum': _sum(tax_amounts),
+        'total_amount_sum': invoice.total_amount_value or Decimal('0.00'),
+    }
+
+    contributions = [
+        ('seller', invoice.seller_tax_id_key or '', month, invoice.seller_name, measures),
+        ('buyer', invoice.buyer_tax_id_key or '', month, invoice.buyer_name, measures),
+    ]
+
+    # 税率：按明细行对齐金额和税额，同一税率的明细合并
+    rates = _as_list(invoice.tax_rate)
+    by_rate = defaultdict(lambda: {'amount_sum': Decimal('0.00'), 'tax_amount_sum': Decimal('0.00')})
+    for index, rate in enumerate(rates):
+        line = by_rate[rate_key(rate)]
+        if index < len(amounts):
+            line['amount_sum'] += _to_decimal(amounts[index]) or 0
+        if index < len(tax_amounts):
+            line['tax_amount_sum'] += _to_decimal(tax_amounts[index]) or 0
+    if not by_rate:
+        by_rate[''] = {'amount_sum': measures['amount_sum'], 'tax_amount_sum': measures['tax_amount_sum']}
+    for rate, line in by_rate.items():
+        contributions.append(('tax_rate', rate, month, None, {
+            'invoice_count': 1,
+            'amount_sum': line['amount_sum'],
+            'tax_amount_sum': line['tax_amount_sum'],
+            'total_amount_sum': line['amount_sum'] + line['tax_amount_sum'],
+        }))
+    return contributions
+
+
+def _apply_delta(db, model, key_column, key, month, name, measures, sign):
+    """用 UPDATE ... SET x = x + delta 累加，行不存在时插入（并发插入冲突时改为累加）"""
+    key_filter = (getattr(model, key_column) == key, model.month == month)
+    values = {m: getattr(model, m) + measures[m] * sign for m in MEASURES}
+    if name and sign > 0 and hasattr(model, 'name'):
+        values['name'] = str(name)[:255]
+
+    if db.execute(update(model).where(*key_filter).values(**values)).rowcount:
+        return
+    row = {'month': month, key_column: key, **{m: measures[m] * sign for m in MEASURES}}
+    if 'name' in values:
+        row['name'] = values['name']
+    try:
+        with db.begin_nested():
+            db.add(model(**row))
+    except IntegrityError:
+        db.execute(update(model).where(*key_filter).values(**values))
+
+
+def apply_invoice_report(db, invoice, sign):
+    """
+    将发票计入（sign=1）或冲销（sign=-1）汇总表，不提交事务
+
+    Args:
+        db: 数据库会话（与发票写入使用同一事务）
+        invoice: Invoice 实例
+        sign: 1 或 -1
+    """
+    for dimension, key, month, name, measures in invoice_contributions(invoice):
+        model, key_column = REPORT_DIMENSIONS[dimension]
+        _apply_delta(db, model, key_column, key, month, name, measures, sign)
+    invoice.report_applied = sign > 0
+
+
+def rebuild_reports(session_factory, batch_size=1000):
+    """
+    清空并按发票表重建所有汇总表（首次启用或数据修复时使用）
+
+    Args:
+        session_factory: 数据库会话工厂
+        batch_size: 每批处理的发票数
+
+    Returns:
+        int: 计入的发票数
+    """
+    db = session_factory()
+    try:
+        for model, _ in REPORT_DIMENSIONS.values():
+            db.query(model).delete()
+        db.execute(update(Invoice).values(report_applied=False, updated_at=Invoice.updated_at))
+        db.commit()
+    finally:
+        db.close()
+
+    total = 0
+    last_id = 0
+    while True:
+        db = session_factory()
+        try:
+            invoices = db.query(Invoice).filter(Invoice.id > last_id) \
+                .order_by(Invoice.id).limit(batch_size).all()
+            if not invoices:
+                return total
+            for invoice in invoices:
+                apply_invoice_report(db, invoice, 1)
+                # 只是汇总状态变化，不更新 updated_at（避免变更订阅把所有发票当作已修改）
+                set_committed_value(invoice, 'report_applied', True)
+            db.execute(
+                update(Invoice)
+                .where(Invoice.id.in_([invoice.id for invoice in invoices]))
+                .values(report_applied=True, updated_at=Invoice.updated_at)
+            )
+            db.commit()
+            last_id = invoices[-1].id
+            total += len(invoices)
+            print(f"🔄 已汇总 {total} 张发票")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def query_report(db, dimension, month_from=None, month_to=None, key=None, by_month=False,
+                 order_by='total_amount_sum', limit=100):
+    """
+    查询汇总表
+
+    Args:
+        db: 数据库会话
+        dimension: 'seller'、'buyer' 或 'tax_rate'
+        month_from: 起始月份 YYYY-MM（包含）
+        month_to: 结束月份 YYYY-MM（包含）
+        key: 只查询指定的纳税人识别号或税率
+        by_month: 是否按月分别返回（否则合并所选月份）
+        order_by: 排序度量，倒序
+        limit: 最多返回的行数
+
+    Returns:
+        list: 汇总行字典列表
+    """
+    model, key_column = REPORT_DIMENSIONS[dimension]
+    key_attr = getattr(model, key_column)
+    sums = [func.sum(getattr(model, m)).label(m) for m in MEASURES]
+    group = [key_attr, model.month] if by_month else [key_attr]
+    columns = list(group) + sums
+    if hasattr(model, 'name'):
+        columns.append(func.max(model.name).label('name'))
+
+    query = db.query(*columns)
+    if month_from:
+        query = query.filter(model.month >= month_from)
+    if month_to:
+        query = query.filter(model.month <= month_to)
+    if key is not None:
+        query = query.filter(key_attr == key)
+    query = query.group_by(*group).having(func.sum(model.invoice_count) != 0)
+
+    order_column = order_by if order_by in MEASURES else 'total_amount_sum'
+    rows = query.order_by(func.sum(getattr(model, order_column)).desc()).limit(limit).all()
+
+    result = []
+    for row in rows:
+        item = {key_column: getattr(row, key_column)}
+        if by_month:
+            item['month'] = row.month
+        if hasattr(model, 'name'):
+            item['name'] = row.name
+        item['invoice_count'] = int(row.invoice_count or 0)
+        for m in MEASURES[1:]:
+            item[m] = float(getattr(row, m) or 0)
+        result.append(item)
+    return result
+
+
+def monthly_totals(db, month_from=None, month_to=None):
+    """
+    按月汇总所有发票（每张发票在销售方汇总表中只计入一次）
+
+    Returns:
+        list: 每月一行，按月份排序
+    """
+    model = SellerMonthlyReport
+    query = db.query(model.month, *[func.sum(getattr(model, m)).label(m) for m in MEASURES])
+    if month_from:
+        query = query.filter(model.month >= month_from)
+    if month_to:
+        query = query.filter(model.month <= month_to)
+    rows = query.group_by(model.month).having(func.sum(model.invoice_count) != 0) \
+        .order_by(model.month).all()
+    return [dict(
+        month=row.month,
+        invoice_count=int(row.invoice_count or 0),
+        **{m: float(getattr(row, m) or 0) for m in MEASURES[1:]}
+    ) for row in rows]
@@ -0,0 +1,326 @@
+"""
+识别结果输出 - 保存每张发票的识别结果（save_json）
+
+两种模式（RESULT_SINK 配置）：
+- files（默认，兼容旧版本）：每张发票一个缩进格式的 output/<image_name>.json
+- shards：紧凑的 JSON 行追加到按大小、时间轮转的分片文件（output/shards/results-*.jsonl），
+  按时间间隔批量 fsync；index.db 记录 image_name -> (分片, 偏移, 长度)，可随机读取单条结果。
+  避免单个目录中积累数百万个小文件。
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+class FileResultSink:
+    """每张发票一个 JSON 文件（旧版本的输出方式）"""
+
+    def __init__(self, directory='output'):
+        self.directory = Path(directory)
+
+    def _path(self, image_name):
+        return self.directory / f"{image_name}.json"
+
+    def write(self, detection_info):
+        """
+        保存识别结果
+
+        Returns:
+            str: 结果位置（文件路径）
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        output_path = self._path(detection_info['image_name'])
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(detection_info, f, ensure_ascii=False, indent=4)
+        return str(output_path)
+
+    def location(self, image_name):
+        path = self._path(image_name)
+        return str(path) if path.exists() else None
+
+    def get(self, image_name):
+        """读取识别结果，不存在时返回 None"""
+        try:
+            with open(self._path(image_name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def iter_results(self):
+        """
+        遍历所有识别结果
+
+        Yields:
+            tuple: (image_name, 识别结果字典)
+        """
+        for json_file in sorted(self.directory.glob("*.json")):
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    yield json_file.stem, json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取结果文件失败 {json_file.name}: {e}")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ShardedResultSink:
+    """
+    分片追加的识别结果
+
+    每个进程写自己的分片（文件名带进程号），不需要跨进程加锁；索引使用 SQLite（WAL），多个进程可同时写入。
+    记录先写入分片，fsync 之后才写入索引，索引指向的数据一定已经落盘。
+    """
+
+    def __init__(self, directory='output/shards', max_shard_bytes=256 * 1024 * 1024, max_shard_seconds=3600,
+                 fsync_interval=1.0):
+        """
+        Args:
+            directory: 分片目录
+            max_shard_bytes: 单个分片的最大字节数，超过后轮转
+            max_shard_seconds: 单个分片的最长写入时间（秒），超过后轮转
+            fsync_interval: 批量 fsync 的间隔（秒），间隔内的记录一起 fsync 并写入索引；为 0 时每条记录 fsync
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_shard_bytes = max_shard_bytes
+        self.max_shard_seconds = max_shard_seconds
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.RLock()
+        self._file = None
+        self._shard_name = None
+        self._shard_opened_at = 0
+        self._shard_seq = 0
+        self._pending = {}  # 已写入分片、尚未 fsync 和写入索引的记录：image_name -> (分片, 偏移, 长度)
+        self._last_sync = time.monotonic()
+        self._closed = False
+
+        self._conn = sqlite3.connect(str(self.directory / 'index.db'), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                image_name TEXT PRIMARY KEY,
+                shard TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                written_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self.recover()
+
+        self._stop = threading.Event()
+        if fsync_interval > 0:
+            # 写入停止后也按时 fsync，不让记录长时间停留在未索引状态
+            self._flusher = threading.Thread(target=self._flush_loop, name='result-sink-flush', daemon=True)
+            self._flusher.start()
+
+    def recover(self):
+        """
+        为分片末尾未写入索引的完整记录补建索引（进程在 fsync 与写入索引之间退出时留下）
+
+        已有索引的 image_name 不覆盖（可能已被之后的处理更新）。
+
+        Returns:
+            int: 补建索引的记录数
+        """
+        indexed_end = dict(self._conn.execute(
+            "SELECT shard, MAX(offset + length) FROM results GROUP BY shard"
+        ).fetchall())
+        rows = []
+        for shard_path in sorted(self.directory.glob('results-*.jsonl')):
+            offset = indexed_end.get(shard_path.name, 0)
+            with open(shard_path, 'rb') as f:
+                f.seek(offset)
+                for line in iter(f.readline, b''):
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        image_name = json.loads(line)['image_name']
+                    except (ValueError, KeyError, TypeError):
+                        image_name = None
+                    if image_name is not None:
+                        rows.append((image_name, shard_path.name, offset, len(line), time.time()))
+                    offset += len(line)
+        if rows:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO results (image_name, shard, offset, length, written_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            print(f"🔄 识别结果索引已补建 {len(rows)} 条记录")
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ 识别结果 fsync 失败: {e}")
+
+    def _open_shard(self):
+        self._shard_seq += 1
+        self._shard_name = f"results-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._shard_seq}.jsonl"
+        self._file = open(self.directory / self._shard_name, 'ab')
+        self._shard_opened_at = time.monotonic()
+
+    def _should_rotate(self):
+        return (self._file.tell() >= self.max_shard_bytes
+                or time.monotonic() - self._shard_opened_at >= self.max_shard_seconds)
+
+    def write(self, detection_info):
+        """
+        追加识别结果
+
+        Returns:
+            str: 结果位置（分片文件名#偏移）
+        """
+        line = (json.dumps(detection_info, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._open_shard()
+            elif self._should_rotate():
+                self.flush()
+                self._file.close()
+                self._open_shard()
+
+            offset = self._file.tell()
+            self._file.write(line)
+            self._pending[detection_info['image_name']] = (self._shard_name, offset, len(line))
+            if self.fsync_interval <= 0 or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self.flush()
+            return f"{self._shard_name}#{offset}"
+
+    def flush(self):
+        """fsync 当前分片并把待写入的记录写入索引"""
+        with self._lock:
+            self._last_sync = time.monotonic()
+            if not self._pending:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (image_name, shard, offset, length, written_at) VALUES (?, ?, ?, ?, ?)",
+                [(name, shard, offset, length, now) for name, (shard, offset, length) in self._pending.items()]
+            )
+            self._conn.commit()
+            self._pending.clear()
+
+    def _lookup(self, image_name):
+        with self._lock:
+            if image_name in self._pending:
+                return self._pending[image_name]
+            return self._conn.execute(
+                "SELECT shard, offset, length FROM results WHERE image_name = ?", (image_name,)
+            ).fetchone()
+
+    def location(self, image_name):
+        entry = self._lookup(image_name)
+        return f"{entry[0]}#{entry[1]}" if entry else None
+
+    def _read(self, shard, offset, length):
+        with self._lock:
+            # 读取当前分片中尚未刷新的记录前先刷新缓冲区
+            if self._file is not None and shard == self._shard_name:
+                self._file.flush()
+        with open(self.directory / shard, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def get(self, image_name):
+        """按索引随机读取识别结果，不存在时返回 None"""
+        entry = self._lookup(image_name)
+        return self._read(*entry) if entry else None
+
+    def iter_results(self):
+        """
+        遍历所有识别结果（每个 image_name 只返回最近一次写入的结果，按分片顺序读取）
+
+        Yields:
+            tuple: (image_name, 识别结果字典)
+        """
+        self.flush()
+        rows = self._conn.execute(
+            "SELECT image_name, shard, offset, length FROM results ORDER BY shard, offset"
+        ).fetchall()
+        current_shard = None
+        f = None
+        try:
+            for image_name, shard, offset, length in rows:
+                if shard != current_shard:
+                    if f is not None:
+                        f.close()
+                    f = open(self.directory / shard, 'rb')
+                    current_shard = shard
+                f.seek(offset)
+                yield image_name, json.loads(f.read(length))
+        finally:
+            if f is not None:
+                f.close()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            if self._closed:
+                return
+            self.flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._conn.close()
+            self._closed = True
+
+
+def open_result_sink(mode, directory='output', max_shard_mb=256, max_shard_seconds=3600, fsync_interval=1.0):
+    """
+    创建识别结果输出
+
+    Args:
+        mode: files 或 shards
+        directory: 输出目录（shards 模式的分片保存在其下的 shards 子目录）
+
+    Raises:
+        ValueError: 不支持的模式
+    """
+    if mode == 'files':
+        return FileResultSink(directory)
+    if mode == 'shards':
+        return ShardedResultSink(
+            Path(directory) / 'shards',
+            max_shard_bytes=max_shard_mb * 1024 * 1024,
+            max_shard_seconds=max_shard_seconds,
+            fsync_interval=fsync_interval
+        )
+    raise ValueError(f"不支持的结果输出方式: {mode}（可选 files、shards）")
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_result_sink():
+    """根据配置创建（或返回已创建的）识别结果输出"""
+    global _sink
+    if _sink is None:
+        from config import Config
+        with _sink_lock:
+            if _sink is None:
+                _sink = open_result_sink(
+                    Config.RESULT_SINK,
+                    Config.RESULT_SINK_DIR,
+                    max_shard_mb=Config.RESULT_SHARD_MAX_MB,
+                    max_shard_seconds=Config.RESULT_SHARD_MAX_SECONDS,
+                    fsync_interval=Config.RESULT_FSYNC_INTERVAL
+                )
+                # 进程退出前 fsync 并写入索引
+                atexit.register(_sink.close)
+    return _sink
@@ -0,0 +1,492 @@
+"""
+分布式工作队列 - 基于数据库的作业/任务表，多台主机上的 worker 通过租约领取识别任务
+
+一个作业（Job）按文件拆分为多个任务（Task）。worker 领取任务时写入自己的 ID 和租约到期时间，
+处理期间定期心跳续约；worker 崩溃后租约到期，任务会被其他 worker 重新领取。
+失败的任务按指数退避重试，超过最大尝试次数后进入死信（dead），可通过接口手动重试。
+
+领取使用带条件的 UPDATE（状态仍可领取才更新），依靠受影响行数判断是否领取成功，
+不依赖 SELECT ... FOR UPDATE SKIP LOCKED，因此 MySQL 5.7 和 SQLite 均可使用。
+租约、重试等时间均取自数据库时钟，各 worker 主机的时钟不一致也不会提前或延后接管任务。
+"""
+import os
+import random
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, func, select, update
+
+from db import SessionLocal
+from model import Job, Task
+from services.batch_runner import BatchCancelled
+from services.file_scanner import relative_image_name
+from services.result_sink import get_result_sink
+
+
+# 任务的终止状态
+TERMINAL_STATUSES = ('success', 'dead')
+
+
+def db_now(db):
+    """
+    数据库的当前时间（所有主机使用同一时钟）
+
+    SQLite 只能由本机进程访问，且 CURRENT_TIMESTAMP 为 UTC，与其他列使用的本地时间不一致，因此使用本机时间。
+    """
+    if db.get_bind().dialect.name == 'sqlite':
+        return datetime.now()
+    return db.execute(select(func.now())).scalar()
+
+
+def default_worker_id():
+    """默认 worker ID：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """数据库工作队列"""
+
+    def __init__(self, session_factory=SessionLocal, lease_seconds=300, max_attempts=3, retry_delay=30):
+        """
+        初始化工作队列
+
+        Args:
+            session_factory: 数据库会话工厂
+            lease_seconds: 租约时长（秒），超过该时间未心跳的任务可被重新领取
+            max_attempts: 默认最大尝试次数
+            retry_delay: 首次重试的延迟（秒），之后每次翻倍
+        """
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def create_job(self, file_paths, options=None, name=None, max_attempts=None, chunk_size=1000):
+        """
+        创建作业并为每个文件写入一个任务
+
+        任务按 chunk_size 分批写入并提交，file_paths 为惰性迭代器时 worker 可以在扫描完成前开始领取。
+
+        Args:
+            file_paths: 文件路径列表或迭代器（路径需在所有 worker 主机上可访问）
+            options: 处理选项，如 {'save_json': True, 'save_db': True}
+            name: 作业名称
+            max_attempts: 最大尝试次数，为 None 时使用队列默认值
+            chunk_size: 每次提交的任务数
+
+        Returns:
+            str: 作业 ID
+        """
+        max_attempts = max_attempts or self.max_attempts
+        job_id = uuid.uuid4().hex
+        db = self.session_factory()
+        try:
+            # 写入任务期间状态为 enqueuing，避免 worker 处理完已写入的任务后提前把作业标记为完成
+            job = Job(id=job_id, name=name, status='enqueuing', options=options or {}, total_tasks=0)
+            db.add(job)
+            db.commit()
+
+            chunk = []
+            now = db_now(db)
+            for path in file_paths:
+                chunk.append({
+                    'job_id': job_id,
+                    'file_path': str(path),
+                    'status': 'pending',
+                    'attempts': 0,
+                    'max_attempts': max_attempts,
+                    'available_at': now,
+                    'created_at': now,
+                    'updated_at': now,
+                })
+                if len(chunk) >= chunk_size:
+                    self._insert_tasks(db, job, chunk)
+                    chunk = []
+                    now = db_now(db)
+            if chunk:
+                self._insert_tasks(db, job, chunk)
+
+            job.status = 'pending'
+            db.commit()
+            self._refresh_jobs(db, [job_id])
+            return job_id
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _insert_tasks(db, job, chunk):
+        db.bulk_insert_mappings(Task, chunk)
+        job.total_tasks += len(chunk)
+        db.commit()
+
+    def claim(self, worker_id, limit=1):
+        """
+        领取可执行的任务
+
+        可领取的任务：待处理且到达重试时间的任务，或租约已过期且未超过最大尝试次数的任务。
+
+        Args:
+            worker_id: worker ID
+            limit: 最多领取的任务数
+
+        Returns:
+            list: 任务字典列表 {'id', 'job_id', 'file_path', 'attempts', 'options'}
+        """
+        db = self.session_factory()
+        try:
+            now = db_now(db)
+            self._dead_letter_expired(db, now)
+
+            claimable = or_(
+                and_(Task.status == 'pending', Task.available_at <= now),
+                and_(Task.status == 'running', Task.lease_expires_at < now,
+                     Task.attempts < Task.max_attempts),
+            )
+            # 多取一些候选并打乱顺序，降低多个 worker 同时争抢同一任务的概率
+            candidates = [row[0] for row in db.query(Task.id).filter(claimable)
+                          .order_by(Task.id).limit(limit * 4).all()]
+            random.shuffle(candidates)
+
+            claimed = []
+            for task_id in candidates:
+                if len(claimed) >= limit:
+                    break
+                result = db.execute(
+                    update(Task)
+                    .where(Task.id == task_id, claimable)
+                    .values(status='running', worker_id=worker_id, attempts=Task.attempts + 1,
+                            lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                            heartbeat_at=now, updated_at=now)
+                )
+                db.commit()
+                if result.rowcount == 1:
+                    claimed.append(task_id)
+
+            if not claimed:
+                return []
+
+            rows = db.query(Task, Job.options).join(Job, Job.id == Task.job_id) \
+                .filter(Task.id.in_(claimed)).all()
+            job_ids = {task.job_id for task, _ in rows}
+            db.execute(
+                update(Job)
+                .where(Job.id.in_(job_ids), Job.status == 'pending')
+                .values(status='running', updated_at=now)
+            )
+            db.commit()
+            return [{
+                'id': task.id,
+                'job_id': task.job_id,
+                'file_path': task.file_path,
+                'attempts': task.attempts,
+                'options': options or {},
+            } for task, options in rows]
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def heartbeat(self, task_id, worker_id):
+        """
+        续约任务
+
+        Returns:
+            bool: 是否仍持有租约（为 False 时任务已被其他 worker 领取）
+        """
+        db = self.session_factory()
+        try:
+            now = db_now(db)
+            result = db.execute(
+                update(Task)
+                .where(Task.id == task_id, Task.worker_id == worker_id, Task.status == 'running')
+                .values(lease_expires_at=now + timedelta(seconds=self.lease_seconds), heartbeat_at=now)
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    def complete(self, task_id, worker_id, result=None):
+        """
+        标记任务成功
+
+        Returns:
+            bool: 是否仍持有租约
+        """
+        return self._finish(task_id, worker_id, status='success', result=result, last_error=None)
+
+    def fail(self, task_id, worker_id, error):
+        """
+        标记任务失败：未超过最大尝试次数时按指数退避重新排队，否则进入死信
+
+        Returns:
+            bool: 是否仍持有租约
+        """
+        db = self.session_factory()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            if task is None:
+                return False
+            attempts, max_attempts = task.attempts, task.max_attempts
+        finally:
+            db.close()
+
+        if attempts >= max_attempts:
+            print(f"💀 任务进入死信: {task_id} ({error})")
+            return self._finish(task_id, worker_id, status='dead', last_error=error)
+
+        delay = self.retry_delay * 2 ** max(attempts - 1, 0)
+        return self._finish(task_id, worker_id, status='pending', last_error=error, available_in=delay)
+
+    def release(self, task_id, worker_id):
+        """
+        归还任务（worker 主动退出时），不计入尝试次数
+
+        Returns:
+            bool: 是否仍持有租约
+        """
+        return self._finish(task_id, worker_id, status='pending', attempts=Task.attempts - 1, available_in=0)
+
+    def _finish(self, task_id, worker_id, available_in=None, **values):
+        """
+        仅当 worker 仍持有租约时更新任务状态
+
+        Args:
+            available_in: 重新排队时，任务在多少秒后可再次领取
+        """
+        db = self.session_factory()
+        try:
+            now = db_now(db)
+            if available_in is not None:
+                values['available_at'] = now + timedelta(seconds=available_in)
+            result = db.execute(
+                update(Task)
+                .where(Task.id == task_id, Task.worker_id == worker_id, Task.status == 'running')
+                .values(worker_id=None, lease_expires_at=None, updated_at=now, **values)
+            )
+            db.commit()
+            if result.rowcount != 1:
+                return False
+            job_id = db.query(Task.job_id).filter(Task.id == task_id).scalar()
+            self._refresh_jobs(db, [job_id])
+            return True
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _dead_letter_expired(self, db, now):
+        """将租约过期且已用完尝试次数的任务移入死信（worker 在最后一次尝试时崩溃）"""
+        expired = and_(Task.status == 'running', Task.lease_expires_at < now,
+                       Task.attempts >= Task.max_attempts)
+        job_ids = [row[0] for row in db.query(Task.job_id).filter(expired).distinct().all()]
+        if not job_ids:
+            return
+        db.execute(
+            update(Task)
+            .where(expired)
+            .values(status='dead', worker_id=None, lease_expires_at=None, updated_at=now,
+                    last_error='租约过期（worker 可能已崩溃）')
+        )
+        db.commit()
+        self._refresh_jobs(db, job_ids)
+
+    @staticmethod
+    def _refresh_jobs(db, job_ids):
+        """所有任务都已终止的作业标记为完成"""
+        for job_id in job_ids:
+            remaining = db.query(func.count(Task.id)).filter(
+                Task.job_id == job_id, Task.status.notin_(TERMINAL_STATUSES)
+            ).scalar()
+            if remaining == 0:
+                now = db_now(db)
+                db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status.in_(('pending', 'running')))
+                    .values(status='completed', finished_at=now, updated_at=now)
+                )
+        db.commit()
+
+    def retry_dead(self, job_id):
+        """
+        将作业中的死信任务重新排队
+
+        Returns:
+            int: 重新排队的任务数
+        """
+        db = self.session_factory()
+        try:
+            now = db_now(db)
+            result = db.execute(
+                update(Task)
+                .where(Task.job_id == job_id, Task.status == 'dead')
+                .values(status='pending', attempts=0, available_at=now, updated_at=now)
+            )
+            if result.rowcount:
+                db.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == 'completed')
+                    .values(status='running', finished_at=None, updated_at=now)
+                )
+            db.commit()
+            return result.rowcount
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def job_summary(self, job_id, error_limit=100):
+        """
+        获取作业状态
+
+        Args:
+            job_id: 作业 ID
+            error_limit: 返回的死信任务数上限
+
+        Returns:
+            dict: 作业信息、各状态任务数和死信任务，作业不存在时返回 None
+        """
+        db = self.session_factory()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if job is None:
+                return None
+
+            counts = dict(db.query(Task.status, func.count(Task.id))
+                          .filter(Task.job_id == job_id).group_by(Task.status).all())
+            dead = db.query(Task).filter(Task.job_id == job_id, Task.status == 'dead') \
+                .order_by(Task.id).limit(error_limit).all()
+            return {
+                'job_id': job.id,
+                'name': job.name,
+                'status': job.status,
+                'options': job.options,
+                'total': job.total_tasks,
+                'pending_count': counts.get('pending', 0),
+                'running_count': counts.get('running', 0),
+                'success_count': counts.get('success', 0),
+                'dead_count': counts.get('dead', 0),
+                'dead': [{
+                    'task_id': task.id,
+                    'file': task.file_path,
+                    'attempts': task.attempts,
+                    'error': task.last_error
+                } for task in dead],
+                'created_at': job.created_at.isoformat() if job.created_at else None,
+                'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            }
+        finally:
+            db.close()
+
+
+class QueueWorker:
+    """
+    队列 worker - 循环领取任务并调用 InvoiceService 识别
+
+    每个任务处理期间由后台线程按 heartbeat_interval 心跳续约；续约失败说明租约已被其他 worker
+    接管，此时通过取消标志中止当前识别，不再写回结果。
+    """
+
+    def __init__(self, work_queue, invoice_service, worker_id=None, batch_size=1,
+                 poll_interval=2, heartbeat_interval=None):
+        """
+        初始化 worker
+
+        Args:
+            work_queue: WorkQueue 实例
+            invoice_service: InvoiceService 实例
+            worker_id: worker ID，为 None 时使用 主机名-进程号
+            batch_size: 每次领取的任务数
+            poll_interval: 队列为空时的轮询间隔（秒）
+            heartbeat_interval: 心跳间隔（秒），默认为租约时长的 1/3
+        """
+        self.queue = work_queue
+        self.invoice_service = invoice_service
+        self.worker_id = worker_id or default_worker_id()
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval or max(work_queue.lease_seconds / 3, 1)
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        """处理完当前任务后停止"""
+        self.stop_event.set()
+
+    def run(self, once=False):
+        """
+        运行 worker
+
+        Args:
+            once: 为 True 时队列为空即退出
+        """
+        print(f"👷 Worker 已启动: {self.worker_id}")
+        processed = 0
+        while not self.stop_event.is_set():
+            tasks = self.queue.claim(self.worker_id, self.batch_size)
+            if not tasks:
+                if once:
+                    break
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            for index, task in enumerate(tasks):
+                if self.stop_event.is_set():
+                    # 归还尚未开始的任务
+                    for rest in tasks[index:]:
+                        self.queue.release(rest['id'], self.worker_id)
+                    break
+                self.run_task(task)
+                processed += 1
+        print(f"👷 Worker 已停止: {self.worker_id}，共处理 {processed} 个任务")
+        return processed
+
+    def run_task(self, task):
+        """处理单个任务，期间保持心跳"""
+        lease_lost = threading.Event()
+        done = threading.Event()
+
+        def keep_alive():
+            while not done.wait(self.heartbeat_interval):
+                if not self.queue.heartbeat(task['id'], self.worker_id):
+                    lease_lost.set()
+                    return
+
+        heartbeat_thread = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat_thread.start()
+        options = task['options']
+        image_name = relative_image_name(task['file_path'], options['root']) if options.get('root') else None
+        print(f"🔄 [{task['job_id'][:8]}] 第 {task['attempts']} 次处理: {task['file_path']}")
+        try:
+            result = self.invoice_service.process_image(
+                task['file_path'],
+                save_json=options.get('save_json', True),
+                save_db=options.get('save_db', True),
+                cancel_event=lease_lost,
+                image_name=image_name
+            )
+        except BatchCancelled:
+            print(f"⚠️ 任务租约已失效，放弃处理: {task['file_path']}")
+            return
+        except Exception as e:
+            self.queue.fail(task['id'], self.worker_id, str(e))
+            print(f"❌ 任务失败: {task['file_path']} ({e})")
+            return
+        finally:
+            done.set()
+            heartbeat_thread.join()
+
+        json_path = get_result_sink().location(result['image_name']) if options.get('save_json', True) else None
+        if not self.queue.complete(task['id'], self.worker_id, {
+            'image_name': result['image_name'],
+            'detection_count': result['检测项数'],
+            'json_path': json_path
+        }):
+            print(f"⚠️ 任务租约已失效，结果未记录: {task['file_path']}")
@@ -15,6 +15,18 @@ const submitBtn = document.getElementById('submitBtn');
 
 let selectedFiles = [];
 
+// 支持的压缩包格式（整包上传，服务端直接从压缩包读取图像）
+const ARCHIVE_SUFFIXES = ['.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz'];
+
+function isOfd(file) {
+    return file.name.toLowerCase().endsWith('.ofd');
+}
+
+function isArchive(file) {
+    const name = file.name.toLowerCase();
+    return ARCHIVE_SUFFIXES.some(suffix => name.endsWith(suffix));
+}
+
 // 更新文件列表显示
 function updateFileList() {
     if (selectedFiles.length === 0) {
@@ -51,7 +63,7 @@ uploadArea.addEventListener('drop', (e) => {
     e.preventDefault();
     uploadArea.classList.remove('dragover');
     const files = Array.from(e.dataTransfer.files).filter(f => 
-        f.type.startsWith('image/')
+        f.type.startsWith('image/') || f.type === 'application/pdf' || isOfd(f) || isArchive(f)
     );
     if (files.length > 0) {
         selectedFiles = files;
@@ -67,7 +79,7 @@ fileInput.addEventListener('change', (e) => {
 
 folderInput.addEventListener('change', (e) => {
     selectedFiles = Array.from(e.target.files).filter(f => 
-        f.type.startsWith('image/')
+        f.type.startsWith('image/') || f.type === 'application/pdf' || isOfd(f)
     );
     updateFileList();
 });
@@ -83,14 +95,27 @@ form.addEventListener('submit', async (e) => {
     
     const formData = new FormData();
     
-    // 多文件上传 - 使用流式接口获取进度
-    if (selectedFiles.length > 1) {
-        selectedFiles.forEach(file => {
-            formData.append('files[]', file);
-        });
-        
-        formData.append('save_json', form.save_json.checked);
-        formData.append('save_db', form.save_db.checked);
+    // 多文件或压缩包上传 - 使用流式接口获取进度
+    if (selectedFiles.length > 1 || isArchive(selectedFiles[0])) {
+        let url;
+        if (selectedFiles.length === 1) {
+            // 压缩包上传
+            formData.append('archive', selectedFiles[0]);
+            formData.append('save_json', form.save_json.checked);
+            formData.append('save_db', form.save_db.checked);
+            url = '/api/predict/stream';
+        } else {
+            selectedFiles.forEach(file => {
+                formData.append('files[]', file);
+            });
+            
+            // 边上传边识别：选项通过查询参数传递
+            const params = new URLSearchParams({
+                save_json: form.save_json.checked,
+                save_db: form.save_db.checked
+            });
+            url = `/api/predict/stream/incremental?${params}`;
+        }
         
         // 显示加载状态
         loading.classList.add('show');
@@ -104,7 +129,7 @@ form.addEventListener('submit', async (e) => {
         
         // 使用流式接口
         try {
-            const response = await fetch('/api/predict/stream', {
+            const response = await fetch(url, {
                 method: 'POST',
                 body: formData
             });
@@ -134,10 +159,14 @@ form.addEventListener('submit', async (e) => {
                             if (data.type === 'start') {
                                 updateProgress(0);
                             } else if (data.type === 'progress') {
-                                updateProgress(data.percent);
+                                // 上传完成前总数未知，percent 为 null
+                                if (data.percent !== null) {
+                                    updateProgress(data.percent);
+                                }
                                 // 可选：显示当前处理的文件
                                 if (data.file) {
-                                    progressText.textContent = `${data.percent}% - 正在处理: ${data.file}`;
+                                    const done = data.percent !== null ? `${data.percent}%` : `第 ${data.current} 个`;
+                                    progressText.textContent = `${done} - 正在处理: ${data.file}`;
                                 }
                             } else if (data.type === 'complete') {
                                 updateProgress(100);
@@ -1,2 +1,5 @@
-from .utils import extract_values, extract_text_from_bbox, save_to_database
+from .utils import (
+    extract_values, extract_text_from_bbox, normalize_field_value, fill_search_columns, save_to_database,
+    save_many_to_database, ocr_field_record, reextract_detections, upload_image_name
+)
 from .image_preprocessor import ImagePreprocessor
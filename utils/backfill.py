@@ -0,0 +1,222 @@
+"""
+数据回填 - 为已有发票记录补充新增的派生字段
+
+用法:
+    python utils/backfill.py search            # 回填类型化查询字段和全文检索文本
+    python utils/backfill.py search --all      # 重新计算所有记录
+    python utils/backfill.py reports           # 重建汇总报表
+    python utils/backfill.py items             # 为没有明细行的发票拆分明细
+    python utils/backfill.py items --all       # 重建所有发票的明细行
+    python utils/backfill.py reextract         # 用当前解析规则从保存的原始识别结果重新提取字段
+    python utils/backfill.py reextract --dry-run  # 只统计会变化的记录，不写入
+"""
+import sys
+from collections import Counter
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入模块
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import exists, or_
+
+from db import SessionLocal
+from model import Invoice, InvoiceItem, InvoiceOcr
+
+
+def iter_invoice_batches(query, batch_size=1000):
+    """
+    按主键分批遍历发票记录，每批处理后提交
+
+    Args:
+        query: 返回 (db, 查询) 的函数，查询不需要排序
+        batch_size: 每批记录数
+
+    Yields:
+        tuple: (db, 发票列表)
+    """
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            invoices = query(db).filter(Invoice.id > last_id) \
+                .order_by(Invoice.id).limit(batch_size).all()
+            if not invoices:
+                return
+            yield db, invoices
+            db.commit()
+            last_id = invoices[-1].id
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def backfill_search_columns(all_rows=False, batch_size=1000):
+    """
+    回填类型化查询字段
+
+    Args:
+        all_rows: 是否重新计算所有记录（默认只处理发票号码查询字段或全文检索文本为空的记录）
+        batch_size: 每批记录数
+
+    Returns:
+        int: 处理的记录数
+    """
+    from utils.utils import fill_search_columns
+
+    def query(db):
+        q = db.query(Invoice)
+        if not all_rows:
+            q = q.filter(or_(Invoice.invoice_number_key.is_(None), Invoice.search_text.is_(None)))
+        return q
+
+    total = 0
+    for db, invoices in iter_invoice_batches(query, batch_size):
+        for invoice in invoices:
+            fill_search_columns(invoice)
+        total += len(invoices)
+        print(f"🔄 已处理 {total} 条记录")
+    return total
+
+
+def backfill_invoice_items(all_rows=False, batch_size=1000):
+    """
+    将发票的明细列表字段拆分到 invoice_items 表
+
+    Args:
+        all_rows: 是否重建所有发票的明细行（默认只处理还没有明细行的发票）
+        batch_size: 每批记录数
+
+    Returns:
+        tuple: (处理的发票数, 写入的明细行数)
+    """
+    from services.invoice_items import replace_invoice_items
+
+    def query(db):
+        q = db.query(Invoice)
+        if not all_rows:
+            q = q.filter(~exists().where(InvoiceItem.invoice_id == Invoice.id))
+        return q
+
+    total = 0
+    lines = 0
+    for db, invoices in iter_invoice_batches(query, batch_size):
+        for invoice in invoices:
+            lines += replace_invoice_items(db, invoice)
+        total += len(invoices)
+        print(f"🔄 已处理 {total} 张发票，{lines} 条明细")
+    return total, lines
+
+
+def reextract_invoices(batch_size=1000, dry_run=False):
+    """
+    用当前的解析规则（extract_values、normalize_field_value）从 invoice_ocr 表保存的原始识别结果
+    重新提取字段值，不调用 YOLO 和 OCR
+
+    只更新值有变化的发票，同时冲销并重新计入汇总表、同步类型化查询字段。
+
+    Args:
+        batch_size: 每批记录数
+        dry_run: 只统计会变化的记录，不写入
+
+    Returns:
+        tuple: (处理的记录数, 有变化的记录数, 各字段变化次数 Counter)
+    """
+    from services.cache import invalidate_invoice
+    from services.reports import apply_invoice_report
+    from services.invoice_items import ITEM_FIELDS, replace_invoice_items
+    from utils.utils import fill_search_columns, normalize_field_value, reextract_detections
+
+    def query(db):
+        return db.query(Invoice).join(InvoiceOcr, InvoiceOcr.invoice_id == Invoice.id)
+
+    total = 0
+    changed_ids = []
+    field_changes = Counter()
+    pending = []
+    for db, invoices in iter_invoice_batches(query, batch_size):
+        # 上一批已提交，使其缓存失效
+        for invoice_id in pending:
+            invalidate_invoice(invoice_id)
+        pending = []
+
+        ocr_rows = db.query(InvoiceOcr).filter(InvoiceOcr.invoice_id.in_([i.id for i in invoices])).all()
+        fields_by_id = {row.invoice_id: row.fields for row in ocr_rows}
+        for invoice in invoices:
+            values = {}
+            for detection in reextract_detections(fields_by_id.get(invoice.id) or []):
+                class_name = detection['class_name']
+                if hasattr(invoice, class_name):
+                    values[class_name] = normalize_field_value(class_name, detection['extracted_text'])
+            changes = {k: v for k, v in values.items() if getattr(invoice, k) != v}
+            if not changes:
+                continue
+
+            field_changes.update(changes.keys())
+            changed_ids.append(invoice.id)
+            if dry_run:
+                continue
+            if invoice.report_applied:
+                apply_invoice_report(db, invoice, -1)
+            for class_name, value in changes.items():
+                setattr(invoice, class_name, value)
+            fill_search_columns(invoice)
+            if any(field in changes for field in ITEM_FIELDS):
+                replace_invoice_items(db, invoice)
+            apply_invoice_report(db, invoice, 1)
+            pending.append(invoice.id)
+
+        total += len(invoices)
+        print(f"🔄 已处理 {total} 条记录，{len(changed_ids)} 条有变化")
+
+    for invoice_id in pending:
+        invalidate_invoice(invoice_id)
+    return total, len(changed_ids), field_changes
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='为已有发票记录回填派生字段')
+    subparsers = parser.add_subparsers(dest='target', required=True)
+
+    search_parser = subparsers.add_parser('search', help='回填类型化查询字段和全文检索文本')
+    search_parser.add_argument('--all', action='store_true', help='重新计算所有记录')
+    search_parser.add_argument('--batch-size', type=int, default=1000, help='每批记录数')
+
+    reports_parser = subparsers.add_parser('reports', help='清空并重建汇总报表')
+    reports_parser.add_argument('--batch-size', type=int, default=1000, help='每批记录数')
+
+    items_parser = subparsers.add_parser('items', help='将明细列表字段拆分为明细行')
+    items_parser.add_argument('--all', action='store_true', help='重建所有发票的明细行')
+    items_parser.add_argument('--batch-size', type=int, default=1000, help='每批记录数')
+
+    reextract_parser = subparsers.add_parser('reextract', help='用当前解析规则从保存的原始识别结果重新提取字段')
+    reextract_parser.add_argument('--batch-size', type=int, default=1000, help='每批记录数')
+    reextract_parser.add_argument('--dry-run', action='store_true', help='只统计会变化的记录，不写入')
+
+    args = parser.parse_args()
+
+    if args.target == 'search':
+        total = backfill_search_columns(all_rows=args.all, batch_size=args.batch_size)
+        print(f"✅ 回填完成！共处理 {total} 条记录")
+    elif args.target == 'reports':
+        from services.reports import rebuild_reports
+        total = rebuild_reports(SessionLocal, batch_size=args.batch_size)
+        print(f"✅ 汇总报表重建完成！共计入 {total} 张发票")
+    elif args.target == 'items':
+        total, lines = backfill_invoice_items(all_rows=args.all, batch_size=args.batch_size)
+        print(f"✅ 明细拆分完成！共处理 {total} 张发票，写入 {lines} 条明细")
+    elif args.target == 'reextract':
+        total, changed, field_changes = reextract_invoices(batch_size=args.batch_size, dry_run=args.dry_run)
+        for class_name, count in field_changes.most_common():
+            print(f"  {class_name}: {count}")
+        action = '将会更新' if args.dry_run else '已更新'
+        print(f"✅ 重新提取完成！共处理 {total} 条记录，{action} {changed} 条")
+
+
+if __name__ == '__main__':
+    main()
@@ -121,6 +121,27 @@ def convert_json_to_llm_format(
     with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
+    return convert_result_to_llm_format(data, image_path, output_format, use_variants)
+
+
+def convert_result_to_llm_format(
+    data: Dict[str, Any],
+    image_path: Path,
+    output_format: str = "llava",
+    use_variants: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    将单条识别结果转换为大模型训练格式
+    
+    Args:
+        data: 识别结果（save_json 保存的内容）
+        image_path: 对应的图像文件路径
+        output_format: 输出格式 ("llava" 或 "qwen-vl")
+        use_variants: 是否使用指令变体（数据增强）
+        
+    Returns:
+        List[Dict]: 转换后的数据列表（如果使用变体，可能返回多条）
+    """
     # 转换为文本输出
     detections = data.get('detections', [])
     output_text = convert_detection_to_text(detections)
@@ -197,25 +218,28 @@ def batch_convert(
     image_dir: Path,
     output_file: Path,
     output_format: str = "llava",
-    use_variants: bool = True
+    use_variants: bool = True,
+    sink: str = "files"
 ):
     """
-    批量转换JSON文件为大模型训练格式
+    批量转换识别结果为大模型训练格式
     
     Args:
-        json_dir: JSON文件目录
+        json_dir: 识别结果目录
         image_dir: 图像文件目录
         output_file: 输出文件路径（JSONL格式）
         output_format: 输出格式
         use_variants: 是否使用指令变体
+        sink: 识别结果的保存方式（files：每张发票一个 JSON 文件；shards：JSONL 分片）
     """
-    json_files = list(json_dir.glob("*.json"))
+    from services.result_sink import open_result_sink
+    
+    result_sink = open_result_sink(sink, json_dir)
     total_records = 0
     
     with open(output_file, 'w', encoding='utf-8') as f:
-        for json_file in json_files:
+        for image_name, data in result_sink.iter_results():
             # 尝试找到对应的图像文件
-            image_name = json_file.stem
             # 尝试多种可能的图像文件名
             possible_image_names = [
                 image_name,
@@ -234,13 +258,13 @@ def batch_convert(
                     break
             
             if not image_path:
-                print(f"⚠️  未找到图像文件: {json_file.stem}")
+                print(f"⚠️  未找到图像文件: {image_name}")
                 continue
             
             # 转换数据
             try:
-                records = convert_json_to_llm_format(
-                    json_file,
+                records = convert_result_to_llm_format(
+                    data,
                     image_path,
                     output_format=output_format,
                     use_variants=use_variants
@@ -250,9 +274,10 @@ def batch_convert(
                     f.write(json.dumps(record, ensure_ascii=False) + '\n')
                     total_records += 1
                 
-                print(f"✅ 已转换: {json_file.name} -> {len(records)} 条记录")
+                print(f"✅ 已转换: {image_name} -> {len(records)} 条记录")
             except Exception as e:
-                print(f"❌ 转换失败 {json_file.name}: {e}")
+                print(f"❌ 转换失败 {image_name}: {e}")
+    result_sink.close()
     
     print(f"\n✅ 转换完成！共生成 {total_records} 条训练数据")
     print(f"📁 输出文件: {output_file}")
@@ -263,7 +288,9 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='将发票识别数据转换为大模型训练格式')
-    parser.add_argument('--json_dir', type=str, default='output', help='JSON文件目录')
+    parser.add_argument('--json_dir', type=str, default='output', help='识别结果目录')
+    parser.add_argument('--sink', type=str, default=os.getenv('RESULT_SINK', 'files'), choices=['files', 'shards'],
+                       help='识别结果的保存方式: files（每张发票一个 JSON 文件）, shards（JSONL 分片，默认读取 RESULT_SINK 环境变量）')
     parser.add_argument('--image_dir', type=str, default='uploads', help='图像文件目录')
     parser.add_argument('--output', type=str, default='llm_training_data.jsonl', help='输出文件路径')
     parser.add_argument('--format', type=str, default='llava', choices=['llava', 'qwen-vl', 'general'], 
@@ -277,7 +304,7 @@ def main():
     output_file = Path(args.output)
     
     if not json_dir.exists():
-        print(f"❌ JSON目录不存在: {json_dir}")
+        print(f"❌ 识别结果目录不存在: {json_dir}")
         return
     
     if not image_dir.exists():
@@ -289,7 +316,8 @@ def main():
         image_dir=image_dir,
         output_file=output_file,
         output_format=args.format,
-        use_variants=not args.no_variants
+        use_variants=not args.no_variants,
+        sink=args.sink
     )
 
 
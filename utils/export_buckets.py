@@ -0,0 +1,93 @@
+"""
+按宽高比桶导出检测模型 - 为自适应检测尺寸（DETECT_ADAPTIVE）的每个桶导出固定尺寸的模型
+
+ONNX、TensorRT 等导出格式的输入尺寸在导出时固定，每个桶需要单独导出一个模型，
+文件名为 <模型名>_<高>x<宽>.<扩展名>。将 DETECT_BUCKET_MODEL_DIR 设为输出目录后，
+识别时按图像宽高比选择对应的模型。
+
+用法:
+    python utils/export_buckets.py --model best.pt --format onnx --output models/buckets
+    python utils/export_buckets.py --format engine --half           # TensorRT，FP16
+    python utils/export_buckets.py --list                           # 只列出各桶的尺寸
+"""
+import shutil
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入模块
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import Config
+from services.detect_shapes import bucket_shapes, parse_aspect_ratios
+
+
+def export_buckets(model_path, output_dir, export_format='onnx', shapes=None, half=False):
+    """
+    为每个桶导出一个固定尺寸的模型
+
+    Args:
+        model_path: .pt 模型路径
+        output_dir: 输出目录
+        export_format: 导出格式（onnx、engine、openvino 等，同 YOLO.export）
+        shapes: [(高, 宽)]，默认按配置的宽高比计算
+        half: 是否导出 FP16
+
+    Returns:
+        list: 导出的模型路径
+    """
+    from ultralytics import YOLO
+
+    if shapes is None:
+        shapes = bucket_shapes(Config.DETECT_IMGSZ, parse_aspect_ratios(Config.DETECT_ASPECT_RATIOS))
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = Path(model_path).stem
+
+    exported = []
+    for height, width in shapes:
+        print(f"🔄 导出 {height}x{width} ...")
+        model = YOLO(model_path)
+        path = Path(model.export(format=export_format, imgsz=(height, width), half=half, dynamic=False))
+        if path.is_dir():
+            # openvino 等格式导出为目录：best_openvino_model -> best_480x832_openvino_model
+            target = output_dir / f"{stem}_{height}x{width}{path.name[len(stem):]}"
+        else:
+            target = output_dir / f"{stem}_{height}x{width}{path.suffix}"
+        if target.is_dir():
+            shutil.rmtree(target)
+        elif target.exists():
+            target.unlink()
+        shutil.move(str(path), str(target))
+        exported.append(target)
+        print(f"✅ 已导出: {target}")
+    return exported
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='按宽高比桶导出固定尺寸的检测模型')
+    parser.add_argument('--model', type=str, default=Config.MODEL_PATH, help='.pt 模型路径')
+    parser.add_argument('--format', type=str, default='onnx', help='导出格式（onnx、engine、openvino 等）')
+    parser.add_argument('--output', type=str, default=Config.DETECT_BUCKET_MODEL_DIR or 'models/buckets',
+                        help='输出目录（识别时设置 DETECT_BUCKET_MODEL_DIR 为此目录）')
+    parser.add_argument('--imgsz', type=int, default=Config.DETECT_IMGSZ, help='目标面积为 imgsz x imgsz')
+    parser.add_argument('--ratios', type=str, default=Config.DETECT_ASPECT_RATIOS, help='宽高比桶，逗号分隔')
+    parser.add_argument('--half', action='store_true', help='导出 FP16 模型')
+    parser.add_argument('--list', action='store_true', help='只列出各桶的尺寸，不导出')
+    args = parser.parse_args()
+
+    shapes = bucket_shapes(args.imgsz, parse_aspect_ratios(args.ratios))
+    if args.list:
+        for height, width in shapes:
+            print(f"{height}x{width}  宽高比 {width / height:.2f}  面积 {height * width / (args.imgsz * args.imgsz):.0%}")
+        return
+
+    exported = export_buckets(args.model, args.output, args.format, shapes=shapes, half=args.half)
+    print(f"\n✅ 导出完成！共 {len(exported)} 个模型，设置 DETECT_ADAPTIVE=1 DETECT_BUCKET_MODEL_DIR={args.output} 后生效")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+导出发票数据 - 以服务端游标流式导出为 CSV / JSONL / Parquet，内存占用与导出行数无关
+
+用法:
+    python utils/export_invoices.py --output invoices_202401.csv.gz --date-from 2024-01-01 --date-to 2024-01-31
+    python utils/export_invoices.py --format parquet --output invoices.parquet --fields id,invoice_number,total_amount
+"""
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入模块
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from db import SessionLocal
+from services.exporter import (
+    EXPORT_FORMATS, check_export_format, parse_fields, build_export_query, iter_rows, iter_export, gzip_chunks
+)
+
+
+class _CountingRows:
+    """统计已导出的行数"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            if self.count % 100000 == 0:
+                print(f"🔄 已导出 {self.count} 条记录")
+            yield row
+
+
+def export_invoices(output, export_format=None, fields=None, date_from=None, date_to=None,
+                    seller_tax_id=None, batch_size=1000):
+    """
+    导出发票到文件
+
+    Args:
+        output: 输出文件路径，以 .gz 结尾时使用 gzip 压缩（Parquet 除外）
+        export_format: 导出格式，为 None 时根据文件扩展名判断
+        fields: 导出字段
+        date_from: 开票日期起（date）
+        date_to: 开票日期止（date）
+        seller_tax_id: 销售方纳税人识别号
+        batch_size: 游标每批读取的行数
+
+    Returns:
+        int: 导出的行数
+    """
+    from utils.utils import normalize_key
+
+    output = Path(output)
+    suffixes = [s.lstrip('.') for s in output.suffixes]
+    compress = bool(suffixes) and suffixes[-1] == 'gz'
+    if export_format is None:
+        names = suffixes[:-1] if compress else suffixes
+        export_format = names[-1] if names else 'csv'
+    check_export_format(export_format)
+    fields = parse_fields(fields)
+
+    db = SessionLocal()
+    try:
+        query = build_export_query(db, fields, date_from, date_to, normalize_key(seller_tax_id, 32))
+        rows = _CountingRows(iter_rows(query, batch_size))
+        chunks = iter_export(rows, fields, export_format)
+        if compress and export_format != 'parquet':
+            chunks = gzip_chunks(chunks)
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return rows.count
+    finally:
+        db.close()
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='导出发票数据')
+    parser.add_argument('--output', type=str, required=True, help='输出文件路径（.csv / .jsonl / .parquet，可加 .gz）')
+    parser.add_argument('--format', type=str, default=None, choices=list(EXPORT_FORMATS), help='导出格式，默认根据扩展名判断')
+    parser.add_argument('--fields', type=str, default=None, help='逗号分隔的导出字段，默认导出所有识别字段')
+    parser.add_argument('--date-from', type=date.fromisoformat, default=None, help='开票日期起（YYYY-MM-DD）')
+    parser.add_argument('--date-to', type=date.fromisoformat, default=None, help='开票日期止（YYYY-MM-DD）')
+    parser.add_argument('--seller-tax-id', type=str, default=None, help='销售方纳税人识别号')
+    parser.add_argument('--batch-size', type=int, default=1000, help='游标每批读取的行数')
+    args = parser.parse_args()
+
+    start = time.time()
+    try:
+        count = export_invoices(
+            args.output,
+            export_format=args.format,
+            fields=args.fields,
+            date_from=args.date_from,
+            date_to=args.date_to,
+            seller_tax_id=args.seller_tax_id,
+            batch_size=args.batch_size
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    print(f"✅ 导出完成！共 {count} 条记录，用时 {time.time() - start:.1f} 秒")
+    print(f"📁 输出文件: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
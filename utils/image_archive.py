@@ -0,0 +1,96 @@
+"""
+原图存储维护 - 压缩原图、导入旧版本保存在 uploads/ 中的原图
+
+用法:
+    python utils/image_archive.py compact                    # 把 PNG/BMP/TIFF 原图无损转换为 WebP
+    python utils/image_archive.py compact --jpeg-quality 92  # 同时把 JPEG 转换为高质量 WebP
+    python utils/image_archive.py compact --dry-run          # 只统计可节省的空间
+    python utils/image_archive.py import uploads             # 把目录中的原图移入存储，并为同名发票记录原图引用
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径，以便导入模块
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import Config
+from db import SessionLocal
+from model import Invoice
+from services.image_store import get_image_store
+
+
+def import_directory(directory, allowed_extensions, batch_size=500):
+    """
+    把目录（不含子目录）中的原图移入原图存储，并为 image_name 相同的发票记录原图引用
+
+    Args:
+        directory: 旧版本的上传目录
+        allowed_extensions: 导入的扩展名（不含点）
+        batch_size: 每批提交的文件数
+
+    Returns:
+        tuple: (导入的文件数, 关联的发票数)
+    """
+    image_store = get_image_store()
+    files = [
+        path for path in sorted(Path(directory).iterdir())
+        if path.is_file() and path.suffix.lower().lstrip('.') in allowed_extensions
+    ]
+
+    imported = 0
+    linked = 0
+    for start in range(0, len(files), batch_size):
+        refs = {}
+        for path in files[start:start + batch_size]:
+            _, sha256 = image_store.put_file(path)
+            refs[path.stem] = sha256
+            imported += 1
+
+        db = SessionLocal()
+        try:
+            for invoice in db.query(Invoice).filter(Invoice.image_name.in_(list(refs))):
+                invoice.image_sha256 = refs[invoice.image_name]
+                linked += 1
+            db.commit()
+        finally:
+            db.close()
+        print(f"🔄 已导入 {imported}/{len(files)} 个文件")
+    return imported, linked
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='原图存储维护')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact_parser = subparsers.add_parser('compact', help='压缩原图')
+    compact_parser.add_argument('--min-age', type=int, default=Config.IMAGE_COMPACT_MIN_AGE,
+                                help='只压缩保存超过此时间（秒）的原图')
+    compact_parser.add_argument('--jpeg-quality', type=int, default=Config.IMAGE_COMPACT_JPEG_QUALITY,
+                                help='JPEG 转换为 WebP 的质量，0 表示不转换 JPEG')
+    compact_parser.add_argument('--dry-run', action='store_true', help='只统计可节省的空间，不修改文件')
+
+    import_parser = subparsers.add_parser('import', help='把目录中的原图移入存储')
+    import_parser.add_argument('directory', nargs='?', default=Config.UPLOAD_FOLDER, help='旧版本的上传目录')
+    import_parser.add_argument('--batch-size', type=int, default=500, help='每批提交的文件数')
+
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        stats = get_image_store().compact(min_age=args.min_age, jpeg_quality=args.jpeg_quality,
+                                          dry_run=args.dry_run)
+        if stats is None:
+            print("⚠️ 其他进程正在压缩原图存储")
+            return
+        action = '可压缩' if args.dry_run else '已压缩'
+        print(f"✅ {action} {stats['compacted']} 张原图，节省 {stats['saved_bytes'] / 1024 / 1024:.1f} MB")
+    elif args.command == 'import':
+        imported, linked = import_directory(args.directory, Config.ALLOWED_EXTENSIONS, batch_size=args.batch_size)
+        print(f"✅ 导入完成！共导入 {imported} 个文件，关联 {linked} 条发票记录")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,11 @@
 import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
 from db import SessionLocal
-from model import Invoice
+from model import Invoice, InvoiceItem, InvoiceOcr, InvoiceTombstone
+from services.reports import apply_invoice_report
+from services.invoice_items import replace_invoice_items
+from services.cache import invalidate_invoice
 
 
 # 类别名称到中文名称的映射
@@ -152,7 +157,8 @@ def extract_values(text_list, class_name):
                         # 如果转换失败，保持为字符串
                         result.append(num_str)
         
-        if class_name == ["total_amount", "amount", "tax_amount"]:
+        # 价税合计中同时有大写和小写金额，取最后一个数字（小写金额）；金额、税额按明细行保留列表
+        if class_name == "total_amount":
             return result[-1] if result else None
         else:
             return result if result else None
@@ -175,13 +181,35 @@ def extract_values(text_list, class_name):
     return None
 
 
-def extract_text_from_bbox(ocr, image, bbox, class_name):
+def ocr_raw_lines(result, offset_x=0, offset_y=0):
+    """
+    从 PaddleOCR 结果中取出原始文本行（保存后可用于重新提取）
+
+    Args:
+        result: PaddleOCR 单张图像的识别结果
+        offset_x: 裁剪区域在原图中的 x 偏移
+        offset_y: 裁剪区域在原图中的 y 偏移
+
+    Returns:
+        dict: texts（文本行）、scores（置信度）、boxes（文本行在原图中的 [x1, y1, x2, y2]）
+    """
+    texts = [str(text) for text in result["rec_texts"]]
+    scores = [round(float(score), 4) for score in result.get("rec_scores", [])]
+    boxes = []
+    for box in result.get("rec_boxes", []):
+        x1, y1, x2, y2 = (int(v) for v in list(box)[:4])
+        boxes.append([x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y])
+    return {"texts": texts, "scores": scores, "boxes": boxes}
+
+
+def extract_text_from_bbox(ocr, image, bbox, class_name, raw=None):
     """
     从边界框中提取文字（使用PaddleOCR）
 
     Args:
         image: 原始图像
         bbox: 边界框坐标 [x1, y1, x2, y2]
+        raw: 传入字典时写入原始识别结果（见 ocr_raw_lines）
 
     Returns:
         str: 识别出的文字
@@ -207,6 +235,8 @@ def extract_text_from_bbox(ocr, image, bbox, class_name):
 
         # result.save_to_img("output")
         # result.save_to_json("output")
+        if raw is not None:
+            raw.update(ocr_raw_lines(result, x1, y1))
         extracted_text = extract_values(result["rec_texts"], class_name)
         # print(extracted_text)
         return extracted_text
@@ -215,6 +245,60 @@ def extract_text_from_bbox(ocr, image, bbox, class_name):
         return None
 
 
+def ocr_field_record(class_name, confidence, bbox, raw):
+    """
+    组装单个字段的原始识别记录（保存到 invoice_ocr 表）
+
+    Args:
+        class_name: 字段名称
+        confidence: YOLO 置信度，二维码补充的字段为 None
+        bbox: YOLO 检测框 [x1, y1, x2, y2]，二维码补充的字段为 None
+        raw: 原始识别结果（texts、scores、boxes，二维码取值为 qr）
+
+    Returns:
+        dict: 原始识别记录
+    """
+    record = {"class_name": class_name}
+    if confidence is not None:
+        record["confidence"] = round(float(confidence), 4)
+    if bbox is not None:
+        record["bbox"] = [round(float(v), 1) for v in bbox]
+    record.update(raw)
+    return record
+
+
+def reextract_detections(fields):
+    """
+    用当前的解析规则从原始识别记录重新提取字段值
+
+    与识别时的规则一致：有二维码取值的字段以二维码为准，其余字段对保存的文本行调用 extract_values。
+
+    Args:
+        fields: 原始识别记录列表（见 ocr_field_record）
+
+    Returns:
+        list: 检测结果列表（class_name、confidence、extracted_text），与识别结果的 detections 结构相同
+    """
+    detections = []
+    for record in fields:
+        class_name = record["class_name"]
+        if "qr" in record:
+            extracted_text = record["qr"]
+        elif record.get("texts"):
+            extracted_text = extract_values(record["texts"], class_name)
+        else:
+            extracted_text = None
+        
+        if extracted_text is None or (isinstance(extracted_text, list) and len(extracted_text) == 0):
+            extracted_text = None
+        detections.append({
+            "class_name": class_name,
+            "confidence": record.get("confidence", 1.0),
+            "extracted_text": extracted_text,
+        })
+    return detections
+
+
 def normalize_field_value(class_name, value):
     """
     规范化字段值，确保数据类型正确，符合MySQL JSON字段存储要求
@@ -312,60 +396,261 @@ def normalize_field_value(class_name, value):
     return value
 
 
-def save_to_database(detection_info):
+def normalize_key(value, max_length):
     """
-    将检测结果保存到数据库
-    
-    新的表结构：每个发票一行记录，包含所有字段的值
+    将字段值规范化为查询用的键：去除空白、转为大写，超长或为空时返回 None
     
     Args:
-        detection_info: 包含检测结果的字典
+        value: JSON 字段中保存的值（字符串或列表）
+        max_length: 最大长度
     """
-    db = SessionLocal()
+    if value is None:
+        return None
+    if isinstance(value, list):
+        value = "".join(str(v) for v in value if v)
+    key = re.sub(r'\s+', '', str(value)).upper()
+    if not key or len(key) > max_length:
+        return None
+    return key
+
+
+def parse_invoice_date(value):
+    """
+    解析开票日期（"YYYY-MM-DD" 或 "YYYY年MM月DD日"）
+    
+    Returns:
+        date: 日期，无法解析时返回 None
+    """
+    if not isinstance(value, str):
+        return None
+    match = re.search(r'(\d{4})\D{1,2}(\d{1,2})\D{1,2}(\d{1,2})', value)
+    if not match:
+        return None
     try:
-        # 检查是否已存在相同 image_name 的记录
-        existing_invoice = db.query(Invoice).filter(
-            Invoice.image_name == detection_info['image_name']
-        ).first()
-        
-        if existing_invoice:
-            # 如果已存在，更新发票信息
-            existing_invoice.detection_count = detection_info['检测项数']
-            invoice = existing_invoice
-            print(f"更新数据库记录: {detection_info['image_name']}")
-        else:
-            # 创建新的发票记录
-            invoice = Invoice(
-                image_name=detection_info['image_name'],
-                detection_count=detection_info['检测项数']
-            )
-            db.add(invoice)
-            db.flush()  # 获取 invoice.id
-            print(f"创建新数据库记录: {detection_info['image_name']}")
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    except ValueError:
+        return None
+
+
+def parse_amount(value):
+    """
+    解析价税合计金额
+    
+    价税合计中同时有大写和小写金额，取最后一个数字（小写金额）。
+    
+    Returns:
+        Decimal: 金额，无法解析时返回 None
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        value = str(value)
+    if isinstance(value, list):
+        value = " ".join(str(v) for v in value if v is not None)
+    numbers = re.findall(r'\d+(?:\.\d+)?', str(value).replace(',', ''))
+    if not numbers:
+        return None
+    try:
+        amount = Decimal(numbers[-1]).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return None
+    # 超出 Numeric(14, 2) 范围的视为识别错误
+    return amount if amount < Decimal('1e12') else None
+
+
+def fill_search_columns(invoice):
+    """
+    根据 JSON 字段填充发票的类型化查询字段
+    
+    Args:
+        invoice: Invoice 实例
+    """
+    invoice.invoice_number_key = normalize_key(invoice.invoice_number, 32)
+    invoice.invoice_code_key = normalize_key(invoice.invoice_code, 16)
+    invoice.invoice_date_value = parse_invoice_date(invoice.invoice_date)
+    invoice.seller_tax_id_key = normalize_key(invoice.seller_tax_id, 32)
+    invoice.buyer_tax_id_key = normalize_key(invoice.buyer_tax_id, 32)
+    invoice.total_amount_value = parse_amount(invoice.total_amount)
+    invoice.search_text = build_search_text(invoice)
+
+
+def build_search_text(invoice):
+    """
+    拼接全文检索文本：销售方名称、购买方名称和项目名称，每项一行
+    
+    Args:
+        invoice: Invoice 实例
+    
+    Returns:
+        str: 检索文本，没有可检索的内容时返回 None
+    """
+    parts = []
+    for value in (invoice.seller_name, invoice.buyer_name, invoice.item_name):
+        if isinstance(value, list):
+            parts.extend(str(v).strip() for v in value if v and str(v).strip())
+        elif value:
+            parts.append(str(value).strip())
+    return "\n".join(parts) or None
+
+
+def save_invoice_record(db, detection_info, ocr_fields=None, ocr_source='ocr'):
+    """
+    将一条检测结果写入会话（不提交事务）
+    
+    Returns:
+        Invoice: 发票记录（已分配 id）
+    """
+    # 检查是否已存在相同 image_name 的记录
+    existing_invoice = db.query(Invoice).filter(
+        Invoice.image_name == detection_info['image_name']
+    ).first()
+    
+    if existing_invoice:
+        # 如果已存在，先按旧值冲销汇总表，再更新发票信息
+        if existing_invoice.report_applied:
+            apply_invoice_report(db, existing_invoice, -1)
+        existing_invoice.detection_count = detection_info['检测项数']
+        invoice = existing_invoice
+        print(f"更新数据库记录: {detection_info['image_name']}")
+    else:
+        # 创建新的发票记录
+        invoice = Invoice(
+            image_name=detection_info['image_name'],
+            detection_count=detection_info['检测项数']
+        )
+        db.add(invoice)
+        db.flush()  # 获取 invoice.id
+        print(f"创建新数据库记录: {detection_info['image_name']}")
+    
+    # 遍历所有检测项，将数据填充到对应的字段列
+    for detection_data in detection_info['detections']:
+        class_name = detection_data['class_name']
+        extracted_text = detection_data['extracted_text']
         
-        # 遍历所有检测项，将数据填充到对应的字段列
-        for detection_data in detection_info['detections']:
-            class_name = detection_data['class_name']
-            extracted_text = detection_data['extracted_text']
-            
-            # 规范化字段值，确保数据类型正确
-            normalized_value = normalize_field_value(class_name, extracted_text)
-            
-            # 根据class_name将规范化后的值填充到对应的列
-            if hasattr(invoice, class_name):
-                setattr(invoice, class_name, normalized_value)
-            else:
-                # 如果字段不存在，打印警告（不应该发生）
-                print(f"⚠️  警告: Invoice表中不存在字段 '{class_name}'")
+        # 规范化字段值，确保数据类型正确
+        normalized_value = normalize_field_value(class_name, extracted_text)
         
-        # 提交事务
+        # 根据class_name将规范化后的值填充到对应的列
+        if hasattr(invoice, class_name):
+            setattr(invoice, class_name, normalized_value)
+        else:
+            # 如果字段不存在，打印警告（不应该发生）
+            print(f"⚠️  警告: Invoice表中不存在字段 '{class_name}'")
+    
+    # 原图引用（不在原图存储中的文件不清除已有的引用）
+    if detection_info.get('image_sha256'):
+        invoice.image_sha256 = detection_info['image_sha256']
+    
+    # 同步类型化查询字段和明细行
+    fill_search_columns(invoice)
+    replace_invoice_items(db, invoice)
+    
+    # 保存原始识别结果
+    ocr = db.get(InvoiceOcr, invoice.id)
+    if ocr_fields is None:
+        if ocr is not None:
+            db.delete(ocr)
+    elif ocr is None:
+        db.add(InvoiceOcr(invoice_id=invoice.id, source=ocr_source, fields=ocr_fields))
+    else:
+        ocr.source = ocr_source
+        ocr.fields = ocr_fields
+    
+    # 在同一事务中计入汇总表
+    apply_invoice_report(db, invoice, 1)
+    db.flush()
+    return invoice
+
+
+def upload_image_name(name, image_sha256):
+    """
+    上传原图的 image_name：不与内容不同的已有发票同名
+
+    不同客户端上传的同名文件（如都叫"发票.jpg"）内容不同时，后一个会覆盖前一个的发票记录。
+    同名记录的原图哈希不同（或不在原图存储中）时加上哈希后缀：发票_1a2b3c4d；
+    同一文件重复上传得到相同的名称，仍然更新原记录。
+    
+    Args:
+        name: 客户端文件名（不含扩展名）
+        image_sha256: 原图内容哈希
+    
+    Returns:
+        str: image_name
+    """
+    db = SessionLocal()
+    try:
+        existing = db.query(Invoice.image_sha256).filter(Invoice.image_name == name).first()
+    finally:
+        db.close()
+    if existing is None or existing.image_sha256 == image_sha256:
+        return name
+    unique_name = f"{name}_{image_sha256[:8]}"
+    print(f"⚠️ 已有内容不同的同名发票: {name}，本次上传保存为 {unique_name}")
+    return unique_name
+
+
+def delete_invoice_record(db, invoice):
+    """
+    删除发票及其明细行和原始识别结果，冲销汇总表，并写入删除记录供变更订阅通知下游（不提交事务）
+    
+    Args:
+        db: 数据库会话
+        invoice: Invoice 实例
+    """
+    if invoice.report_applied:
+        apply_invoice_report(db, invoice, -1)
+    db.add(InvoiceTombstone(invoice_id=invoice.id, image_name=invoice.image_name))
+    db.query(InvoiceItem).filter(InvoiceItem.invoice_id == invoice.id).delete(synchronize_session=False)
+    db.query(InvoiceOcr).filter(InvoiceOcr.invoice_id == invoice.id).delete(synchronize_session=False)
+    db.delete(invoice)
+
+
+def save_many_to_database(records):
+    """
+    在一个事务中保存多条检测结果（写入队列的后台写入按批调用）
+    
+    Args:
+        records: (detection_info, ocr_fields, ocr_source) 列表，参数含义同 save_to_database
+    
+    Returns:
+        list: 发票 ID 列表
+    """
+    db = SessionLocal()
+    try:
+        invoice_ids = [save_invoice_record(db, *record).id for record in records]
         db.commit()
-        print(f"✅ 数据已成功保存到数据库 (ID: {invoice.id})")
-        
-    except Exception as e:
+    except Exception:
         # 发生错误时回滚
         db.rollback()
-        print(f"❌ 保存到数据库失败: {e}")
         raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+    
+    # 使查询接口的缓存失效
+    for invoice_id in invoice_ids:
+        invalidate_invoice(invoice_id)
+    return invoice_ids
+
+
+def save_to_database(detection_info, ocr_fields=None, ocr_source='ocr'):
+    """
+    将检测结果保存到数据库
+    
+    新的表结构：每个发票一行记录，包含所有字段的值
+    
+    Args:
+        detection_info: 包含检测结果的字典
+        ocr_fields: 各字段的原始识别记录（见 ocr_field_record），保存到 invoice_ocr 表；
+                    为 None 时删除该发票已有的原始识别结果（如改为 OFD 识别），避免重新提取时使用过期数据
+        ocr_source: 原始识别结果的文字来源（ocr 或 pdf_text）
+    
+    Returns:
+        int: 发票 ID
+    """
+    try:
+        invoice_id = save_many_to_database([(detection_info, ocr_fields, ocr_source)])[0]
+    except Exception as e:
+        print(f"❌ 保存到数据库失败: {e}")
+        raise
+    print(f"✅ 数据已成功保存到数据库 (ID: {invoice_id})")
+    return invoice_id
@@ -0,0 +1,69 @@
+"""
+识别 worker - 从数据库工作队列领取识别任务
+
+可在多台主机上同时运行任意数量的 worker，任务通过 POST /api/jobs 创建。
+文件路径需在所有 worker 主机上可访问（如共享存储挂载到相同路径）。
+
+用法:
+    python worker.py
+    python worker.py --worker-id node-1 --batch-size 4
+    python worker.py --once    # 队列为空时退出
+"""
+import argparse
+import signal
+
+from config import Config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='发票识别 worker')
+    parser.add_argument('--worker-id', type=str, default=None, help='worker ID，默认为 主机名-进程号')
+    parser.add_argument('--batch-size', type=int, default=1, help='每次领取的任务数')
+    parser.add_argument('--poll-interval', type=float, default=Config.QUEUE_POLL_INTERVAL, help='队列为空时的轮询间隔（秒）')
+    parser.add_argument('--lease', type=int, default=Config.QUEUE_LEASE_SECONDS, help='任务租约时长（秒）')
+    parser.add_argument('--once', action='store_true', help='队列为空时退出')
+    args = parser.parse_args()
+
+    from app import check_and_init_db
+    from services.model_loader import model_loader
+    from services.invoice_service import InvoiceService
+    from services.work_queue import WorkQueue, QueueWorker
+    from services.persist_spool import get_persist_spool, has_spooled_records
+
+    check_and_init_db()
+    
+    # 写入队列中有上次未写入数据库的识别结果时，启动后台写入
+    if Config.PERSIST_MODE == 'async' or has_spooled_records(Config.PERSIST_SPOOL_DIR):
+        get_persist_spool()
+
+    invoice_service = InvoiceService(
+        yolo_model=model_loader.yolo_model,
+        ocr_model=model_loader.ocr_model
+    )
+    work_queue = WorkQueue(
+        lease_seconds=args.lease,
+        max_attempts=Config.QUEUE_MAX_ATTEMPTS,
+        retry_delay=Config.QUEUE_RETRY_DELAY
+    )
+    worker = QueueWorker(
+        work_queue, invoice_service,
+        worker_id=args.worker_id,
+        batch_size=args.batch_size,
+        poll_interval=args.poll_interval
+    )
+
+    # 收到终止信号时处理完当前任务再退出，未开始的任务归还队列
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.run(once=args.once)
+    except KeyboardInterrupt:
+        worker.stop()
+    
+    # 退出前尽量把写入队列中的识别结果写入数据库（未写完的在下次启动时继续）
+    if has_spooled_records(Config.PERSIST_SPOOL_DIR):
+        if not get_persist_spool().flush(timeout=30):
+            print("⚠️ 写入队列中仍有未写入数据库的识别结果，将在下次启动时继续写入")
+
+
+if __name__ == '__main__':
+    main()